@@ -0,0 +1,7 @@
+"""Benchmarks for Myia's compilation pipeline.
+
+Each benchmark module can be run directly, e.g.:
+
+    python -m benchmarks.bench_opt
+
+"""
@@ -0,0 +1,153 @@
+"""Benchmark gradient checkpointing.
+
+The gradient of the cost of a deep stack of TanhLayers is run with and
+without checkpointing each layer, and the peak memory allocated while
+it runs (as reported by tracemalloc) is printed along with its run time.
+Without checkpointing, the backpropagator of each layer keeps all of the
+layer's intermediate arrays until the backward pass. With checkpointing,
+it only keeps the layer's arguments, and computes the rest again.
+
+Only the grad expansion and safe inlining are done on the graph, so
+that the other optimizations (notably CSE) do not merge the recomputation
+with the forward pass, and the result runs in the debug VM. The debug VM
+maps scalar functions over arrays one element at a time, so the default
+sizes are small.
+
+    python -m benchmarks.bench_checkpoint [depth [width [batch]]]
+
+"""
+
+import sys
+import tracemalloc
+from dataclasses import dataclass, astuple
+from time import perf_counter
+
+import numpy
+
+from myia.abstract import from_value
+from myia.composite import grad, checkpoint
+from myia.dtype import Array, Tuple
+from myia.opt import lib as optlib
+from myia.pipeline import standard_debug_pipeline
+from myia.prim.py_implementations import array_map, array_reduce, \
+    distribute, dot, scalar_add, scalar_div, scalar_exp, scalar_mul, \
+    scalar_sub, scalar_to_array, shape
+from myia.utils import Reset
+
+
+grad_pipeline = standard_debug_pipeline \
+    .select('parse', 'resolve', 'infer', 'specialize', 'erase_class', 'opt',
+            'export') \
+    .configure({
+        'opt.phases': Reset(dict(
+            main=[
+                optlib.simplify_always_true,
+                optlib.simplify_always_false,
+                optlib.inline_core,
+                optlib.simplify_partial,
+                optlib.elim_identity,
+                optlib.elim_j_jinv,
+                optlib.elim_jinv_j,
+            ],
+            grad=[optlib.expand_J],
+            renormalize='renormalize',
+            jelim=optlib.JElim.partial(),
+        ))
+    })
+
+
+def tanh(x):
+    # This is written with primitives, because the debug optimizations
+    # cannot differentiate through the array arithmetic metagraphs.
+    shp = shape(x)
+    e = array_map(scalar_exp, array_map(
+        scalar_mul, x, distribute(scalar_to_array(-2.0), shp)
+    ))
+    one = distribute(scalar_to_array(1.0), shp)
+    return array_map(scalar_div,
+                     array_map(scalar_sub, one, e),
+                     array_map(scalar_add, one, e))
+
+
+def affine(input, W, b):
+    out = dot(input, W)
+    return array_map(scalar_add, out, distribute(b, shape(out)))
+
+
+@dataclass(frozen=True)
+class TanhLayer:
+    W: Array
+    b: Array
+
+    def apply(self, input):
+        return tanh(affine(input, self.W, self.b))
+
+
+@dataclass(frozen=True)
+class CheckpointedTanhLayer:
+    W: Array
+    b: Array
+
+    @checkpoint
+    def apply(self, input):
+        return tanh(affine(input, self.W, self.b))
+
+
+@dataclass(frozen=True)
+class Model:
+    layers: Tuple
+
+    def apply(self, x):
+        for layer in self.layers:
+            x = layer.apply(x)
+        return x
+
+
+def cost(model, x):
+    return array_reduce(scalar_add, model.apply(x), ())
+
+
+def model_grad(model, x):
+    return grad(cost)(model, x)
+
+
+def make_model(layer_cls, depth, width):
+    """Build a Model with depth layers of the given width."""
+    return Model(layers=tuple(
+        layer_cls(numpy.full((width, width), 1 / width),
+                  numpy.zeros((1, width)))
+        for _ in range(depth)
+    ))
+
+
+def bench_grad(layer_cls, depth, width, batch, repeat=3):
+    """Return the peak memory and minimum time to run the gradient."""
+    model = make_model(layer_cls, depth, width)
+    x = numpy.ones((batch, width))
+    argspec = tuple(from_value(arg, broaden=True) for arg in (model, x))
+    fn = grad_pipeline.run(input=model_grad, argspec=argspec)['output']
+    # The compiled function takes the model with its classes erased
+    model = astuple(model)
+    fn(model, x)
+    times = []
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = perf_counter()
+        fn(model, x)
+        times.append(perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return peak, min(times)
+
+
+def main(depth=8, width=8, batch=16):
+    """Print the peak memory and time with and without checkpointing."""
+    print(f'{depth} layers of width {width}, batch of {batch}')
+    for layer_cls in (TanhLayer, CheckpointedTanhLayer):
+        peak, t = bench_grad(layer_cls, depth, width, batch)
+        print(f'{layer_cls.__name__:>22}: {peak / 2**20:8.2f} MiB, {t:.4f}s')
+
+
+if __name__ == '__main__':
+    main(*[int(s) for s in sys.argv[1:]])
@@ -0,0 +1,117 @@
+"""Benchmark gradient environments.
+
+Two workloads are timed:
+
+* Building an environment with one env_setitem per key, then adding two
+  environments that were built from a common one, with the primitives'
+  Python implementations.
+* Running the gradient of a closure over many free variables, which
+  accumulates the sensitivity of each free variable in an environment.
+  Only the grad expansion is done on the graph, so that the environments
+  are not optimized away, and the result runs in the debug VM.
+
+    python -m benchmarks.bench_env [size ...]
+
+"""
+
+import sys
+from time import perf_counter
+
+from myia.abstract import from_value
+from myia.ir import Graph
+from myia.opt import lib as optlib
+from myia.pipeline import standard_debug_pipeline
+from myia.prim import ops as P
+from myia.prim.py_implementations import env_setitem, env_add, env_getitem
+from myia.utils import newenv, Reset, SymbolicKeyInstance
+
+
+grad_pipeline = standard_debug_pipeline \
+    .select('parse', 'infer', 'specialize', 'erase_class', 'opt', 'export') \
+    .configure({
+        'opt.phases': Reset(dict(
+            grad=[optlib.expand_J],
+            renormalize='renormalize',
+            jelim=optlib.JElim.partial(),
+        ))
+    })
+
+
+def bench_env_ops(size):
+    """Return the time to build and add environments with size keys."""
+    keys = [SymbolicKeyInstance(i, None) for i in range(2 * size)]
+    start = perf_counter()
+    base = newenv
+    for k in keys[:size]:
+        base = env_setitem(base, k, 1.0)
+    e1 = e2 = base
+    for k in keys[size:]:
+        e1 = env_setitem(e1, k, 2.0)
+        e2 = env_setitem(e2, k, 3.0)
+    e = env_add(e1, e2)
+    assert env_getitem(e, keys[-1], 0.0) == 5.0
+    return perf_counter() - start
+
+
+def make_closure_grad(size):
+    """Build the gradient of a closure over size free variables.
+
+    The differentiated function is equivalent to:
+
+        def f(x):
+            a_0 = x * 1.0
+            ...
+            def g(y):
+                return a_0 * y + a_1 * y + ...
+            return g(x) + g(x * 2.0)
+    """
+    f = Graph()
+    f.debug.name = 'f'
+    x = f.add_parameter()
+    fvs = [f.apply(P.scalar_mul, x, float(i + 1)) for i in range(size)]
+    g = Graph()
+    g.debug.name = 'g'
+    y = g.add_parameter()
+    out = None
+    for a in fvs:
+        term = g.apply(P.scalar_mul, a, y)
+        out = term if out is None else g.apply(P.scalar_add, out, term)
+    g.output = out
+    f.output = f.apply(P.scalar_add,
+                       f.apply(g, x),
+                       f.apply(g, f.apply(P.scalar_mul, x, 2.0)))
+
+    df = Graph()
+    df.debug.name = 'grad_closure'
+    z = df.add_parameter()
+    jf = df.apply(P.J, f)
+    res = df.apply(jf, df.apply(P.J, z))
+    bprop = df.apply(P.tuple_getitem, res, 1)
+    grads = df.apply(bprop, 1.0)
+    df.output = df.apply(P.tuple_getitem, grads, 1)
+    return df
+
+
+def bench_closure_grad(size, repeat=5):
+    """Return the minimum time to run the gradient of a closure."""
+    argspec = (from_value(1.0, broaden=True),)
+    fn = grad_pipeline.run(input=make_closure_grad(size),
+                           argspec=argspec)['output']
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        fn(1.0)
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def main(sizes):
+    """Print timings for each environment size."""
+    for size in sizes:
+        t = bench_env_ops(size)
+        tg = bench_closure_grad(size)
+        print(f'{size:6d} keys: env ops {t:.4f}s, closure grad {tg:.4f}s')
+
+
+if __name__ == '__main__':
+    main([int(s) for s in sys.argv[1:]] or [10, 100, 300])
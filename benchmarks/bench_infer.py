@@ -0,0 +1,180 @@
+"""Benchmark type inference.
+
+Two workloads are timed:
+
+* A corpus of small functions in the style of tests/test_infer.py:
+  recursion, closures, higher-order functions, tuples and branches.
+* The gradient of the cost of a small multilayer perceptron, as in
+  tests/test_model.py, run through the standard pipeline up to
+  specialization.
+
+Only the time spent in step_infer is reported.
+
+    python -m benchmarks.bench_infer [repeat]
+
+"""
+
+import sys
+from dataclasses import dataclass
+
+import numpy
+
+from myia.abstract import from_value
+from myia.composite import grad
+from myia.dtype import Array, Tuple
+from myia.pipeline import standard_debug_pipeline
+from myia.prim.py_implementations import array_reduce, scalar_add
+from myia.utils import Profile
+
+
+infer_pipeline = standard_debug_pipeline.select('parse', 'infer')
+
+
+grad_pipeline = standard_debug_pipeline \
+    .select('parse', 'infer', 'specialize')
+
+
+##########
+# Corpus #
+##########
+
+
+def fib(n):
+    if n < 2:
+        return n
+    else:
+        return fib(n - 1) + fib(n - 2)
+
+
+def ackermann(m, n):
+    if m == 0:
+        return n + 1
+    elif n == 0:
+        return ackermann(m - 1, 1)
+    else:
+        return ackermann(m - 1, ackermann(m, n - 1))
+
+
+def closures(x, y):
+    def f(z):
+        def g(w):
+            return w * x + z
+        return g(y) + g(z)
+    return f(x) * f(y)
+
+
+def hof(x, y):
+    def apply(f, a):
+        return f(a)
+
+    def sq(a):
+        return a * a
+
+    def inc(a):
+        return a + 1
+    return apply(sq, x) + apply(inc, y)
+
+
+def loop(n, x):
+    total = 0.0
+    while n > 0:
+        total = total + x * n
+        n = n - 1
+    return total
+
+
+def tuples(x, y):
+    tup = (x, y, x * y)
+    a, b, c = tup
+    return (c, b + a, (a, c))
+
+
+corpus = [
+    (fib, (1,)),
+    (ackermann, (1, 1)),
+    (closures, (1.0, 2.0)),
+    (hof, (1, 2)),
+    (loop, (1.0, 1.0)),
+    (tuples, (1.0, 2.0)),
+]
+
+
+#########
+# Model #
+#########
+
+
+def tanh(x):
+    e = numpy.exp(-2 * x)
+    return (1 - e) / (1 + e)
+
+
+@dataclass(frozen=True)
+class TanhLayer:
+    W: Array
+    b: Array
+
+    def apply(self, input):
+        return tanh(input @ self.W + self.b)
+
+
+@dataclass(frozen=True)
+class Model:
+    layers: Tuple
+
+    def apply(self, x):
+        for layer in self.layers:
+            x = layer.apply(x)
+        return x
+
+
+def make_model(*sizes):
+    """Build a Model with a TanhLayer between each pair of sizes."""
+    return Model(layers=tuple(
+        TanhLayer(numpy.ones((i, o)), numpy.zeros((1, o)))
+        for i, o in zip(sizes[:-1], sizes[1:])
+    ))
+
+
+def cost(model, x, y):
+    yy = model.apply(x)
+    diff = (yy - y)
+    return array_reduce(scalar_add, diff ** 2, ())
+
+
+def model_grad(model, x, y):
+    return grad(cost)(model, x, y)
+
+
+##############
+# Benchmarks #
+##############
+
+
+def bench_infer(pipeline, fn, args, repeat):
+    """Return the minimum time spent in step_infer over `repeat` runs."""
+    argspec = tuple(from_value(arg, broaden=True) for arg in args)
+    times = []
+    for _ in range(repeat):
+        prof = Profile()
+        pipeline.run(input=fn, argspec=argspec, profile=prof)
+        times.append(prof.d['infer'])
+    return min(times)
+
+
+def main(repeat):
+    """Print step_infer timings for the corpus and the model gradient."""
+    total = 0
+    for fn, args in corpus:
+        t = bench_infer(infer_pipeline, fn, args, repeat)
+        total += t
+        print(f'{fn.__name__:>12}: {t:.4f}s')
+    print(f'{"corpus":>12}: {total:.4f}s')
+    model = make_model(6, 9, 10, 8)
+    args = (model, numpy.ones((3, 6)), numpy.ones((3, 8)))
+    t = bench_infer(grad_pipeline, model_grad, args, repeat)
+    print(f'{"model grad":>12}: {t:.4f}s')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,139 @@
+"""Benchmark the optimizer on large clusters of graphs.
+
+The clusters are built directly with the IR so that their size can be scaled
+freely. Each link of a chain calls a closure over its parameter and the next
+link, which gives the optimizer plenty of inlining, cloning and graph dropping
+to do. The same chains are also differentiated, which produces the large
+gradient graphs that dominate compile time.
+
+The rule matching benchmark compares `NodeMap.match` with unifying every
+pattern that `NodeMap.get` returns, over all the nodes that step_opt starts
+from.
+
+    python -m benchmarks.bench_opt [size ...]
+
+"""
+
+import sys
+from time import perf_counter
+
+from myia.abstract import from_value
+from myia.ir import Graph
+from myia.opt import NodeMap, PatternSubstitutionOptimization
+from myia.pipeline import standard_debug_pipeline
+from myia.pipeline.steps import step_opt
+from myia.prim import ops as P
+from myia.utils import Profile
+
+
+opt_pipeline = standard_debug_pipeline \
+    .select('parse', 'infer', 'specialize', 'erase_class', 'opt')
+
+
+pre_opt_pipeline = standard_debug_pipeline \
+    .select('parse', 'infer', 'specialize', 'erase_class')
+
+
+def make_chain(size):
+    """Build a chain of `size` graphs, each with a nested closure.
+
+    Graph i is equivalent to:
+
+        def f_i(x):
+            def g_i(y):
+                return y * x
+            return g_i(x) + f_{i-1}(x)
+    """
+    prev = None
+    for i in range(size):
+        f = Graph()
+        f.debug.name = f'f_{i}'
+        x = f.add_parameter()
+        g = Graph()
+        g.debug.name = f'g_{i}'
+        y = g.add_parameter()
+        g.output = g.apply(P.scalar_mul, y, x)
+        out = f.apply(g, x)
+        if prev is not None:
+            out = f.apply(P.scalar_add, out, f.apply(prev, x))
+        f.output = out
+        prev = f
+    return prev
+
+
+def make_grad_chain(size):
+    """Build a graph that returns the gradient of `make_chain(size)`."""
+    chain = make_chain(size)
+    g = Graph()
+    g.debug.name = 'grad_chain'
+    x = g.add_parameter()
+    jf = g.apply(P.J, chain)
+    res = g.apply(jf, g.apply(P.J, x))
+    bprop = g.apply(P.tuple_getitem, res, 1)
+    grads = g.apply(bprop, 1.0)
+    g.output = g.apply(P.tuple_getitem, grads, 1)
+    return g
+
+
+def bench_step_opt(graph):
+    """Return the time spent in step_opt on the given graph."""
+    argspec = (from_value(1.0, broaden=True),)
+    prof = Profile()
+    opt_pipeline.run(input=graph, argspec=argspec, profile=prof)
+    opt = prof.d['opt']
+    return opt['__total__'] if isinstance(opt, dict) else opt
+
+
+def _unify_all(nmap, node):
+    res = []
+    for opt in nmap.get(node):
+        if isinstance(opt, PatternSubstitutionOptimization):
+            equiv = opt.unif.unify(node, opt.pattern)
+            if equiv is not None:
+                res.append((opt, equiv))
+        else:
+            res.append((opt, None))
+    return res
+
+
+def bench_match(graph, repeat=5):
+    """Return the time to match step_opt's rules on all nodes of a graph.
+
+    Returns:
+        A pair with the time for `NodeMap.get` followed by unification,
+        and the time for `NodeMap.match`.
+    """
+    argspec = (from_value(1.0, broaden=True),)
+    res = pre_opt_pipeline.run(input=graph, argspec=argspec)
+    nodes = list(res['graph'].manager.all_nodes)
+    phases = step_opt.keywords['phases']
+    nmap = NodeMap()
+    for opt in phases['main'] + phases['main2']:
+        nmap.register(getattr(opt, 'interest', None), opt)
+    # Build the nets before timing
+    for node in nodes:
+        nmap.match(node)
+
+    times = []
+    for match in (_unify_all, NodeMap.match):
+        start = perf_counter()
+        for _ in range(repeat):
+            for node in nodes:
+                match(nmap, node)
+        times.append((perf_counter() - start) / repeat)
+    return tuple(times)
+
+
+def main(sizes):
+    """Print step_opt timings for each cluster size."""
+    for size in sizes:
+        t = bench_step_opt(make_chain(size))
+        tg = bench_step_opt(make_grad_chain(size))
+        print(f'{size:6d} graphs: step_opt {t:.3f}s, with grad {tg:.3f}s')
+    for size in sizes:
+        tu, tm = bench_match(make_grad_chain(size))
+        print(f'{size:6d} graphs: get+unify {tu:.4f}s, match {tm:.4f}s')
+
+
+if __name__ == '__main__':
+    main([int(s) for s in sys.argv[1:]] or [10, 25, 50, 100])
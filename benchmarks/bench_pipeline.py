@@ -0,0 +1,194 @@
+"""Benchmark the whole compilation pipeline.
+
+Each function of a corpus is compiled with the standard pipeline, and the
+time spent in each step is reported, along with the time it takes to call
+the compiled function. The corpus holds the functions of bench_infer
+(recursion, loops, closures, higher-order functions, tuples), code that
+uses dataclasses, and the forward pass and the gradient of the multilayer
+perceptron of tests/test_model.py.
+
+Every run compiles from scratch, without the inference memo, and the
+minimum, mean and first times over the runs are kept. The results can be
+saved as JSON, and compared with the results of a previous version:
+
+    python -m benchmarks.bench_pipeline --json new.json --compare old.json
+
+Use --debug to time standard_debug_pipeline, which does not need a
+backend.
+
+"""
+
+import argparse
+import json
+import platform
+import sys
+from dataclasses import dataclass
+from statistics import mean
+from time import perf_counter
+
+import numpy
+
+from myia.abstract import from_value
+from myia.pipeline import standard_pipeline, standard_debug_pipeline
+from myia.utils import Profile
+
+from .bench_infer import fib, ackermann, closures, hof, loop, tuples, \
+    cost, model_grad, make_model
+
+
+@dataclass(frozen=True)
+class Point:
+    x: float
+    y: float
+
+    def __add__(self, other):
+        return Point(self.x + other.x, self.y + other.y)
+
+    def scale(self, a):
+        return Point(self.x * a, self.y * a)
+
+    def norm2(self):
+        return self.x * self.x + self.y * self.y
+
+
+def points(p, q, a):
+    r = p + q.scale(a)
+    s = (r, p.scale(2.0), (q, r + p))
+    return s[0].norm2() + s[2][1].norm2(), s
+
+
+def _model_args():
+    model = make_model(6, 9, 10, 8)
+    return (model, numpy.ones((3, 6)), numpy.ones((3, 8)))
+
+
+corpus = {
+    'fib': (fib, (10,)),
+    'ackermann': (ackermann, (2, 2)),
+    'closures': (closures, (1.0, 2.0)),
+    'hof': (hof, (1, 2)),
+    'loop': (loop, (10.0, 1.5)),
+    'tuples': (tuples, (1.0, 2.0)),
+    'points': (points, (Point(1.0, 2.0), Point(3.0, 4.0), 0.5)),
+    'mlp': (cost, _model_args()),
+    'mlp_grad': (model_grad, _model_args()),
+}
+
+
+def _seconds(entry):
+    # A step that has sub-steps is recorded as a dict
+    return entry['__total__'] if isinstance(entry, dict) else entry
+
+
+def _summary(times):
+    return {'min': min(times), 'mean': mean(times), 'first': times[0]}
+
+
+def bench_function(pipeline, fn, args, repeat, calls):
+    """Compile fn and call it.
+
+    Returns a dict with the summaries of the times of each step and of the
+    whole compilation over `repeat` runs, and of the time of a call over
+    `calls` calls.
+    """
+    argspec = tuple(from_value(arg, broaden=True) for arg in args)
+    pipeline = pipeline.configure({'inferrer.memo': None})
+    steps = {}
+    totals = []
+    for _ in range(repeat):
+        prof = Profile()
+        res = pipeline.run(input=fn, argspec=argspec, profile=prof)
+        for name in pipeline.step_names:
+            if name in prof.d:
+                steps.setdefault(name, []).append(_seconds(prof.d[name]))
+        totals.append(prof.d['__total__'])
+    output = res['output']
+    times = []
+    for _ in range(calls):
+        start = perf_counter()
+        output(*args)
+        times.append(perf_counter() - start)
+    return {
+        'steps': {name: _summary(ts) for name, ts in steps.items()},
+        'total': _summary(totals),
+        'call': _summary(times),
+    }
+
+
+def run(pipeline, names, repeat, calls):
+    """Benchmark the functions of the corpus with the given names.
+
+    A function that fails to compile or to run is recorded with its error.
+    """
+    results = {}
+    for name in names:
+        fn, args = corpus[name]
+        try:
+            results[name] = bench_function(pipeline, fn, args, repeat, calls)
+        except Exception as e:
+            results[name] = {'error': f'{type(e).__name__}: {e}'}
+    return results
+
+
+def report(results, previous=None):
+    """Print the results, compared to the previous ones if given."""
+    def fmt(name, new, old):
+        line = f'    {name:>12}: {new["min"] * 1000:9.3f}ms'
+        if old is not None:
+            line += f'  x{new["min"] / old["min"]:.2f}'
+        return line
+
+    previous = previous or {}
+    for name, res in results.items():
+        print(f'{name}:')
+        if 'error' in res:
+            print(f'    {res["error"]}')
+            continue
+        old = previous.get(name, {})
+        if 'error' in old:
+            old = {}
+        for step, summary in res['steps'].items():
+            print(fmt(step, summary, old.get('steps', {}).get(step, None)))
+        print(fmt('total', res['total'], old.get('total', None)))
+        print(fmt('call', res['call'], old.get('call', None)))
+
+
+def main(argv=None):
+    """Run the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('names', nargs='*', default=list(corpus),
+                        help='Functions of the corpus to benchmark')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of compilations')
+    parser.add_argument('--calls', type=int, default=100,
+                        help='Number of calls to each compiled function')
+    parser.add_argument('--debug', action='store_true',
+                        help='Use standard_debug_pipeline')
+    parser.add_argument('--json', help='Save the results in this file')
+    parser.add_argument('--compare', help='Compare to the results saved'
+                                          ' in this file')
+    opts = parser.parse_args(argv)
+
+    pipeline = standard_debug_pipeline if opts.debug else standard_pipeline
+    results = run(pipeline, opts.names, opts.repeat, opts.calls)
+
+    previous = None
+    if opts.compare:
+        with open(opts.compare) as f:
+            previous = json.load(f)['results']
+    report(results, previous)
+
+    if opts.json:
+        data = {
+            'pipeline': 'debug' if opts.debug else 'standard',
+            'python': platform.python_version(),
+            'repeat': opts.repeat,
+            'calls': opts.calls,
+            'results': results,
+        }
+        with open(opts.json, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
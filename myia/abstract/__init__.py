@@ -85,6 +85,16 @@ from .infer import (  # noqa
 )
 
 
+from .memo import (  # noqa
+    InferenceMemo,
+)
+
+
+from .stats import (  # noqa
+    InferenceStatistics,
+)
+
+
 from .prim import (  # noqa
     abstract_inferrer_constructors,
 )
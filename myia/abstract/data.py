@@ -4,6 +4,7 @@
 from typing import Tuple
 from dataclasses import dataclass
 from contextvars import ContextVar
+from weakref import WeakValueDictionary
 
 from .. import dtype
 from ..debug.label import label
@@ -151,8 +152,31 @@ class DummyFunction(Function):
 #################
 
 
+# Maps (type, key) to the canonical abstract value with that key
+_intern_table = WeakValueDictionary()
+
+
+def _is_concrete(v):
+    if isinstance(v, AbstractBase):
+        return v.is_concrete()
+    elif isinstance(v, tuple):
+        return all(_is_concrete(x) for x in v)
+    else:
+        return not isinstance(v, (Pending, Possibilities))
+
+
 class AbstractBase:
-    """Base class for abstract data."""
+    """Base class for abstract data.
+
+    Abstract values that are concrete, meaning that they contain no
+    Pending and no functions, can be interned with `intern`, which returns
+    a canonical object for each distinct value. Two interned values are
+    equal if and only if they are the same object.
+    """
+
+    _hash = None
+    _concrete = None
+    _interned = False
 
     def key(self):
         """Return a key for hash/equality purposes."""
@@ -163,12 +187,41 @@ class AbstractBase:
     def _make_key(self):
         raise NotImplementedError()
 
+    def is_concrete(self):
+        """Return whether this value contains no Pending or functions."""
+        if self._concrete is None:
+            self._concrete = self._make_concrete()
+        return self._concrete
+
+    def _make_concrete(self):
+        raise NotImplementedError()
+
+    def intern(self):
+        """Return the canonical object equal to this value.
+
+        Values that are not concrete are returned unchanged.
+        """
+        if self._interned or not self.is_concrete():
+            return self
+        key = (type(self), self.key())
+        canon = _intern_table.get(key, None)
+        if canon is None:
+            self._interned = True
+            _intern_table[key] = self
+            return self
+        return canon
+
     def __eq__(self, other):
+        if self is other:
+            return True
         return type(self) is type(other) \
+            and not (self._interned and other._interned) \
             and self.key() == other.key()
 
     def __hash__(self):
-        return hash(self.key())
+        if self._hash is None:
+            self._hash = hash(self.key())
+        return self._hash
 
 
 class AbstractValue(AbstractBase):
@@ -188,6 +241,9 @@ class AbstractValue(AbstractBase):
     def _make_key(self):
         return tuple(sorted(self.values.items()))
 
+    def _make_concrete(self):
+        return all(_is_concrete(v) for v in self.values.values())
+
 
 class AbstractScalar(AbstractValue):
     """Represents a scalar (integer, float, bool, etc.)."""
@@ -267,6 +323,9 @@ class AbstractFunction(AbstractValue):
         fn, = poss
         return fn
 
+    def _make_concrete(self):
+        return False
+
     def __repr__(self):
         return f'Fn({self.values[VALUE]})'
 
@@ -280,8 +339,11 @@ class AbstractTuple(AbstractValue):
         self.elements = tuple(elements)
 
     def _make_key(self):
-        elms = tuple(e._make_key() for e in self.elements)
-        return (super()._make_key(), elms)
+        return (super()._make_key(), self.elements)
+
+    def _make_concrete(self):
+        return super()._make_concrete() \
+            and all(_is_concrete(e) for e in self.elements)
 
     def __repr__(self):
         return f'T({", ".join(map(repr, self.elements))})'
@@ -306,7 +368,10 @@ class AbstractArray(AbstractValue):
         self.element = element
 
     def _make_key(self):
-        return (super()._make_key(), self.element._make_key())
+        return (super()._make_key(), self.element)
+
+    def _make_concrete(self):
+        return super()._make_concrete() and _is_concrete(self.element)
 
     def __repr__(self):
         return f'A({self.element}, SHAPE={self.values[SHAPE]})'
@@ -329,7 +394,10 @@ class AbstractList(AbstractValue):
         self.element = element
 
     def _make_key(self):
-        return (super()._make_key(), self.element._make_key())
+        return (super()._make_key(), self.element)
+
+    def _make_concrete(self):
+        return super()._make_concrete() and _is_concrete(self.element)
 
     def __repr__(self):
         return f'L({self.element})'
@@ -355,9 +423,13 @@ class AbstractClass(AbstractValue):
         self.methods = methods
 
     def _make_key(self):
-        attrs = tuple((k, v._make_key()) for k, v in self.attributes.items())
+        attrs = tuple(self.attributes.items())
         return (super()._make_key(), self.tag, attrs)
 
+    def _make_concrete(self):
+        return super()._make_concrete() \
+            and all(_is_concrete(v) for v in self.attributes.values())
+
     def __repr__(self):
         elems = [f'{k}={v}' for k, v in self.attributes.items()]
         return f'*{self.tag}({", ".join(elems)})'
@@ -372,7 +444,10 @@ class AbstractJTagged(AbstractValue):
         self.element = element
 
     def _make_key(self):
-        return (super()._make_key(), self.element._make_key())
+        return (super()._make_key(), self.element)
+
+    def _make_concrete(self):
+        return super()._make_concrete() and _is_concrete(self.element)
 
     def __repr__(self):
         return f'J({self.element})'
@@ -445,8 +520,9 @@ SHAPE = _ShapeTrack('SHAPE')
 ##########
 
 
-infer_trace = ContextVar('infer_trace')
-infer_trace.set({})
+# The default is used by threads other than the main thread, which do not
+# inherit its context
+infer_trace = ContextVar('infer_trace', default={})
 
 
 class Unspecializable(Exception):
@@ -1,8 +1,9 @@
 """Algorithms for inference."""
 
-import asyncio
 import numpy as np
+from copy import copy
 from functools import reduce
+from weakref import WeakKeyDictionary
 from dataclasses import is_dataclass, replace as dc_replace
 
 from .. import dtype
@@ -23,6 +24,26 @@ from .data import infer_trace, MyiaTypeError, ANYTHING, AbstractScalar, \
     InferenceError, PrimitiveFunction, MetaGraphFunction, Function
 from .utils import broaden as _broaden, sensitivity_transform, amerge, \
     bind
+from .stats import TimedCoroutine, inferrer_name
+
+
+_prototypes = WeakKeyDictionary()
+
+
+def _instantiate(cons):
+    """Return a new inferrer built by cons.
+
+    The inferrer is built once for each constructor, and each engine gets
+    a fresh copy of it, which shares the setup the constructor did.
+    """
+    try:
+        proto = _prototypes.get(cons, None)
+    except TypeError:
+        return cons()
+    if proto is None:
+        proto = cons()
+        _prototypes[cons] = proto
+    return proto.fresh()
 
 
 class InferenceEngine:
@@ -34,6 +55,20 @@ class InferenceEngine:
             to inferrer classes, which will be instantiated automatically
             by the InferenceEngine.
         context_class: The class to use to instantiate contexts.
+        memo: An InferenceMemo to share inference results with other
+            engines, or None.
+        max_contexts: The maximum number of distinct contexts in which a
+            graph may be inferred, or None. An InferenceError is raised
+            if a graph needs more.
+        broaden_after: After a graph was inferred in this many contexts,
+            the values of the arguments of new calls to it are broadened,
+            so that they share a single context. None to never broaden.
+        max_depth: How many times a graph may appear in its own chain of
+            calls before the values of its arguments are broadened. This
+            limits how far value-dependent recursion is unrolled. None
+            for no limit.
+        stats: An InferenceStatistics to record the costs of inference
+            in, or None.
 
     """
 
@@ -41,19 +76,33 @@ class InferenceEngine:
                  pipeline,
                  *,
                  constructors,
-                 context_class=Context):
+                 context_class=Context,
+                 memo=None,
+                 max_contexts=None,
+                 broaden_after=None,
+                 max_depth=None):
         """Initialize the InferenceEngine."""
         self.loop = InferenceLoop(InferenceError)
         self.pipeline = pipeline
         self.mng = self.pipeline.resources.manager
+        self.constructors_source = constructors
         self.constructors = {
-            prim: cons()
+            prim: _instantiate(cons)
             for prim, cons in constructors.items()
         }
         self.cache = EvaluationCache(loop=self.loop, keycalc=self.compute_ref)
         self.errors = []
         self.context_class = context_class
         self.reference_map = {}
+        self.memo = memo
+        self.memo_candidates = []
+        self.memo_fingerprints = {}
+        self.max_contexts = max_contexts
+        self.broaden_after = broaden_after
+        self.max_depth = max_depth
+        self.graph_contexts = {}
+        self.context_callers = {}
+        self.stats = None
 
     def run(self, graph, *, argspec, outspec=None):
         """Run the inferrer on a graph given initial values.
@@ -84,12 +133,91 @@ class InferenceEngine:
                    loop=self.loop,
                    forced=False)
 
-        self.run_coroutine(_run())
-        if outspec is not None:
-            self.run_coroutine(_check())
+        self.memo_candidates = []
+        self.memo_fingerprints = {}
+        stats = self.stats
+        if stats is not None:
+            snapshot = stats.snapshot(self)
+        try:
+            self.run_coroutine(_run())
+            if outspec is not None:
+                self.run_coroutine(_check())
+        finally:
+            if stats is not None:
+                stats.add_run(self, snapshot)
+
+        if self.memo is not None:
+            for key, nodes, context in self.memo_candidates:
+                self.memo.record(self, key, nodes, context)
+        self.memo_candidates = []
 
         return output_ref.get_sync(), root_context
 
+    def clear(self):
+        """Clear the evaluation cache and the contexts of the graphs.
+
+        The contexts are forgotten along with the values inferred in them,
+        so that they do not count towards the widening policy of later
+        runs.
+        """
+        self.cache.clear()
+        self.graph_contexts.clear()
+        self.context_callers.clear()
+
+    def context_counts(self):
+        """Return a map from each graph to its number of contexts."""
+        return {g: len(ctxs) for g, ctxs in self.graph_contexts.items()}
+
+    def add_context(self, g, context):
+        """Register a context in which g is inferred."""
+        self.graph_contexts.setdefault(g, set()).add(context)
+
+    def call_depth(self, g, caller):
+        """Return how many times g appears in the call chain of caller."""
+        depth = 0
+        seen = set()
+        while caller is not None and caller not in seen:
+            seen.add(caller)
+            if caller.graph is g:
+                depth += 1
+            caller = self.context_callers.get(caller, None)
+        return depth
+
+    def widen(self, g, context, args, caller):
+        """Return the arguments to use to call g in the given context.
+
+        The arguments are broadened according to the widening policy
+        (broaden_after and max_depth), if they would create a new context
+        for g.
+
+        Arguments:
+            g: The graph to call.
+            context: The context of the closure for g.
+            args: The normalized abstract arguments.
+            caller: The context of the call, or None.
+        """
+        if self.max_contexts is None and self.broaden_after is None \
+                and self.max_depth is None:
+            return args
+        contexts = self.graph_contexts.get(g, ())
+        ctx = context.add(g, args)
+        if ctx in contexts:
+            return args
+        n = len(contexts)
+        if (self.broaden_after is not None and n >= self.broaden_after) \
+                or (self.max_depth is not None
+                    and self.call_depth(g, caller) >= self.max_depth):
+            args = tuple(_broaden(a, None) for a in args)
+            ctx = context.add(g, args)
+        if ctx not in contexts:
+            if self.max_contexts is not None and n >= self.max_contexts:
+                raise InferenceError(
+                    f'Graph {g} needs more than {self.max_contexts}'
+                    f' contexts (max_contexts)'
+                )
+            self.context_callers.setdefault(ctx, caller)
+        return args
+
     def ref(self, node, context):
         """Return a Reference to the node in the given context."""
         return Reference(self, node, context)
@@ -129,25 +257,21 @@ class InferenceEngine:
     def run_coroutine(self, coro, throw=True):
         """Run an async function using this inferrer's loop."""
         errs_before = len(self.errors)
-        try:
-            fut = self.loop.schedule(coro)
-            self.loop.run_forever()
-            self.errors.extend(self.loop.collect_errors())
-            for err in self.errors[errs_before:]:
-                err.engine = self
-            if errs_before < len(self.errors):
-                if throw:  # pragma: no cover
-                    for err in self.errors:
-                        if isinstance(err, InferenceError):
-                            raise err
-                    else:
+        fut = self.loop.schedule(coro)
+        self.loop.run_forever()
+        self.errors.extend(self.loop.collect_errors())
+        for err in self.errors[errs_before:]:
+            err.engine = self
+        if errs_before < len(self.errors):
+            if throw:  # pragma: no cover
+                for err in self.errors:
+                    if isinstance(err, InferenceError):
                         raise err
                 else:
-                    return None  # pragma: no cover
-            return fut.result()
-        finally:
-            for task in asyncio.all_tasks(self.loop):
-                task._log_destroy_pending = False
+                    raise err
+            else:
+                return None  # pragma: no cover
+        return fut.result()
 
     _get_inferrer_for = Overload()
 
@@ -226,11 +350,15 @@ class InferenceEngine:
         if not isinstance(fn, AbstractFunction):
             raise MyiaTypeError(f'Not a function: {fn}', refs=[fn_ref])
 
-        infs = [self.get_inferrer_for(poss)
-                for poss in await fn.get()]
+        fns = await fn.get()
+        infs = [self.get_inferrer_for(poss) for poss in fns]
 
+        coro = execute_inferrers(self, infs, ref, argrefs)
+        if self.stats is not None:
+            name = ' | '.join(sorted(inferrer_name(poss) for poss in fns))
+            coro = TimedCoroutine(coro, self.stats, name)
         return await self.loop.schedule(
-            execute_inferrers(self, infs, ref, argrefs),
+            coro,
             context_map={
                 infer_trace: {**infer_trace.get(), ctx: ref}
             }
@@ -238,6 +366,10 @@ class InferenceEngine:
 
     async def infer_constant(self, ctref):
         """Infer the type of a ref of a Constant node."""
+        return self.constant_abstract(ctref)
+
+    def constant_abstract(self, ctref):
+        """Return the abstract value of a ref of a Constant node."""
         v = self.pipeline.resources.convert(ctref.node.value)
         return to_abstract(v, ctref.context, ref=ctref, loop=self.loop)
 
@@ -424,6 +556,16 @@ class Inferrer(Partializable):
         """Initialize the Inferrer."""
         self.cache = {}
 
+    def fresh(self):
+        """Return a copy of this inferrer with an empty cache.
+
+        The other attributes are set up when the inferrer is built and do
+        not change afterwards, so they are shared with the copy.
+        """
+        rval = copy(self)
+        rval.cache = {}
+        return rval
+
     def normalize_args(self, args):
         """Return normalized versions of the arguments.
 
@@ -520,6 +662,7 @@ class BaseGraphInferrer(Inferrer):
             raise type_error_nargs(self, nargs, len(args))
 
         argkey, context = self._make_argkey_and_context(engine, args)
+        engine.add_context(g, context)
 
         # We associate each parameter of the Graph with its value for each
         # property, in the context we built.
@@ -527,8 +670,19 @@ class BaseGraphInferrer(Inferrer):
             ref = engine.ref(p, context)
             engine.cache.set_value(ref, arg)
 
+        memo = engine.memo
+        memokey = None if memo is None else memo.key(engine, g, argkey)
+        if memokey is not None:
+            key, nodes = memokey
+            res = await memo.restore(engine, key, nodes, context)
+            if res is not None:
+                return res
+
         out = engine.ref(g.return_, context)
-        return await engine.get_inferred(out)
+        res = await engine.get_inferred(out)
+        if memokey is not None:
+            engine.memo_candidates.append((key, nodes, context))
+        return res
 
 
 class GraphInferrer(BaseGraphInferrer):
@@ -539,13 +693,32 @@ class GraphInferrer(BaseGraphInferrer):
         self._graph = graph
         assert context is not None
         super().__init__(context.filter(graph))
+        self._widened = {}
 
     def normalize_args(self, args):
-        """Broaden args if flag ignore_values is True."""
+        """Broaden args if flag ignore_values is True.
+
+        Arguments that were broadened by the engine's widening policy are
+        mapped to their broadened version.
+        """
         if self._graph.flags.get('ignore_values', False):
             return tuple(_broaden(a, None) for a in args)
         else:
-            return args
+            return self._widened.get(tuple(args), args)
+
+    async def run(self, engine, outref, argrefs):
+        """Run inference, widening new arguments if needed."""
+        args = tuple([await ref.get() for ref in argrefs])
+        args = self.normalize_args(args)
+        if args not in self.cache:
+            caller = getattr(outref, 'context', None)
+            wargs = engine.widen(self._graph, self.context, args, caller)
+            if wargs != args:
+                self._widened[args] = wargs
+                args = wargs
+            if args not in self.cache:
+                self.cache[args] = await self.infer(engine, *args)
+        return self.cache[args]
 
     def get_graph(self, engine, args):
         """Return the graph."""
@@ -1,20 +1,174 @@
-"""Asyncio-related code for inference."""
+"""Cooperative scheduler for inference.
+
+Inference is written with coroutines, but it does not need most of what
+asyncio provides: there is no I/O, no timers and no threads. This module
+implements the small subset that the inferrer uses. Tasks are kept in a
+plain deque and are resumed directly when the future they wait on is
+done, without going through a handle per step.
+"""
 
-import asyncio
 from contextvars import copy_context
 from collections import deque
 
 from ..dtype import ismyiatype
 
 
-class InferenceLoop(asyncio.AbstractEventLoop):
-    """EventLoop implementation for use with the inferrer.
+_PENDING = 0
+_DONE = 1
+
+
+class InvalidStateError(Exception):
+    """Raised when the result of a Future is requested too early."""
+
+
+class Future:
+    """Placeholder for a value that will be computed later.
+
+    This implements the parts of `asyncio.Future` used by the inferrer.
+    The list of waiters is only created when someone waits on the future,
+    and waiters are resumed in the order in which they were added.
+
+    Attributes:
+        loop: The InferenceLoop this Future is attached to.
+
+    """
+
+    def __init__(self, loop):
+        """Initialize a Future."""
+        self.loop = loop
+        self._state = _PENDING
+        self._result = None
+        self._exception = None
+        self._waiters = None
+
+    def done(self):
+        """Return whether the result is available."""
+        return self._state is _DONE
+
+    def result(self):
+        """Return the result, or raise the exception that was set."""
+        if self._state is not _DONE:
+            raise InvalidStateError('Result is not ready.')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        """Return the exception that was set, or None."""
+        if self._state is not _DONE:
+            raise InvalidStateError('Exception is not set.')
+        return self._exception
+
+    def set_result(self, result):
+        """Set the result and wake up everything that waits on it."""
+        if self._state is _DONE:
+            raise InvalidStateError('Result is already set.')
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        """Set an exception and wake up everything that waits on it."""
+        if self._state is _DONE:
+            raise InvalidStateError('Result is already set.')
+        if isinstance(exception, type):
+            exception = exception()
+        self._exception = exception
+        self._finish()
+
+    def _finish(self):
+        self._state = _DONE
+        if self._waiters is not None:
+            self.loop._todo.extend(self._waiters)
+            self._waiters = None
+
+    def _add_waiter(self, fn, arg):
+        if self._state is _DONE:
+            self.loop._todo.append((fn, arg))
+        elif self._waiters is None:
+            self._waiters = [(fn, arg)]
+        else:
+            self._waiters.append((fn, arg))
+
+    def add_done_callback(self, fn):
+        """Call fn(self) on the loop once this Future is done.
+
+        The callback runs in the context of the task that added it.
+        """
+        loop = self.loop
+        ctx = loop._current
+
+        def run(fut):
+            loop._current = ctx
+            ctx.run(fn, fut)
+
+        self._add_waiter(run, self)
+
+    def __await__(self):
+        if self._state is not _DONE:
+            yield self
+        return self.result()
+
+    __iter__ = __await__
+
+
+class Task(Future):
+    """Future that runs a coroutine on the InferenceLoop.
+
+    Each step of the coroutine runs until it awaits a Future that is not
+    done, at which point the task is added to that Future's waiters. The
+    task is resumed as soon as the Future is done.
+
+    Attributes:
+        coro: The coroutine to run.
+        context: The `contextvars.Context` to run the coroutine in.
+
+    """
+
+    def __init__(self, coro, loop, context):
+        """Initialize a Task and schedule its first step."""
+        super().__init__(loop)
+        self.coro = coro
+        self.context = context
+        loop.task_count += 1
+        loop._todo.append((self._step, None))
+
+    def _step(self, _):
+        ctx = self.loop._current = self.context
+        try:
+            fut = ctx.run(self.coro.send, None)
+        except StopIteration as stop:
+            self.set_result(stop.value)
+        except (KeyboardInterrupt, SystemExit):  # pragma: no cover
+            raise
+        except BaseException as exc:
+            self.set_exception(exc)
+        else:
+            if isinstance(fut, Future):
+                fut._add_waiter(self._step, None)
+            else:  # pragma: no cover
+                self.coro.close()
+                self.set_exception(
+                    RuntimeError(f'Task got bad yield: {fut!r}')
+                )
+
+
+class InferenceLoop:
+    """Cooperative scheduler for use with the inferrer.
+
+    The loop runs tasks and callbacks until there is no more work to do,
+    then it tries to force the resolution of a Pending and resumes. It
+    stops when nothing can be forced anymore.
+
+    A task runs in the same `contextvars.Context` as the task that created
+    it, unless it is scheduled with a `context_map`, in which case it runs
+    in a copy of that context where the given variables are set.
+
+    Attributes:
+        errtype: The type of the errors to collect when forcing Pendings.
+        task_count: The number of tasks created so far.
+        resolve_rounds: The number of times a Pending was forced to
+            resolve so that execution could resume.
 
-    This event loop doesn't allow scheduling tasks and callbacks with
-    `call_later` or `call_at`, which means the `timeout` argument to methods
-    like `wait` will not work. `run_forever` will stop when it has exhausted
-    all work there is to be done. This means `run_until_complete` may finish
-    before it can evaluate the future, which suggests an infinite loop.
     """
 
     def __init__(self, errtype):
@@ -23,11 +177,10 @@ class InferenceLoop(asyncio.AbstractEventLoop):
         self._tasks = []
         self._errors = []
         self._vars = []
+        self._context = self._current = copy_context()
         self.errtype = errtype
-
-    def get_debug(self):
-        """There is no debug mode."""
-        return False
+        self.task_count = 0
+        self.resolve_rounds = 0
 
     def _resolve_var(self):
         """Try to forcefully resolve one variable to resume execution.
@@ -60,32 +213,31 @@ class InferenceLoop(asyncio.AbstractEventLoop):
 
     def run_forever(self):
         """Run this loop until there is no more work to do."""
+        todo = self._todo
         while True:
-            while self._todo:
-                h = self._todo.popleft()
-                h._run()
+            while todo:
+                fn, arg = todo.popleft()
+                try:
+                    fn(arg)
+                except Exception as exc:
+                    self._errors.append(exc)
             # If some literals weren't forced to a concrete type by some
             # operation, we sort by priority (i.e. floats first) and we
             # force the first one to take its default concrete type. Then
             # we resume the loop.
             if not self._resolve_var():
                 break
-
-    def call_exception_handler(self, ctx):
-        """Log an exception in the list of errors."""
-        if 'exception' in ctx:
-            self._errors.append(ctx['exception'])
-        else:
-            raise AssertionError('call_exception_handler', ctx)
+            self.resolve_rounds += 1
+        self._current = self._context
 
     def schedule(self, x, context_map=None):
         """Schedule a task."""
         if context_map:
             ctx = copy_context()
             ctx.run(lambda: [k.set(v) for k, v in context_map.items()])
-            fut = ctx.run(asyncio.ensure_future, x, loop=self)
+            fut = Task(x, self, ctx)
         else:
-            fut = asyncio.ensure_future(x, loop=self)
+            fut = self.create_task(x)
         self._tasks.append(fut)
         return fut
 
@@ -107,27 +259,17 @@ class InferenceLoop(asyncio.AbstractEventLoop):
                 errors.append(exc)
         return errors
 
-    def call_soon(self, callback, *args, context=None):
+    def call_soon(self, callback, *args):
         """Call the given callback as soon as possible."""
-        h = asyncio.Handle(callback, args, self, context=context)
-        self._todo.append(h)
-        return h
-
-    def call_later(self, delay, callback, *args, context=None):
-        """Not supported."""
-        raise NotImplementedError(
-            '_InferenceLoop does not allow timeouts or time-based scheduling.'
-        )
+        self._todo.append((lambda _: callback(*args), None))
 
-    def call_at(self, when, callback, *args, context=None):
-        """Not supported."""
-        raise NotImplementedError(
-            '_InferenceLoop does not allow time-based scheduling.'
-        )
+    def create_future(self):
+        """Create a Future associated to this loop."""
+        return Future(self)
 
     def create_task(self, coro):
         """Create a task from the given coroutine."""
-        return asyncio.Task(coro, loop=self)
+        return Task(coro, self, self._current)
 
     def create_pending(self, resolve, priority):
         """Create a Pending associated to this loop."""
@@ -169,7 +311,7 @@ def is_simple(x):
         return False
 
 
-class Pending(asyncio.Future):
+class Pending(Future):
     """Represents pending data.
 
     Attributes:
@@ -185,7 +327,7 @@ class Pending(asyncio.Future):
 
     def __init__(self, resolve, priority, loop):
         """Initialize the Pending."""
-        super().__init__(loop=loop)
+        super().__init__(loop)
         self.priority = priority
         if resolve is not None:
             self._resolve = resolve
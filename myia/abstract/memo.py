@@ -0,0 +1,343 @@
+"""Inference results shared between InferenceEngines.
+
+Every pipeline parses its input anew, so the same helper function becomes
+a different Graph each time it is compiled and its inference starts over
+in a new InferenceEngine. The InferenceMemo identifies graphs by their
+structure rather than by identity, so that the inference results of a
+graph can be reused by another engine, for the same arguments.
+
+The fingerprint of a graph describes its nodes, the closures it defines
+and, recursively, the graphs it calls, so two graphs with the same
+fingerprint compute the same thing. A graph that calls itself, directly
+or through other graphs, refers to itself by its distance on the chain
+of graphs being fingerprinted. Graphs that contain constants other than
+plain data, primitives, graphs and metagraphs are not memoized, nor are
+closures on their own: they are part of the fingerprint of the graph
+that defines them. Neither are graphs inferred by engines that widen
+arguments, since which calls are widened depends on the order in which
+they are inferred.
+
+An entry holds the results of the applications of primitives on plain
+data, and their arguments. On a hit, the other nodes, such as calls to
+graphs and closures, are inferred normally, so that the engine knows
+about every context the specializer needs. The stored results are then
+used for the applications whose arguments are the same as when they were
+recorded, and the others are inferred normally.
+
+The memo is opt-in: pipelines only use one if it is given to their
+inferrer resource.
+"""
+
+from collections import OrderedDict
+
+from .. import dtype
+from ..graph_utils import toposort, FOLLOW, NOFOLLOW
+from ..ir import Graph, MetaGraph, succ_incoming
+from ..prim import Primitive
+from ..utils import overload
+from .data import ANYTHING, AbstractFunction, AbstractType, AbstractError
+from .loop import Pending
+from .ref import Context
+from .utils import abstract_clone
+
+
+_constant_types = (bool, int, float, str, type(None))
+
+
+class _NotPortable(Exception):
+    """Raised when a value cannot be shared between engines."""
+
+
+@abstract_clone.variant
+def _export(self, x: AbstractFunction):
+    """Return a copy of x with no Pending, if it can be shared.
+
+    Functions refer to nodes and contexts that belong to a specific
+    engine, so they cannot be shared. Neither can values that are still
+    pending.
+    """
+    raise _NotPortable()
+
+
+@overload  # noqa: F811
+def _export(self, x: (AbstractType, AbstractError)):
+    raise _NotPortable()
+
+
+@overload  # noqa: F811
+def _export(self, x: Pending):
+    if not x.done():
+        raise _NotPortable()
+    return self(x.result())
+
+
+@overload  # noqa: F811
+def _export(self, x: tuple):
+    return tuple(self(y) for y in x)
+
+
+@overload  # noqa: F811
+def _export(self, x: object):
+    if x is ANYTHING or isinstance(x, _constant_types) \
+            or dtype.ismyiatype(x):
+        return x
+    raise _NotPortable()
+
+
+@_export.variant
+def _export_strict(self, x: Pending):
+    """Return a copy of x if it can be shared and contains no Pending.
+
+    The type of a literal is a Pending that may be resolved by operations
+    outside of the graph it belongs to. If it reaches the result of an
+    operation, that result depends on more than the graph's arguments,
+    so it cannot be shared.
+    """
+    raise _NotPortable()
+
+
+def _own_nodes(g):
+    """Return the nodes of g and the constants it uses, in order."""
+    def include(node):
+        return FOLLOW if node.graph is g else NOFOLLOW
+
+    return list(toposort(g.return_, succ_incoming, include))
+
+
+def _constant_key(node, scopes, parents, cache, stack):
+    """Return the key of a constant, and the lowest position it refers to.
+
+    Closures are added to scopes, so that they are described along with
+    the graph that defines them.
+    """
+    v = node.value
+    if isinstance(v, Primitive):
+        return ('p', v), None
+    elif isinstance(v, Graph):
+        parent = parents.get(v, None)
+        if parent is None:
+            key, low = _graph_key(v, parents, cache, stack)
+            return ('g', key), low
+        if v not in scopes:
+            if parent not in scopes:
+                raise _NotPortable()
+            scopes.append(v)
+        return ('n', scopes.index(v)), None
+    elif isinstance(v, MetaGraph):
+        return ('m', v), None
+    elif isinstance(v, _constant_types):
+        return ('c', type(v), v), None
+    raise _NotPortable()
+
+
+def _graph_key(g, parents, cache, stack):
+    """Return the key of g, and the lowest position of stack it refers to.
+
+    The graphs on the stack are being fingerprinted by the callers, so a
+    reference to one of them is described by its distance from the top of
+    the stack. The keys that do not refer to the stack are cached.
+    """
+    if g in cache:
+        return cache[g], None
+    if g in stack:
+        i = stack.index(g)
+        return ('rec', len(stack) - i), i
+
+    stack = stack + (g,)
+    low = None
+    index = {}
+    key = []
+    scopes = [g]
+    for h in scopes:
+        if h.transforms.get('primal', None) is not None:
+            # Jinv depends on the primal, which is not part of the key
+            raise _NotPortable()
+        key.append(('graph', len(h.parameters),
+                    tuple(sorted(h.flags.items()))))
+        for p in h.parameters:
+            if p.abstract is not None:
+                raise _NotPortable()
+            index[p] = len(index)
+        for node in _own_nodes(h):
+            if node in index:
+                continue
+            elif node.is_constant():
+                if node.abstract is not None \
+                        and not node.is_constant(Primitive):
+                    raise _NotPortable()
+                k, lo = _constant_key(node, scopes, parents, cache, stack)
+                if lo is not None:
+                    low = lo if low is None else min(low, lo)
+            elif node.is_apply() and node.graph is h \
+                    and node.abstract is None:
+                k = ('a', tuple(index[inp] for inp in node.inputs))
+            else:
+                # Graphs that were already inferred, and free variables
+                # that are not defined in the scope of g
+                raise _NotPortable()
+            index[node] = len(index)
+            key.append(k)
+
+    key = tuple(key)
+    if low is None or low >= len(stack) - 1:
+        cache[g] = key
+        low = None
+    return key, low
+
+
+def _fingerprint(g, parents, cache):
+    """Return a structural key for g, which must not be a closure.
+
+    The key describes the nodes of g, the closures it defines and the
+    graphs it calls, and is the same for graphs that were built from the
+    same code in different pipelines. _NotPortable is raised if the graph
+    cannot be memoized, which includes graphs that were already inferred,
+    since the abstract values of their nodes are not part of the key.
+
+    Arguments:
+        g: The graph.
+        parents: A map from closures to the graphs they are defined in.
+        cache: A dict in which to cache the keys of the graphs, which
+            must not change while it is used.
+
+    """
+    key, _ = _graph_key(g, parents, cache, ())
+    return key
+
+
+class InferenceMemo:
+    """Bounded store of inference results shared between engines.
+
+    Entries are keyed by the structural fingerprint of a graph, the
+    normalized abstract arguments it was called with, and the inferrer
+    constructors of the engine, which determine the semantics of the
+    primitives. The least recently used entries are dropped first.
+
+    Attributes:
+        maxsize: The maximum number of entries.
+        hits: The number of successful lookups.
+        misses: The number of failed lookups.
+
+    """
+
+    def __init__(self, maxsize=1024):
+        """Initialize an InferenceMemo."""
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._namespaces = {}
+
+    def _namespace(self, engine):
+        cons = engine.constructors_source
+        self._namespaces.setdefault(id(cons), cons)
+        return id(cons)
+
+    def key(self, engine, g, argkey):
+        """Return the key for calling g on argkey, and g's nodes.
+
+        Returns None if this call cannot be memoized.
+        """
+        if engine.context_class is not Context:
+            return None
+        if engine.broaden_after is not None or engine.max_depth is not None:
+            # Which calls are widened depends on the order in which they
+            # are inferred, which is not the same on a hit.
+            return None
+        parents = engine.mng.parents
+        if parents.get(g, None) is not None:
+            return None
+        try:
+            fp = _fingerprint(g, parents, engine.memo_fingerprints)
+            args = tuple(_export(arg) for arg in argkey)
+            key = (self._namespace(engine), fp, args)
+            hash(key)
+        except (_NotPortable, TypeError):
+            return None
+        return key, _own_nodes(g)
+
+    async def restore(self, engine, key, nodes, context):
+        """Infer the nodes of a graph, using the entry at key.
+
+        The parameters must already be set in the engine's cache. Returns
+        the inferred output, or None if there is no usable entry.
+        """
+        entry = self.entries.get(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        refs = [engine.ref(node, context) for node in nodes]
+        cache = engine.cache.cache
+        if any(ref in cache for node, ref in zip(nodes, refs)
+               if node.is_apply()):
+            # The graph is already being inferred in this context, by a
+            # call that it makes to itself.
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+
+        for ref, saved in zip(refs, entry):
+            if saved is None:
+                await engine.get_inferred(ref)
+
+        for node, ref, saved in zip(nodes, refs, entry):
+            if saved is None or ref in cache:
+                continue
+            value, args = saved
+            fn, *argvals = [await engine.ref(inp, context).get()
+                            for inp in node.inputs]
+            try:
+                same = tuple(_export_strict(a) for a in argvals) == args
+            except _NotPortable:
+                same = False
+            if same:
+                engine.cache.set_value(ref, value)
+                inf = engine.get_inferrer_for(fn.get_unique())
+                inf.cache[tuple(argvals)] = value
+            else:
+                await engine.get_inferred(ref)
+
+        return await engine.get_inferred(refs[-1])
+
+    def record(self, engine, key, nodes, context):
+        """Store the results of calling a graph, as inferred by engine.
+
+        The results of the applications of primitives on plain data are
+        stored, with their arguments. Nothing is stored if any node was
+        not inferred.
+        """
+        if key in self.entries:
+            return
+        cache = engine.cache.cache
+        values = {}
+        for node in nodes:
+            ref = engine.ref(node, context)
+            if ref in engine.reference_map:
+                return
+            fut = cache.get(ref, None)
+            if fut is None or not fut.done() or fut.exception():
+                return
+            try:
+                values[node] = _export_strict(fut.result())
+            except _NotPortable:
+                values[node] = None
+
+        entry = []
+        for node in nodes:
+            saved = None
+            if node.is_apply() and node.inputs[0].is_constant(Primitive) \
+                    and values[node] is not None:
+                args = tuple(values[inp] for inp in node.inputs[1:])
+                if None not in args:
+                    saved = (values[node], args)
+            entry.append(saved)
+
+        self.entries[key] = tuple(entry)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries."""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
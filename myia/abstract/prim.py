@@ -24,6 +24,7 @@ from .data import (
     AbstractList,
     AbstractClass,
     AbstractJTagged,
+    AbstractError,
     PartialApplication,
     JTransformedFunction,
     PrimitiveFunction,
@@ -906,6 +907,10 @@ abstract_inferrer_constructors[P.resolve] = _ResolveInferrer.partial()
 
 @standard_prim(P.partial)
 async def _inf_partial(engine, fn, *args):
+    if isinstance(fn, AbstractError):
+        # The specializer marks functions that are never called as DEAD,
+        # and so are their partial applications.
+        return fn
     fns = await fn.get()
     assert isinstance(fns, Possibilities)
     return AbstractFunction(*[
@@ -1,6 +1,5 @@
 """Tools to handle contexts and references in inference."""
 
-import asyncio
 from dataclasses import dataclass
 from .loop import force_pending
 
@@ -157,6 +156,8 @@ class EvaluationCache:
         loop: The InferenceLoop for async evaluation.
         keycalc: An async function that takes a key and returns
             the value associated to that key.
+        hits: The number of calls to get that found their key.
+        misses: The number of calls to get that had to compute the value.
 
     """
 
@@ -165,11 +166,16 @@ class EvaluationCache:
         self.cache = {}
         self.loop = loop
         self.keycalc = keycalc
+        self.hits = 0
+        self.misses = 0
 
     def get(self, key):
         """Get the future associated to the key."""
         if key not in self.cache:
+            self.misses += 1
             self.set(key, self.keycalc(key))
+        else:
+            self.hits += 1
         return self.cache[key]
 
     def set(self, key, coro):
@@ -181,7 +187,7 @@ class EvaluationCache:
 
         This will wrap the value in a Future.
         """
-        fut = asyncio.Future(loop=self.loop)
+        fut = self.loop.create_future()
         fut.set_result(value)
         self.cache[key] = fut
 
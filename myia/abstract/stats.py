@@ -0,0 +1,186 @@
+"""Statistics about type inference.
+
+An InferenceStatistics can be given to an InferenceEngine to find out
+where the time in inference goes: how many contexts each graph is
+inferred in, how often and for how long the inferrer of each primitive
+runs, and how much work the InferenceLoop and the EvaluationCache do.
+"""
+
+import json
+
+from ..utils import prof_counter
+from .data import PrimitiveFunction, TypedPrimitive, \
+    MetaGraphFunction
+
+
+def inferrer_name(fn):
+    """Return the name under which calls to fn are recorded."""
+    if isinstance(fn, (PrimitiveFunction, TypedPrimitive)):
+        return str(fn.prim)
+    elif isinstance(fn, MetaGraphFunction):
+        return str(fn.metagraph)
+    return type(fn).__name__
+
+
+def graph_key(g):
+    """Return the name under which the contexts of g are recorded.
+
+    The name of the graph is followed by its unique id, so that distinct
+    graphs with the same name, such as two closures named `f`, are
+    counted separately.
+    """
+    return f'{g}#{g.debug.id}'
+
+
+class TimedCoroutine:
+    """Wrap a coroutine to record the time it runs for.
+
+    Only the time spent in the coroutine's own steps is counted, not the
+    time it spends waiting on other tasks. The total is recorded in the
+    statistics once the coroutine finishes.
+    """
+
+    def __init__(self, coro, stats, name):
+        """Initialize a TimedCoroutine."""
+        self.coro = coro
+        self.stats = stats
+        self.name = name
+        self.time = 0.0
+
+    def send(self, value):
+        """Run the coroutine until its next suspension."""
+        start = prof_counter()
+        try:
+            rval = self.coro.send(value)
+        except BaseException:
+            # This includes StopIteration, when the coroutine returns
+            self.time += prof_counter() - start
+            self.stats.add_inferrer(self.name, self.time)
+            raise
+        self.time += prof_counter() - start
+        return rval
+
+    def close(self):
+        """Close the coroutine."""
+        self.coro.close()
+
+
+class InferenceStatistics:
+    """Statistics about the runs of an InferenceEngine.
+
+    Attributes:
+        runs: The number of times inference was run.
+        contexts: Maps the key of each graph (see `graph_key`) to the
+            number of new contexts in which it was inferred, summed over
+            all runs.
+        inferrers: Maps the name of each primitive or metagraph (or the
+            type of the function, for other functions) to a dict with
+            the number of calls ('calls') and the time spent inferring
+            them ('time').
+        cache_hits: The number of EvaluationCache lookups that found an
+            entry.
+        cache_misses: The number of EvaluationCache lookups that had to
+            compute their entry.
+        tasks: The number of tasks created in the InferenceLoop.
+        resolve_rounds: The number of times the InferenceLoop had to
+            force a Pending to resolve in order to make progress.
+
+    """
+
+    def __init__(self):
+        """Initialize InferenceStatistics."""
+        self.runs = 0
+        self.contexts = {}
+        self.inferrers = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.tasks = 0
+        self.resolve_rounds = 0
+
+    def snapshot(self, engine):
+        """Return the engine's counters, to be given to add_run."""
+        return (engine.cache.hits, engine.cache.misses,
+                engine.loop.task_count, engine.loop.resolve_rounds,
+                engine.context_counts())
+
+    def add_run(self, engine, snapshot):
+        """Record a run of engine, which started at snapshot."""
+        hits, misses, tasks, rounds, counts = snapshot
+        self.runs += 1
+        self.cache_hits += engine.cache.hits - hits
+        self.cache_misses += engine.cache.misses - misses
+        self.tasks += engine.loop.task_count - tasks
+        self.resolve_rounds += engine.loop.resolve_rounds - rounds
+        for g, n in engine.context_counts().items():
+            n -= counts.get(g, 0)
+            if n > 0:
+                name = graph_key(g)
+                self.contexts[name] = self.contexts.get(name, 0) + n
+
+    def add_inferrer(self, name, time):
+        """Record a call to the inferrer with the given name."""
+        rec = self.inferrers.get(name, None)
+        if rec is None:
+            rec = dict(calls=0, time=0.0)
+            self.inferrers[name] = rec
+        rec['calls'] += 1
+        rec['time'] += time
+
+    def cache_hit_ratio(self):
+        """Return the fraction of EvaluationCache lookups that hit."""
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
+
+    def hot_inferrers(self, key='time', n=None):
+        """Return the n inferrers with the highest value for key.
+
+        Returns:
+            A list of (name, record) pairs, in decreasing order.
+
+        """
+        res = sorted(self.inferrers.items(), key=lambda item: -item[1][key])
+        return res if n is None else res[:n]
+
+    def hot_graphs(self, n=None):
+        """Return the n graph keys with the most contexts.
+
+        Returns:
+            A list of (name, count) pairs, in decreasing order.
+
+        """
+        res = sorted(self.contexts.items(), key=lambda item: -item[1])
+        return res if n is None else res[:n]
+
+    def report(self):
+        """Return the statistics as a dict of plain data."""
+        return {
+            'runs': self.runs,
+            'contexts': dict(self.hot_graphs()),
+            'inferrers': {name: dict(rec)
+                          for name, rec in self.hot_inferrers()},
+            'cache': {'hits': self.cache_hits,
+                      'misses': self.cache_misses},
+            'tasks': self.tasks,
+            'resolve_rounds': self.resolve_rounds,
+        }
+
+    def dump(self, file):
+        """Write the report as JSON to a path or a file object."""
+        if isinstance(file, str):
+            with open(file, 'w') as f:
+                json.dump(self.report(), f, indent=2)
+        else:
+            json.dump(self.report(), file, indent=2)
+
+    def print(self, n=20):
+        """Print the statistics, with the costliest entries first."""
+        print(f"  Runs: {self.runs}, tasks: {self.tasks}, "
+              f"forced resolutions: {self.resolve_rounds}")
+        print(f"  Cache: {self.cache_hits} hits, {self.cache_misses} "
+              f"misses ({self.cache_hit_ratio():.1%} hits)")
+        print(f"  {'Inferrer':40} {'calls':>9} {'time':>8}")
+        for name, rec in self.hot_inferrers(n=n):
+            print(f"  {name:40} {rec['calls']:9} {rec['time']:8.3g}s")
+        print(f"  {'Graph':40} {'contexts':>9}")
+        for name, count in self.hot_graphs(n=n):
+            print(f"  {name:40} {count:9}")
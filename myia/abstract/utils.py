@@ -151,8 +151,11 @@ def build_type(self, x: AbstractType):
 
 @overload(bootstrap=True)
 def abstract_clone(self, x: AbstractScalar, *args):
-    """Clone an abstract value."""
-    return AbstractScalar(self(x.values, *args))
+    """Clone an abstract value.
+
+    The result is interned if it is concrete.
+    """
+    return AbstractScalar(self(x.values, *args)).intern()
 
 
 @overload  # noqa: F811
@@ -170,17 +173,19 @@ def abstract_clone(self, x: AbstractTuple, *args):
     return AbstractTuple(
         [self(y, *args) for y in x.elements],
         self(x.values, *args)
-    )
+    ).intern()
 
 
 @overload  # noqa: F811
 def abstract_clone(self, x: AbstractList, *args):
-    return AbstractList(self(x.element, *args), self(x.values, *args))
+    return AbstractList(self(x.element, *args),
+                        self(x.values, *args)).intern()
 
 
 @overload  # noqa: F811
 def abstract_clone(self, x: AbstractArray, *args):
-    return AbstractArray(self(x.element, *args), self(x.values, *args))
+    return AbstractArray(self(x.element, *args),
+                         self(x.values, *args)).intern()
 
 
 @overload  # noqa: F811
@@ -190,12 +195,12 @@ def abstract_clone(self, x: AbstractClass, *args):
         {k: self(v, *args) for k, v in x.attributes.items()},
         x.methods,
         self(x.values, *args)
-    )
+    ).intern()
 
 
 @overload  # noqa: F811
 def abstract_clone(self, x: AbstractJTagged, *args):
-    return AbstractJTagged(self(x.element, *args))
+    return AbstractJTagged(self(x.element, *args)).intern()
 
 
 @overload  # noqa: F811
@@ -218,8 +223,11 @@ def abstract_clone(self, x: object, *args):
 
 @overload(bootstrap=True)
 async def abstract_clone_async(self, x: AbstractScalar):
-    """Clone an abstract value (asynchronous)."""
-    return AbstractScalar(await self(x.values))
+    """Clone an abstract value (asynchronous).
+
+    The result is interned if it is concrete.
+    """
+    return AbstractScalar(await self(x.values)).intern()
 
 
 @overload  # noqa: F811
@@ -238,17 +246,19 @@ async def abstract_clone_async(self, x: AbstractTuple):
     return AbstractTuple(
         [(await self(y)) for y in x.elements],
         await self(x.values)
-    )
+    ).intern()
 
 
 @overload  # noqa: F811
 async def abstract_clone_async(self, x: AbstractList):
-    return AbstractList(await self(x.element), await self(x.values))
+    return AbstractList(await self(x.element),
+                        await self(x.values)).intern()
 
 
 @overload  # noqa: F811
 async def abstract_clone_async(self, x: AbstractArray):
-    return AbstractArray(await self(x.element), await self(x.values))
+    return AbstractArray(await self(x.element),
+                         await self(x.values)).intern()
 
 
 @overload  # noqa: F811
@@ -258,7 +268,7 @@ async def abstract_clone_async(self, x: AbstractClass):
         {k: (await self(v)) for k, v in x.attributes.items()},
         x.methods,
         await self(x.values)
-    )
+    ).intern()
 
 
 @overload  # noqa: F811
@@ -409,7 +419,7 @@ def _amerge(x1: AbstractScalar, x2, loop, forced):
     values = amerge(x1.values, x2.values, loop, forced)
     if forced or values is x1.values:
         return x1
-    return AbstractScalar(values)
+    return AbstractScalar(values).intern()
 
 
 @overload  # noqa: F811
@@ -427,7 +437,7 @@ def _amerge(x1: AbstractTuple, x2, loop, forced):
     merged = amerge(args1, args2, loop, forced)
     if forced or merged is args1:
         return x1
-    return AbstractTuple(*merged)
+    return AbstractTuple(*merged).intern()
 
 
 @overload  # noqa: F811
@@ -437,7 +447,7 @@ def _amerge(x1: AbstractArray, x2, loop, forced):
     merged = amerge(args1, args2, loop, forced)
     if forced or merged is args1:
         return x1
-    return AbstractArray(*merged)
+    return AbstractArray(*merged).intern()
 
 
 @overload  # noqa: F811
@@ -447,7 +457,7 @@ def _amerge(x1: AbstractList, x2, loop, forced):
     merged = amerge(args1, args2, loop, forced)
     if forced or merged is args1:
         return x1
-    return AbstractList(*merged)
+    return AbstractList(*merged).intern()
 
 
 @overload  # noqa: F811
@@ -457,7 +467,7 @@ def _amerge(x1: AbstractClass, x2, loop, forced):
     merged = amerge(args1, args2, loop, forced)
     if forced or merged is args1:
         return x1
-    return AbstractClass(*merged)
+    return AbstractClass(*merged).intern()
 
 
 @overload  # noqa: F811
@@ -467,7 +477,7 @@ def _amerge(x1: AbstractJTagged, x2, loop, forced):
     merged = amerge(args1, args2, loop, forced)
     if forced or merged is args1:
         return x1
-    return AbstractJTagged(merged)
+    return AbstractJTagged(merged).intern()
 
 
 @overload  # noqa: F811
@@ -537,6 +547,9 @@ def amerge(x1, x2, loop, forced, accept_pending=True):
         raise MyiaTypeError(
             f'Type mismatch: {type(x1)} != {type(x2)}; {x1} != {x2}'
         )
+    elif x1 is x2 and getattr(x1, '_interned', False):
+        # Interned values are concrete, so they merge with themselves
+        return x1
     else:
         return _amerge(x1, x2, loop, forced)
 
@@ -1,16 +1,94 @@
 """User-friendly interfaces to Myia machinery."""
 
 import inspect
+import queue
+import threading
+
+import numpy as np
 
 from .abstract import MyiaTypeError, from_value, broaden
+from .composite import vmap
+from .ir import Constant, Graph
 from .pipeline import standard_pipeline
 
 
+#############
+# Streaming #
+#############
+
+
+class _Prefetch:
+    """Iterate over the items of a generator that runs in a thread.
+
+    The thread runs ahead of the iteration by at most `depth` items. It
+    stops when the iteration stops, and the errors it raises are raised
+    by the iteration.
+    """
+
+    def __init__(self, gen, depth):
+        self.queue = queue.Queue(depth)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(gen,),
+                                       daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, gen):
+        try:
+            for item in gen:
+                if not self._put((True, item)):
+                    return
+        except BaseException as e:
+            self._put((False, e))
+        else:
+            self._put((False, None))
+
+    def __iter__(self):
+        try:
+            while True:
+                ok, item = self.queue.get()
+                if not ok:
+                    if item is not None:
+                        raise item
+                    return
+                yield item
+        finally:
+            self.stop.set()
+
+
+def _stack(values):
+    if isinstance(values[0], tuple):
+        return tuple(_stack([v[i] for v in values])
+                     for i in range(len(values[0])))
+    return np.stack(values)
+
+
+def _unstack(value, n):
+    if isinstance(value, tuple):
+        return list(zip(*[_unstack(v, n) for v in value]))
+    return [value[i].item() if isinstance(value[i], np.generic)
+            else value[i]
+            for i in range(n)]
+
+
 #################
 # Top-level API #
 #################
 
 
+# Streams compile in a background thread, and the pipelines share caches
+# that are not safe to update concurrently, so compilation is serialized.
+_compile_lock = threading.RLock()
+
+
 class MyiaFunction:
     """Represents a function compiled by Myia.
 
@@ -30,16 +108,10 @@ class MyiaFunction:
         self.fn = fn
         self.specialize_values = set(specialize_values)
         self._cache = {}
+        self._batched_cache = {}
         # self.pip = standard_pipeline.make()
 
-    def specialize(self, args):
-        """Specialize on the types of the given arguments.
-
-        Returns a Pipeline. If the argument types were seen before, returns a
-        cached version.
-        """
-        self.pip = standard_pipeline.make()
-
+    def _argspec(self, args):
         argnames = inspect.getfullargspec(self.fn).args
         n1 = len(argnames)
         n2 = len(args)
@@ -49,16 +121,26 @@ class MyiaFunction:
             )
 
         argspec = tuple(from_value(arg) for arg in args)
-        argspec = tuple(broaden(arg, None)
-                        if name not in self.specialize_values else arg
-                        for arg, name in zip(argspec, argnames))
-
-        if argspec not in self._cache:
-            self._cache[argspec] = self.pip(
-                input=self.fn,
-                argspec=argspec
-            )
-        return self._cache[argspec]
+        return tuple(broaden(arg, None)
+                     if name not in self.specialize_values else arg
+                     for arg, name in zip(argspec, argnames))
+
+    def specialize(self, args):
+        """Specialize on the types of the given arguments.
+
+        Returns a Pipeline. If the argument types were seen before, returns a
+        cached version.
+        """
+        argspec = self._argspec(args)
+
+        with _compile_lock:
+            self.pip = standard_pipeline.make()
+            if argspec not in self._cache:
+                self._cache[argspec] = self.pip(
+                    input=self.fn,
+                    argspec=argspec
+                )
+            return self._cache[argspec]
 
     def compile(self, args):
         """Returns a function specialized for the given args."""
@@ -68,6 +150,130 @@ class MyiaFunction:
         """Call the function on the given args."""
         return self.compile(args)(*args)
 
+    def specialize_batched(self, args, in_axes=None):
+        """Specialize the batched version of the function.
+
+        The batched version applies the function to each example of the
+        arguments that are stacked along their first axis, and returns the
+        results stacked the same way (see `myia.composite.vmap`).
+
+        Arguments:
+            args: The stacked arguments.
+            in_axes: For each argument, 0 if it is batched along its first
+                axis, or None if it is shared by all the examples. By
+                default, all the arguments are batched.
+
+        Returns a Pipeline, cached as for `specialize`.
+        """
+        argspec = self._argspec(args)
+        if in_axes is not None:
+            in_axes = tuple(in_axes)
+
+        key = (argspec, in_axes)
+        with _compile_lock:
+            if key not in self._batched_cache:
+                g = Graph()
+                params = [g.add_parameter() for _ in args]
+                fn = Constant(self.fn)
+                vfn = g.apply(vmap, fn) if in_axes is None \
+                    else g.apply(vmap, fn, in_axes)
+                g.output = g.apply(vfn, *params)
+                self._batched_cache[key] = standard_pipeline.make()(
+                    input=g,
+                    argspec=argspec
+                )
+            return self._batched_cache[key]
+
+    def compile_batched(self, args, in_axes=None):
+        """Returns the batched function specialized for the given args."""
+        return self.specialize_batched(args, in_axes)['output']
+
+    def batched(self, *args, in_axes=None):
+        """Call the function on each example of the stacked args.
+
+        The results are stacked along their first axis.
+        """
+        return self.compile_batched(args, in_axes)(*args)
+
+    def _groups(self, items, batch_size, in_axes):
+        """Group consecutive items that can be stacked together.
+
+        The items of a group have the same types and shapes, and share the
+        arguments that are not batched.
+        """
+        group = []
+        spec = None
+        for args in items:
+            args = tuple(args)
+            argspec = self._argspec(args)
+            if group and (argspec != spec
+                          or len(group) == batch_size
+                          or any(a is not b for a, b, axis
+                                 in zip(group[0], args, in_axes)
+                                 if axis is None)):
+                yield group
+                group = []
+            spec = argspec
+            group.append(args)
+        if group:
+            yield group
+
+    def _prepare(self, items, batch_size, in_axes):
+        """Compile the calls on items and convert their arguments.
+
+        Generates the wrapped functions, the converted arguments, and the
+        number of items of each call.
+        """
+        if batch_size is None:
+            for args in items:
+                args = tuple(args)
+                fn = self.compile(args)
+                yield fn, fn.convert_args(*args), None
+        else:
+            axes = in_axes or (0,) * len(inspect.getfullargspec(self.fn).args)
+            for group in self._groups(items, batch_size, axes):
+                args = tuple(group[0][i] if axis is None
+                             else _stack([g[i] for g in group])
+                             for i, axis in enumerate(axes))
+                fn = self.compile_batched(args, in_axes)
+                yield fn, fn.convert_args(*args), len(group)
+
+    def stream(self, items, depth=2, batch_size=None, in_axes=None):
+        """Call the function on each tuple of arguments of an iterable.
+
+        The results are generated in order. The calls to come are compiled
+        and their arguments are converted in a background thread, while
+        the current call runs.
+
+        Arguments:
+            items: An iterable of tuples of arguments, such as a data
+                loader.
+            depth: The number of calls that are prepared ahead of the
+                current one.
+            batch_size: If given, up to this many consecutive items are
+                stacked and computed by a single call to the batched
+                function (see `compile_batched`). Items are only stacked
+                together if their arguments have the same types and
+                shapes.
+            in_axes: The batched arguments when batch_size is given (see
+                `specialize_batched`). Items are only stacked together if
+                their other arguments are the same objects.
+
+        """
+        if depth < 1:
+            raise ValueError('depth must be at least 1')
+        if batch_size is not None and batch_size < 1:
+            raise ValueError('batch_size must be at least 1')
+        if in_axes is not None:
+            in_axes = tuple(in_axes)
+        calls = _Prefetch(self._prepare(items, batch_size, in_axes), depth)
+        for fn, args, n in calls:
+            res = fn.convert_result(fn.fn(*args))
+            if n is None:
+                yield res
+            else:
+                yield from _unstack(res, n)
+
 
 def myia(fn=None, *, specialize_values=[]):
     """Create a function using Myia's runtime.
@@ -110,12 +110,23 @@ def nnvm_transpose(c, a, ax):
     return sym.transpose(na, axes=ax.value)
 
 
+def nnvm_reshape(c, v, shp):
+    """Implementation of reshape."""
+    nv = c.ref(v)
+    assert shp.is_constant(tuple)
+    shp = shp.value
+    if shp == ():
+        shp = (1,)
+    return sym.reshape(nv, shape=shp)
+
+
 COMPLEX_MAP = {
     P.bool_not: nnvm_bool_not,
     P.distribute: nnvm_distribute,
     P.dot: nnvm_dot,
     P.array_map: nnvm_array_map,
     P.array_reduce: nnvm_array_reduce,
+    P.reshape: nnvm_reshape,
     P.transpose: nnvm_transpose,
 }
 
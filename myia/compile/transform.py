@@ -1,20 +1,36 @@
 """Transforms a graph into lower-level code."""
 
+from importlib import import_module
+
 from ..abstract import VALUE
 from ..ir import Apply, toposort, Graph, Constant
 from ..pipeline import PipelineDefinition, PipelineStep
 from ..prim import Primitive, ops as P
 from ..prim.ops import partial, return_, switch, make_tuple
-from .debug_lin import debug_convert
-from .nnvm import nnvm_convert
 from .vm import FinalVM
 
+# Modules and functions that implement the conversion of linear portions.
+# They are only imported when a pipeline that uses them is made, since
+# backends such as nnvm and tvm take a long time to import.
 LIN_IMPLS = dict(
-    debug=debug_convert,
-    nnvm=nnvm_convert,
+    debug=('.debug_lin', 'debug_convert'),
+    nnvm=('.nnvm', 'nnvm_convert'),
 )
 
 
+def get_lin_impl(name):
+    """Import and return the implementation of linear portions `name`."""
+    module, attr = LIN_IMPLS[name]
+    return getattr(import_module(module, __package__), attr)
+
+
+def lazy_lin_convert(name):
+    """Return a lin_convert that imports implementation `name` when called."""
+    def lin_convert(lst, **kwargs):
+        return get_lin_impl(name)(lst, **kwargs)
+    return lin_convert
+
+
 class WrapPrimitives(PipelineStep):
     """Pipeline step to wrap primitives in non-call positions into graphs.
 
@@ -292,7 +308,7 @@ class OptimizeInstrs(PipelineStep):
 
 graph_transform = PipelineDefinition(
     resources=dict(
-        lin_convert=nnvm_convert,
+        lin_convert=lazy_lin_convert('nnvm'),
         target='cpu',
         dev_id=0,
     ),
@@ -326,7 +342,7 @@ class CompileGraphs(PipelineStep):
         """
         super().__init__(pipeline_init)
         self.transform = graph_transform.configure(
-            lin_convert=LIN_IMPLS[linear_impl],
+            lin_convert=get_lin_impl(linear_impl),
             target=target,
             dev_id=dev_id).make()
 
@@ -9,7 +9,7 @@ from .abstract import AbstractArray, SHAPE, ANYTHING, MyiaShapeError, \
 from .dtype import Array, Object, Int, UInt, Float, Number, Bool, Tuple, \
     List, Class, EnvType, Function
 from .hypermap import HyperMap
-from .abstract import MyiaTypeError, broaden
+from .abstract import MyiaTypeError, broaden, build_value
 from .info import About
 from .ir import Graph, MetaGraph, MultitypeGraph, Constant
 from .prim import ops as P
@@ -46,6 +46,21 @@ def core(fn=None, **flags):
         return deco(fn)
 
 
+def checkpoint(fn):
+    """Recompute the intermediate values of fn in its gradient.
+
+    Normally, the backpropagator of a function keeps all of the values
+    the function computed, until the backward pass uses them. The
+    backpropagator of a checkpointed function only keeps its arguments,
+    and runs the function again when it is called, so that the memory
+    for its intermediate values is only needed during the backward pass.
+
+    Functions that have free variables are not checkpointed.
+    """
+    fn._myia_flags = {**getattr(fn, '_myia_flags', {}), 'checkpoint': True}
+    return fn
+
+
 class Elemwise(MetaGraph):
     """Generate a graph for an elemwise operation.
 
@@ -687,3 +702,103 @@ class GradOperation(MetaGraph):
 
 
 grad = GradOperation('grad')
+
+
+class JVPOperation(MetaGraph):
+    """Implements the jvp(f) operation.
+
+    jvp(f)(x, ..., dx, ...) returns the pair (f(x, ...), df), where df is
+    the derivative of f at (x, ...) in the direction (dx, ...). It is
+    computed in forward mode, alongside f(x, ...), with the transform in
+    `myia.jvp`.
+
+    As for grad, this currently will not work on primitives. It does not
+    work on closures either.
+    """
+
+    def generate_graph(self, args):
+        """Generate the graph."""
+        from .jvp import jvp_graph
+
+        ft, = args
+        assert isinstance(ft, AbstractFunction)
+        gf = ft.get_unique()
+        assert isinstance(gf, GraphFunction)
+        g = gf.graph
+        jg = jvp_graph(g)
+
+        dfbuilder = Graph()
+        dfbuilder.debug.name = f"jvp{len(g.parameters)}"
+
+        with About(g.debug, 'copy'):
+            dfbuilder.add_parameter()
+
+        with About(g.debug, 'jvp'):
+            df = Graph()
+        params = []
+        tangents = []
+        for p in g.parameters:
+            with About(p.debug, 'copy'):
+                params.append(df.add_parameter())
+        for p in g.parameters:
+            with About(p.debug, 'jvp_tangent'):
+                tangents.append(df.add_parameter())
+        df.output = df.apply(
+            jg, *[x for pair in zip(params, tangents) for x in pair]
+        )
+
+        dfbuilder.output = Constant(df)
+
+        return dfbuilder
+
+
+jvp = JVPOperation('jvp')
+
+
+class VMapOperation(MetaGraph):
+    """Implements the vmap(f, in_axes) operation.
+
+    vmap(f)(xs, ...) applies f to each example of its arguments, which are
+    stacked along their first axis, and returns the results stacked the same
+    way. It is computed with the batching transform in `myia.vmap`.
+
+    in_axes is optional, and must be a constant tuple that has, for each
+    argument, 0 if the argument is batched along its first axis, or None if
+    it is shared by all the examples.
+
+    As for grad, this does not work on primitives or closures.
+    """
+
+    def generate_graph(self, args):
+        """Generate the graph."""
+        from .vmap import vmap_metagraph
+
+        if len(args) not in (1, 2):
+            raise MyiaTypeError('vmap takes one or two arguments')
+        ft, *rest = args
+        assert isinstance(ft, AbstractFunction)
+        gf = ft.get_unique()
+        assert isinstance(gf, GraphFunction)
+        g = gf.graph
+
+        in_axes = None
+        if rest:
+            in_axes = build_value(rest[0], default=ANYTHING)
+            if not isinstance(in_axes, tuple) \
+                    or len(in_axes) != len(g.parameters) \
+                    or any(axis not in (0, None) for axis in in_axes):
+                raise MyiaTypeError(
+                    f'in_axes must be a constant tuple of 0 or None for'
+                    f' each of the {len(g.parameters)} arguments'
+                )
+
+        builder = Graph()
+        builder.debug.name = f"vmap{len(g.parameters)}"
+        for _ in args:
+            with About(g.debug, 'copy'):
+                builder.add_parameter()
+        builder.output = Constant(vmap_metagraph(g, in_axes))
+        return builder
+
+
+vmap = VMapOperation('vmap')
@@ -1,6 +1,7 @@
 """Estimate gradients with finite differences."""
 
 
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import is_dataclass
 from typing import Callable, Dict, List, Any
 import numpy
@@ -140,6 +141,122 @@ def gen_variants(self, obj: numpy.ndarray, gen, path):
             yield (res, p)
 
 
+@overload(bootstrap=True)
+def _random_like(self, obj: NoTestGrad, rng):
+    """Generate a random direction with the same structure as obj.
+
+    Each scalar is drawn from the standard normal distribution, and values
+    that are not tested are mapped to None.
+    """
+    return None
+
+
+@overload  # noqa: F811
+def _random_like(self, obj: (list, tuple), rng):
+    return type(obj)(self(x, rng) for x in obj)
+
+
+@overload  # noqa: F811
+def _random_like(self, obj: numpy.ndarray, rng):
+    return rng.standard_normal(obj.shape)
+
+
+@overload  # noqa: F811
+def _random_like(self, obj: object, rng):
+    if is_dataclass(obj):
+        return type(obj)(**{name: self(getattr(obj, name), rng)
+                            for name in obj.__dataclass_fields__})
+    else:
+        return rng.standard_normal()
+
+
+@overload(bootstrap=True)
+def _shift(self, obj: NoTestGrad, direction, scale):
+    """Return obj + scale * direction, for a direction from _random_like."""
+    return obj
+
+
+@overload  # noqa: F811
+def _shift(self, obj: (list, tuple), direction, scale):
+    return type(obj)(self(x, d, scale) for x, d in zip(obj, direction))
+
+
+@overload  # noqa: F811
+def _shift(self, obj: object, direction, scale):
+    if is_dataclass(obj):
+        return type(obj)(**{name: self(getattr(obj, name),
+                                       getattr(direction, name),
+                                       scale)
+                            for name in obj.__dataclass_fields__})
+    else:
+        return obj + scale * direction
+
+
+@overload(bootstrap=True)
+def _stack(self, obj: NoTestGrad, objs):
+    """Stack objs, which have the same structure as obj, along a new axis.
+
+    Values that are not tested are not stacked, since they are the same in
+    all the objects.
+    """
+    return obj
+
+
+@overload  # noqa: F811
+def _stack(self, obj: (list, tuple), objs):
+    return type(obj)(self(x, [o[i] for o in objs])
+                     for i, x in enumerate(obj))
+
+
+@overload  # noqa: F811
+def _stack(self, obj: numpy.ndarray, objs):
+    return numpy.stack(objs)
+
+
+@overload  # noqa: F811
+def _stack(self, obj: object, objs):
+    if is_dataclass(obj):
+        return type(obj)(**{name: self(getattr(obj, name),
+                                       [getattr(o, name) for o in objs])
+                            for name in obj.__dataclass_fields__})
+    else:
+        return numpy.array(objs)
+
+
+@overload(bootstrap=True)
+def _unstack(self, obj: (list, tuple), i):
+    """Return the i-th element of a result stacked by a vectorized call."""
+    return type(obj)(self(x, i) for x in obj)
+
+
+@overload  # noqa: F811
+def _unstack(self, obj: numpy.ndarray, i):
+    return obj[i]
+
+
+@overload  # noqa: F811
+def _unstack(self, obj: object, i):
+    if is_dataclass(obj):
+        return type(obj)(**{name: self(getattr(obj, name), i)
+                            for name in obj.__dataclass_fields__})
+    else:
+        # The result does not depend on the inputs
+        return obj
+
+
+def _evaluate(fn, calls, batched):
+    """Return the results of fn on each tuple of arguments in calls.
+
+    If batched is True, fn is called once on the stacked arguments. This is
+    a top-level function so that it can be sent to worker processes.
+    """
+    if batched:
+        out = fn(*clean_args(_stack(calls[0], calls)))
+        return [_unstack(out, i) for i in range(len(calls))]
+    else:
+        return [fn(*clean_args(args)) for args in calls]
+
+
 class GradTester:
     """
     Test computed gradient against finite differences estimate.
@@ -151,6 +268,20 @@ class GradTester:
             to estimate the gradient.
         argnames: The names of the arguments.
         outnames: The names of the outputs.
+        batch_size: If not None, fn is vectorized: given arguments that
+            are stacked along a new leading axis, it returns its results
+            stacked along that axis. The perturbed inputs are then
+            evaluated batch_size at a time.
+        processes: If not None, the evaluations of fn for the finite
+            differences are spread over that many worker processes. fn
+            must then be picklable, i.e. defined at the top level of a
+            module.
+        projections: If not None, check the derivatives of the outputs in
+            that many random directions, named v0, v1, etc., instead of
+            the derivatives with respect to each input element. This costs
+            two evaluations of fn per direction, whatever the size of the
+            inputs.
+        seed: The seed used to draw the random directions.
 
     """
 
@@ -161,10 +292,22 @@ class GradTester:
                  argnames: List[str],
                  outnames: List[str] = None,
                  epsilon: float = eps,
-                 rel_error: float = rel_error) -> None:
+                 rel_error: float = rel_error,
+                 batch_size: int = None,
+                 processes: int = None,
+                 projections: int = None,
+                 seed: int = 0) -> None:
         """Initialize a GradTester."""
         self.epsilon = epsilon
         self.rel_error = rel_error
+        self.batch_size = batch_size
+        self.processes = processes
+        if projections is None:
+            self.directions = None
+        else:
+            rng = numpy.random.RandomState(seed)
+            self.directions = [_random_like(args, rng)
+                               for _ in range(projections)]
         self.fn = fn
         self.gfn = gfn
         self.args = args
@@ -190,9 +333,13 @@ class GradTester:
 
     def _set_result(self, results, opath, ipath, value):
         opath = (self.outnames[opath[0]],) + opath[1:]
-        ipath = (self.argnames[ipath[0]],) + ipath[1:]
         outname = '.'.join(map(str, opath))
-        argname = '.'.join(map(str, ipath))
+        if isinstance(ipath, int):
+            # Index of a random direction
+            argname = f'v{ipath}'
+        else:
+            ipath = (self.argnames[ipath[0]],) + ipath[1:]
+            argname = '.'.join(map(str, ipath))
         results[f'd{outname}/d{argname}'] = value
 
     def compute_exact(self) -> Dict[str, float]:
@@ -208,6 +355,14 @@ class GradTester:
         z = _zeros_like(self.out)
         for (out_sen,), opath in gen_variants(z, lambda x: [1.0], ()):
             grads = self.gfn(*self.clean_args, self.unwrap(out_sen))
+            if self.directions is not None:
+                ipaths = list(gen_paths(self.args, ()))
+                for i, direction in enumerate(self.directions):
+                    value = sum(resolve_path(grads, ipath)
+                                * resolve_path(direction, ipath)
+                                for ipath in ipaths)
+                    self._set_result(results, opath, i, value)
+                continue
             for ipath in gen_paths(grads, ()):
                 if isinstance(resolve_path(self.args, ipath), NoTestGrad):
                     continue
@@ -220,6 +375,43 @@ class GradTester:
         """Return x +- some epsilon."""
         return x - self.epsilon, x + self.epsilon
 
+    def _variants(self):
+        """Generate the perturbed inputs, as (under, over, ipath) triples.
+
+        ipath is the path to the perturbed input element, or the index of
+        the direction of the perturbation if projections are checked.
+        """
+        if self.directions is None:
+            for (under, over), ipath in gen_variants(self.args,
+                                                     self.wiggle, ()):
+                yield under, over, ipath
+        else:
+            for i, direction in enumerate(self.directions):
+                yield (_shift(self.args, direction, -self.epsilon),
+                       _shift(self.args, direction, self.epsilon),
+                       i)
+
+    def evaluate(self, calls):
+        """Return the wrapped results of fn on each tuple of arguments.
+
+        The calls are batched and spread over processes as configured.
+        """
+        size = self.batch_size or 1
+        batched = self.batch_size is not None
+        chunks = [calls[i:i + size] for i in range(0, len(calls), size)]
+        if self.processes:
+            with ProcessPoolExecutor(self.processes) as pool:
+                chunksize = max(1, len(chunks) // (4 * self.processes))
+                results = list(pool.map(_evaluate,
+                                        itertools.repeat(self.fn),
+                                        chunks,
+                                        itertools.repeat(batched),
+                                        chunksize=chunksize))
+        else:
+            results = [_evaluate(self.fn, chunk, batched)
+                       for chunk in chunks]
+        return [self.wrap(out) for res in results for out in res]
+
     def compute_finite_diff(self) -> Dict[str, float]:
         """
         Compute the finite differences gradient.
@@ -230,20 +422,17 @@ class GradTester:
 
         """
         results: Dict[str, float] = {}
-        for (under, over), ipath in gen_variants(self.args, self.wiggle, ()):
-            under = clean_args(under)
-            over = clean_args(over)
-
-            under_res = self.wrap(self.fn(*under))
-            over_res = self.wrap(self.fn(*over))
-
-            eps = self.epsilon
+        eps = self.epsilon
 
-            @smap.variant
-            def mkdiff(self, a: object, b):
-                return (b - a) / (2 * eps)
+        @smap.variant
+        def mkdiff(self, a: object, b):
+            return (b - a) / (2 * eps)
 
-            diff = mkdiff(under_res, over_res)
+        variants = list(self._variants())
+        outs = self.evaluate([args for under, over, _ in variants
+                              for args in (under, over)])
+        for i, (_, _, ipath) in enumerate(variants):
+            diff = mkdiff(outs[2 * i], outs[2 * i + 1])
             for opath in gen_paths(diff, ()):
                 self._set_result(results, opath, ipath,
                                  resolve_path(diff, opath))
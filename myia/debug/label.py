@@ -30,6 +30,8 @@ short_relation_symbols = {
     'grad_fprop': '▶',
     'grad_bprop': '◀',
     'grad_sens': '∇',
+    'jvp': '▷',
+    'jvp_tangent': '∂',
 }
 
 
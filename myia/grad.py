@@ -45,6 +45,10 @@ SensRemapper will generate a sensitivity node in each graph that uses
 it, so e.g. in `lambda x: x + (lambda y: x + y)(123)` two different
 sensitivity nodes are created for x, because it is used in both lambda
 expressions. See `SensRemapper.link_apply` for more information.
+
+Graphs with the `checkpoint` flag are transformed differently, so that
+their backpropagator does not keep their intermediate values alive. See
+`_checkpoint_grad`.
 """
 
 
@@ -52,7 +56,7 @@ from functools import reduce
 
 from .composite import zeros_like, hyper_add
 from .info import About
-from .ir import Constant, Graph
+from .ir import Constant, Graph, clone
 from .opt import sexp_to_node
 from .prim import ops as primops, Primitive
 from .prim.grad_implementations import augmented_graphs
@@ -630,6 +634,55 @@ def _grad(mng, root):
     return remappers['grad_fprop'].get_graph(root)
 
 
+def _checkpoint_grad(graph):
+    """Generate the forward graph for a checkpointed graph.
+
+    The forward graph only computes the primal output, and its
+    backpropagator only keeps the arguments. The backpropagator
+    recomputes the forward pass with the regular transform of the graph
+    before it runs the regular backpropagator, which trades computation
+    for memory:
+
+        def fprop(*jargs):
+            def bprop(dout):
+                _, bprop_g = J(g_copy)(*jargs)
+                return bprop_g(dout)
+            return J(g(*Jinv(jargs))), bprop
+
+    g_copy is a copy of the graph without the checkpoint flag.
+    """
+    inner = clone(graph, total=False)
+    del inner.flags['checkpoint']
+
+    with About(graph.debug, 'grad_fprop'):
+        fprop = Graph()
+    jparams = []
+    for p in graph.parameters:
+        with About(p.debug, 'grad_fprop'):
+            jparams.append(fprop.add_parameter())
+    args = [fprop.apply(primops.Jinv, p) for p in jparams]
+    out = fprop.apply(graph, *args)
+
+    with About(graph.debug, 'grad_bprop'):
+        bprop = Graph()
+    with About(graph.output.debug, 'grad_sens'):
+        dout = bprop.add_parameter()
+    taped = bprop.apply(bprop.apply(primops.J, inner), *jparams)
+    bprop.output = bprop.apply(
+        bprop.apply(primops.tuple_getitem, taped, 1),
+        dout
+    )
+
+    fprop.output = fprop.apply(
+        primops.make_tuple,
+        fprop.apply(primops.J, out),
+        bprop
+    )
+    graph.transforms['grad'] = fprop
+    fprop.transforms['primal'] = graph
+    return fprop
+
+
 @overload
 def J(prim: Primitive, resources):
     """Implement J on a Primitive."""
@@ -644,6 +697,9 @@ def J(graph: Graph, resources):
         return graph.transforms['grad']
     manager = resources.manager
     manager.add_graph(graph)
+    if graph.flags.get('checkpoint', False) \
+            and not graph.free_variables_total:
+        return _checkpoint_grad(graph)
     return _grad(manager, graph)
 
 
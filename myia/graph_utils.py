@@ -106,3 +106,56 @@ def toposort(root: T,
         done.add(node)
         yield node
         todo.pop()
+
+
+def strongly_connected_components(nodes: Iterable[T],
+                                  succ: Callable[[T], Iterable[T]]) \
+        -> Iterable[List[T]]:
+    """Yield the strongly connected components of a graph.
+
+    This uses an iterative version of Tarjan's algorithm. Each component is
+    yielded after all the components that are reachable from it, so the
+    components come out in reverse topological order.
+
+    Arguments:
+        nodes: The nodes to start from. Nodes that are reachable from them
+            will also be visited.
+        succ: A function that returns a node's successors.
+    """
+    index: Dict[T, int] = {}
+    lowlink: Dict[T, int] = {}
+    stack: List[T] = []
+    on_stack: Set[T] = set()
+
+    def _visit(node):
+        index[node] = lowlink[node] = len(index)
+        stack.append(node)
+        on_stack.add(node)
+        return (node, iter(succ(node)))
+
+    for root in nodes:
+        if root in index:
+            continue
+        work = [_visit(root)]
+        while work:
+            node, successors = work[-1]
+            for nxt in successors:
+                if nxt not in index:
+                    work.append(_visit(nxt))
+                    break
+                elif nxt in on_stack:
+                    lowlink[node] = min(lowlink[node], index[nxt])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        x = stack.pop()
+                        on_stack.remove(x)
+                        component.append(x)
+                        if x is node:
+                            break
+                    yield component
@@ -1,11 +1,13 @@
 """Managing graph modification and information about graphs."""
 
 
-from collections import defaultdict, Counter
+from collections import defaultdict, ChainMap, Counter
 
-from ..graph_utils import dfs, FOLLOW, EXCLUDE
+from ..graph_utils import dfs, strongly_connected_components, \
+    FOLLOW, EXCLUDE
 from ..utils import Events, Partializable, OrderedSet
 
+from .anf import ANFNode
 from .utils import succ_deeper
 
 
@@ -203,12 +205,12 @@ class GDepProxStatistic(CounterStatistic):
         if inp.is_constant_graph():
             ig = inp.value
             if self.mod(g1, ParentProxy(ig), direction):
-                self.manager.events.invalidate_nesting()
+                self.manager.events.invalidate_nesting(g1)
 
         g2 = inp.graph
         if g1 and g2 and g1 is not g2:
             if self.mod(g1, g2, direction):
-                self.manager.events.invalidate_nesting()
+                self.manager.events.invalidate_nesting(g1)
 
 
 class GraphsUsedStatistic(CounterStatistic):
@@ -230,15 +232,16 @@ class GraphUsersStatistic(CounterStatistic):
 class NestingStatistic(PerGraphStatistic):
     """Represents a statistic about nesting.
 
-    These statistics become invalid when the `invalidate_nesting` event
-    is fired.
+    These statistics are computed from scratch the first time they are
+    requested. After that, the manager keeps them up to date by calling
+    `update` on the graphs whose nesting may have changed, which are
+    those signalled by the `invalidate_nesting`, `add_graph` and
+    `drop_graph` events.
     """
 
     def __init__(self, manager):
         """Initialize a NestingStatistic."""
         super().__init__(manager)
-        evts = self.manager.events
-        evts.invalidate_nesting.register(self._on_invalidate_nesting)
         self.valid = False
 
     def reset(self):
@@ -249,14 +252,11 @@ class NestingStatistic(PerGraphStatistic):
         super().reset()
         self.valid = False
 
-    def _on_invalidate_nesting(self, event):
-        self.reset()
-
     def _on_add_graph(self, event, graph):
-        self.reset()
+        pass
 
     def _on_drop_graph(self, event, graph):
-        self.reset()
+        pass
 
     def recompute(self):
         """Recompute the information from scratch."""
@@ -266,29 +266,49 @@ class NestingStatistic(PerGraphStatistic):
     def _recompute(self):
         raise NotImplementedError()
 
+    def update(self, graphs):
+        """Recompute the information for the given graphs only.
+
+        Graphs that are no longer managed are removed.
+        """
+        raise NotImplementedError()
+
+    def _live(self, graphs):
+        """Remove dropped graphs and return the others."""
+        live = []
+        for g in graphs:
+            if g in self.manager.graphs:
+                live.append(g)
+            else:
+                self.pop(g, None)
+        return live
+
 
 class GDepTotalStatistic(NestingStatistic):
     """Implements `GraphManager.graph_dependencies_total`."""
 
+    def _seek_parents(self, g, path=None):
+        if path is None:
+            path = set()
+        if g in path:
+            return set()
+        deps = self.manager.graph_dependencies_prox[g]
+        parents = set()
+        for dep in deps:
+            if isinstance(dep, ParentProxy):
+                parents |= self._seek_parents(dep.graph, path | {g})
+            else:
+                parents.add(dep)
+        return parents - {g}
+
     def _recompute(self):
-        all_deps = self.manager.graph_dependencies_prox
-
-        def seek_parents(g, path=None):
-            if path is None:
-                path = set()
-            if g in path:
-                return set()
-            deps = all_deps[g]
-            parents = set()
-            for dep in deps:
-                if isinstance(dep, ParentProxy):
-                    parents |= seek_parents(dep.graph, path | {g})
-                else:
-                    parents.add(dep)
-            return parents - {g}
+        for g in list(self.manager.graph_dependencies_prox.keys()):
+            self[g] = self._seek_parents(g)
 
-        for g in list(all_deps.keys()):
-            self[g] = seek_parents(g)
+    def update(self, graphs):
+        """Recompute the dependencies of the given graphs."""
+        for g in self._live(graphs):
+            self[g] = self._seek_parents(g)
 
 
 class ParentStatistic(NestingStatistic):
@@ -297,9 +317,29 @@ class ParentStatistic(NestingStatistic):
     def _recompute(self):
         for g in self.manager.graphs:
             self[g] = None
+        self._compute(self.manager.graph_dependencies_total,
+                      self.manager.graphs)
+
+    def update(self, graphs):
+        """Recompute the parents of the given graphs.
+
+        The graphs given must be closed under nesting, i.e. they must
+        include all the (previous) children of the graphs they contain.
+
+        Returns:
+            A dict that maps each of the given graphs to its previous
+            parent.
+
+        """
+        old_parents = {g: self.get(g, None) for g in graphs}
+        live = self._live(graphs)
+        for g in live:
+            self[g] = None
+        self._compute(self.manager._graph_dependencies_total, live)
+        return old_parents
 
-        all_deps = self.manager.graph_dependencies_total
-        todo = [(g, set(deps)) for g, deps in all_deps.items()]
+    def _compute(self, all_deps, graphs):
+        todo = [(g, set(all_deps[g])) for g in graphs]
         todo.sort(key=lambda xy: len(xy[1]))
 
         while todo:
@@ -331,12 +371,31 @@ class ChildrenStatistic(NestingStatistic):
 
     def _recompute(self):
         parents = self.manager.parents
-        for g in self.manager.graphs:
+        for g in parents:
             self[g] = set()
         for g, parent in parents.items():
             if parent is not None:
                 self[parent].add(g)
 
+    def update(self, old_parents):
+        """Move the given graphs from their old parent to their new one.
+
+        Arguments:
+            old_parents: A dict that maps graphs to their previous parent,
+                as returned by `ParentStatistic.update`.
+        """
+        parents = self.manager._parents
+        for g in self._live(old_parents):
+            self.setdefault(g, set())
+        for g, old_parent in old_parents.items():
+            new_parent = parents.get(g, None)
+            if old_parent is new_parent:
+                continue
+            if old_parent in self:
+                self[old_parent].discard(g)
+            if new_parent is not None:
+                self.setdefault(new_parent, set()).add(g)
+
 
 class ScopeStatistic(NestingStatistic):
     """Implements `GraphManager.scopes`."""
@@ -351,12 +410,38 @@ class ScopeStatistic(NestingStatistic):
                 self[p].add(g)
                 p = parents[p]
 
+    def update(self, graphs):
+        """Recompute the scopes of the given graphs.
+
+        The graphs given must be closed under ancestry, i.e. they must
+        include all the (previous and new) parents of the graphs they
+        contain.
+        """
+        children = self.manager._children
+        for g in self.manager._deepest_first(self._live(graphs)):
+            scope = {g}
+            for child in children[g]:
+                scope |= self[child]
+            self[g] = scope
+
 
 class FVTotalStatistic(NestingStatistic, CounterStatistic):
-    """Implements `GraphManager.free_variables_total`."""
+    """Implements `GraphManager.free_variables_total`.
+
+    Edges added or removed while the nesting is stable are applied
+    incrementally. Otherwise, the graphs that own them are recorded in
+    `touched` so that they can be updated with the rest of the nesting
+    information.
+    """
+
+    def __init__(self, manager):
+        """Initialize a FVTotalStatistic."""
+        super().__init__(manager)
+        self.touched = OrderedSet()
 
     def _recompute(self):
         mng = self.manager
+        parents = mng.parents
 
         for g in mng.graphs:
             self[g] = {}
@@ -366,18 +451,45 @@ class FVTotalStatistic(NestingStatistic, CounterStatistic):
                 curr = g
                 while curr:
                     self.mod(curr, node, count)
-                    curr = mng.parents[curr]
+                    curr = parents[curr]
                     if node in mng.nodes[curr]:
                         break
 
             for g2, count in mng.graphs_used[g].items():
-                p = mng.parents[g2]
+                p = parents[g2]
                 if p is None:
                     continue
                 curr = g
                 while curr is not p:
                     self.mod(curr, g2, count)
-                    curr = mng.parents[curr]
+                    curr = parents[curr]
+
+    def update(self, graphs):
+        """Recompute the free variables of the given graphs.
+
+        The graphs given must be closed under ancestry. Each graph's free
+        variables are computed from its direct free variables and those of
+        its children, so the graphs are processed from the deepest up.
+        """
+        mng = self.manager
+        parents = mng._parents
+        children = mng._children
+        for g in mng._deepest_first(self._live(graphs)):
+            self[g] = {}
+            for node, count in mng.free_variables_direct[g].items():
+                self.inc(g, node, count)
+            for g2, count in mng.graphs_used[g].items():
+                p = parents[g2]
+                if p is not None and p is not g:
+                    self.inc(g, g2, count)
+            for child in children[g]:
+                for fv, count in self[child].items():
+                    if isinstance(fv, ANFNode):
+                        owner = fv.graph
+                    else:
+                        owner = parents[fv]
+                    if owner is not g:
+                        self.inc(g, fv, count)
 
     def _on_mod_edge(self, event, node, key, inp, direction):
         if not self.valid:
@@ -385,18 +497,23 @@ class FVTotalStatistic(NestingStatistic, CounterStatistic):
 
         g1 = node.graph
 
+        if self.manager._nesting_changes:
+            self.touched.add(g1)
+            return
+
+        parents = self.manager._parents
+
         def _update(stop_graph, fv):
             curr = g1
             while curr and curr is not stop_graph:
                 self.mod(curr, fv, direction)
-                curr = self.manager.parents[curr]
+                curr = parents[curr]
 
         if inp.is_constant_graph():
             ig = inp.value
-            if self.manager._parents.valid:
-                p = self.manager._parents[ig]
-                if p:
-                    _update(p, ig)
+            p = parents[ig]
+            if p:
+                _update(p, ig)
 
         g2 = inp.graph
         if g1 and g2 and g1 is not g2:
@@ -404,42 +521,173 @@ class FVTotalStatistic(NestingStatistic, CounterStatistic):
 
 
 class GraphsReachableStatistic(NestingStatistic):
-    """Implements `GraphManager.graphs_reachable`."""
+    """Implements `GraphManager.graphs_reachable`.
+
+    The graphs are grouped in strongly connected components according to
+    `graphs_used`. All graphs in a component can reach the same graphs, so
+    they share the same set, and the sets are computed on the condensation
+    of the graph of uses, in reverse topological order.
+
+    When a graph starts using another, the sets of the graphs that can reach
+    it are extended right away, and components are merged if a cycle is
+    formed. When a graph stops using another, it is recorded in `dirty` and
+    the components of the graphs that can reach it are recomputed the next
+    time the statistic is requested.
+    """
+
+    constructor = set
+
+    def __init__(self, manager):
+        """Initialize a GraphsReachableStatistic."""
+        super().__init__(manager)
+        self.dirty = OrderedSet()
+
+    def reset(self):
+        """Reset this graph's information."""
+        super().reset()
+        self.dirty = OrderedSet()
+
+    def _on_add_graph(self, event, graph):
+        if self.valid:
+            self[graph] = self.constructor()
+
+    def _on_drop_graph(self, event, graph):
+        self.pop(graph, None)
+
+    def _on_add_edge(self, event, node, key, inp):
+        if not self.valid or not inp.is_constant_graph():
+            return
+        g = node.graph
+        if self.manager.graphs_used[g][inp.value] > 1:
+            return
+        if self.dirty:
+            self.dirty.add(g)
+        else:
+            self._add_use(g, inp.value)
+
+    def _on_drop_edge(self, event, node, key, inp):
+        if not self.valid or not inp.is_constant_graph():
+            return
+        g = node.graph
+        if inp.value not in self.manager.graphs_used[g]:
+            self.dirty.add(g)
+
+    def _add_use(self, g, h):
+        """Update the information when g starts using h."""
+        if h in self[g]:
+            return
+        new = self[h] | {h}
+
+        if g in new:
+            # The graphs that h reaches and that reach g form a cycle with g
+            cycle = [x for x in new if x is g or g in self[x]]
+        else:
+            cycle = []
+
+        # Add new to the sets of all graphs that can reach g, except those
+        # that could already reach h. Since graphs share their component's
+        # set, we check whether a set was already extended here.
+        users = self.manager.graph_users
+        extended = set()
+        seen = {g}
+        todo = [g]
+        while todo:
+            x = todo.pop()
+            reach = self[x]
+            if id(reach) not in extended:
+                reach |= new
+                extended.add(id(reach))
+            for user in users[x]:
+                if user not in seen:
+                    seen.add(user)
+                    reach = self[user]
+                    if id(reach) in extended or h not in reach:
+                        todo.append(user)
+
+        if cycle:
+            reach = self[g]
+            for x in cycle:
+                self[x] = reach
+            if self.manager._recursive.valid:
+                self.manager._recursive.update(cycle)
+
+    def _compute(self, graphs, succ):
+        used = self.manager.graphs_used
+        for component in strongly_connected_components(graphs, succ):
+            reach = set()
+            for g in component:
+                for g2 in used[g]:
+                    reach.add(g2)
+                    if g2 in self:
+                        reach |= self[g2]
+            for g in component:
+                self[g] = reach
 
     def _recompute(self):
         used = self.manager.graphs_used
-        for g, gs in used.items():
-            self[g] = set(gs)
-        changes = True
-        while changes:
-            changes = False
-            for g, gs in self.items():
-                prev = len(gs)
-                accum = set()
-                for g2 in gs:
-                    accum |= self[g2]
-                gs |= accum
-                if len(gs) > prev:
-                    changes = True
+        self._compute(used, used.__getitem__)
+
+    def update(self, graphs):
+        """Recompute the sets of the graphs that can reach the given graphs.
+
+        Returns:
+            The graphs that were recomputed.
+
+        """
+        used = self.manager.graphs_used
+        users = self.manager.graph_users
+        affected = OrderedSet()
+        todo = list(graphs)
+        while todo:
+            g = todo.pop()
+            if g not in affected:
+                affected.add(g)
+                todo.extend(users.get(g, ()))
+        live = self._live(affected)
+        for g in live:
+            self.pop(g, None)
+        self._compute(live,
+                      lambda g: [g2 for g2 in used[g] if g2 in affected])
+        return live
 
 
 class RecursiveStatistic(NestingStatistic):
-    """Implements `GraphManager.recursive`."""
+    """Implements `GraphManager.recursive`.
+
+    This is updated along with `graphs_reachable`.
+    """
+
+    constructor = bool
+
+    def _on_add_graph(self, event, graph):
+        if self.valid:
+            self[graph] = self.constructor()
+
+    def _on_drop_graph(self, event, graph):
+        self.pop(graph, None)
 
     def _recompute(self):
         reach = self.manager.graphs_reachable
         for g, gs in reach.items():
             self[g] = g in gs
 
+    def update(self, graphs):
+        """Recompute whether the given graphs are recursive."""
+        reach = self.manager._graphs_reachable
+        for g in self._live(graphs):
+            self[g] = g in reach[g]
+
 
 class GraphManager(Partializable):
     """Structure to hold information about graphs and modify them.
 
     Attributes are updated incrementally when graph mutations are committed.
 
-    Properties are updated incrementally when possible, but may be invalidated
-    when graph dependencies change. In that case they will be recomputed lazily
-    the next time they are requested.
+    Properties are computed lazily the first time they are requested. After
+    that, they are updated incrementally. When graph dependencies change, the
+    affected graphs are recorded and only their information (and that of the
+    graphs that nest them or are nested in them) is recomputed the next time
+    a property is requested.
 
     Attributes:
         all_nodes:
@@ -498,6 +746,8 @@ class GraphManager(Partializable):
             drop_edge=None,
             invalidate_nesting=None,
         )
+        self.events.invalidate_nesting.register(self._on_invalidate_nesting)
+        self._nesting_changes = OrderedSet()
         roots = OrderedSet(self.roots) if self.roots else OrderedSet()
         self.roots = OrderedSet()
         self.graphs = OrderedSet()
@@ -531,6 +781,7 @@ class GraphManager(Partializable):
         if graph in self.graphs:
             return
         self._ensure_graph(graph)
+        self._nesting_changes.add(graph)
         self.events.add_graph(graph)
         self._acquire_nodes(graph.parameters)
         self._acquire_nodes({graph.return_})
@@ -580,6 +831,7 @@ class GraphManager(Partializable):
             todo |= self._maybe_drop_nodes(OrderedSet([graph.return_]))
 
         for g in dropped:
+            self._nesting_changes.add(g)
             self.events.drop_graph(g)
             self.all_nodes.difference_update(g.parameters)
             self.graphs.remove(g)
@@ -667,11 +919,113 @@ class GraphManager(Partializable):
 
         return graphs_to_check
 
+    def _on_invalidate_nesting(self, event, graph):
+        self._nesting_changes.add(graph)
+
     def _ensure_statistic(self, stat):
+        if self._nesting_changes:
+            self._update_nesting()
+        if self._graphs_reachable.dirty:
+            self._update_reachability()
         if not stat.valid:
             stat.recompute()
         return stat
 
+    def _ancestors(self, graphs, parents):
+        """Return the given graphs along with all of their ancestors."""
+        results = OrderedSet()
+        for g in graphs:
+            while g is not None and g not in results:
+                results.add(g)
+                g = parents.get(g, None)
+        return results
+
+    def _deepest_first(self, graphs):
+        """Sort graphs so that children come before their parents."""
+        parents = self._parents
+
+        def depth(g):
+            d = 0
+            while g is not None:
+                g = parents[g]
+                d += 1
+            return d
+
+        return sorted(graphs, key=depth, reverse=True)
+
+    def _update_reachability(self):
+        """Update graphs_reachable and recursive after uses were removed."""
+        reachable = self._graphs_reachable
+        dirty, reachable.dirty = reachable.dirty, OrderedSet()
+        changed = reachable.update(dirty)
+        if self._recursive.valid:
+            self._recursive.update(changed)
+
+    def _update_nesting(self):
+        """Update the nesting statistics that have already been computed.
+
+        Only the graphs affected by the changes recorded since the last update
+        are recomputed.
+        """
+        changes, self._nesting_changes = self._nesting_changes, OrderedSet()
+        fvtotal = self._free_variables_total
+        touched, fvtotal.touched = fvtotal.touched, OrderedSet()
+
+        if not self._graph_dependencies_total.valid:
+            return
+
+        # The total dependencies of a graph depend on the graphs it uses,
+        # so they change for all graphs that can reach a changed graph.
+        users = self.graph_users
+        affected = OrderedSet()
+        todo = list(changes)
+        while todo:
+            g = todo.pop()
+            if g not in affected:
+                affected.add(g)
+                todo.extend(users.get(g, ()))
+        self._graph_dependencies_total.update(affected)
+
+        if not self._parents.valid:
+            return
+        if not self._children.valid:
+            # This gives us the children before the changes, which we need
+            # to find the graphs whose parent may change.
+            self._children.recompute()
+
+        # A graph's parent may change if its dependencies changed, or if the
+        # parent of one of its dependencies changed. Dependencies of a graph
+        # are always its ancestors, so this is closed under nesting.
+        nested = OrderedSet()
+        todo = list(affected)
+        while todo:
+            g = todo.pop()
+            if g not in nested:
+                nested.add(g)
+                todo.extend(self._children.get(g, ()))
+        old_parents = self._parents.update(nested)
+        self._children.update(old_parents)
+
+        # Scopes and free variables change for the graphs that gained or lost
+        # a descendant, i.e. the previous and new ancestors of moved graphs.
+        scoped = self._ancestors(old_parents.values(),
+                                 ChainMap(old_parents, self._parents))
+        scoped |= self._ancestors(nested, self._parents)
+        if self._scopes.valid:
+            self._scopes.update(scoped)
+
+        if fvtotal.valid:
+            # Free variables also change for graphs whose direct free
+            # variables were not applied incrementally, and for users of
+            # graphs that moved, since the owner of a graph constant is the
+            # parent of the graph.
+            for g in nested:
+                touched.update(users.get(g, ()))
+            scoped |= self._ancestors(
+                [g for g in touched if g in self.graphs], self._parents
+            )
+            fvtotal.update(scoped)
+
     @property
     def graph_dependencies_total(self):
         """Map each graph to the set of graphs it depends on.
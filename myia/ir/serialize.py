@@ -0,0 +1,866 @@
+"""Binary serialization of graphs.
+
+A cluster of graphs, made of root graphs and all the graphs they refer to
+through constants, free variables or abstract values, is written as a
+sequence of tables in which every reference is an index into a table:
+
+* The header: the magic bytes `MYIR`, the format VERSION, the number of
+  graphs, the indices of the roots and the number of nodes.
+* The strings, each stored once.
+* The kind of each node and, for parameters and applications, the graph
+  it belongs to. The nesting of graphs follows from it, as the graph of a
+  free variable is the one its user is nested in.
+* The values: constants, types and abstract values. Each distinct value is
+  stored once, and may refer to the values before it, to graphs and to
+  nodes.
+* The debug information: names, locations and `about` relations.
+* The graphs: flags, parameters and return node.
+* The nodes: debug information, abstract value, and the value of each
+  constant or the inputs of each application.
+
+The tables of kinds, debug information, graphs and nodes are arrays of
+integers as wide as their largest integer needs, so that they are encoded
+and decoded at once, and the values are written with variable-length
+integers, so that most indices take one byte. Everything is written and
+read in one pass.
+
+Constants may be graphs, primitives, Python literals, lists and dicts,
+numpy arrays and scalars, Myia types, symbolic keys, and the classes,
+functions and other objects that can be found by name in their module.
+Other values must be encoded by the caller, with the `encode` function
+given to `dump`, into a key that is itself serializable, and that the
+`decode` function given to `load` maps back to a value.
+
+Abstract values are stored with all their tracks, but not the contexts
+of their functions, which are loaded with an empty context: contexts
+describe the inference of the graphs from before specialization, and are
+of no use once the graphs are specialized. The tracking ids that are
+nodes from outside of the cluster are dropped.
+
+The AST nodes of locations (or lists of nodes, for blocks of statements)
+are replaced by empty nodes of the same classes, which are only good to
+tell what kind of node a location is about.
+"""
+
+import ast
+import io
+import struct
+import sys
+from array import array
+from dataclasses import is_dataclass
+from importlib import import_module
+
+import numpy
+
+from .. import dtype
+from ..graph_utils import EXCLUDE, FOLLOW, dfs
+from ..info import About, NamedDebugInfo
+from ..prim import Primitive, ops as primops
+from ..utils import Named, SymbolicKeyInstance
+from .anf import ANFNode, Apply, Constant, Graph, Parameter
+from .utils import succ_deeper
+
+
+VERSION = 2
+MAGIC = b'MYIR'
+
+
+# Value tags
+(_NONE, _TRUE, _FALSE, _INT, _FLOAT, _COMPLEX, _STR, _BYTES, _ELLIPSIS,
+ _TUPLE, _LIST, _DICT, _GRAPH, _NODE, _PRIM, _GLOBAL, _DTYPE, _CLASSTAG,
+ _NDARRAY, _NPSCALAR, _SYMKEY, _EXTERNAL,
+ _A_SCALAR, _A_ARRAY, _A_TUPLE, _A_LIST, _A_CLASS, _A_JTAGGED, _A_TYPE,
+ _A_ERROR, _A_FUNCTION,
+ _F_GRAPH, _F_METAGRAPH, _F_PRIM, _F_PARTIAL, _F_J, _F_VIRTUAL, _F_TYPED,
+ _F_DUMMY) = range(39)
+
+
+# Node kinds
+_CONSTANT, _PARAMETER, _APPLY = range(3)
+
+
+# Modules in which to look for the objects that have no qualified name,
+# such as ANYTHING or the MetaGraphs
+_global_modules = (
+    'myia.abstract.data',
+    'myia.composite',
+    'myia.hypermap',
+    'myia.jvp',
+    'myia.operations',
+    'myia.utils.misc',
+)
+_globals = None
+
+
+def _lookup_global(mod, name):
+    try:
+        rval = import_module(mod)
+        for part in name.split('.'):
+            rval = getattr(rval, part)
+    except (ImportError, AttributeError):
+        return None
+    return rval
+
+
+def _find_global(value):
+    """Return the module and the name under which value can be found."""
+    mod = getattr(value, '__module__', None)
+    name = getattr(value, '__qualname__', None)
+    if isinstance(mod, str) and isinstance(name, str) \
+            and _lookup_global(mod, name) is value:
+        return mod, name
+    global _globals
+    if _globals is None:
+        _globals = {}
+        for modname in _global_modules:
+            for k, v in vars(import_module(modname)).items():
+                _globals.setdefault(id(v), (v, modname, k))
+    entry = _globals.get(id(value), None)
+    if entry is not None and entry[0] is value:
+        return entry[1:]
+    return None
+
+
+_primitives = {p.name: p for p in vars(primops).values()
+               if isinstance(p, Primitive)}
+
+
+def _ast_name(node):
+    if node is None:
+        return None
+    elif isinstance(node, list):
+        return tuple(map(_ast_name, node))
+    return type(node).__name__
+
+
+def _ast_node(name):
+    if name is None:
+        return None
+    elif isinstance(name, tuple):
+        return list(map(_ast_node, name))
+    return getattr(ast, name)()
+
+
+# Typecodes of arrays of unsigned integers, with the largest integer each
+# can hold
+_widths = [(code, 256 ** array(code).itemsize - 1) for code in 'BHIQ']
+
+
+def _encode_uints(ints):
+    """Encode a list of unsigned integers as an array.
+
+    The array's type is the smallest one that holds all the integers, so
+    that it can be encoded and decoded at once.
+    """
+    top = max(ints, default=0)
+    for code, limit in _widths:
+        if top <= limit:
+            arr = array(code, ints)
+            if sys.byteorder == 'big':
+                arr.byteswap()
+            return code.encode() + arr.tobytes()
+    raise OverflowError(f'Integer {top} is too large')
+
+
+def _decode_uints(data):
+    """Decode the integers encoded by `_encode_uints`."""
+    arr = array(chr(data[0]))
+    arr.frombytes(data[1:])
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr.tolist()
+
+
+class _Writer:
+    """Buffer to encode data into."""
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def uint(self, n):
+        buf = self.buf
+        while n >= 0x80:
+            buf.append((n & 0x7f) | 0x80)
+            n >>= 7
+        buf.append(n)
+
+    def int(self, n):
+        self.uint(n << 1 if n >= 0 else ((-n) << 1) - 1)
+
+    def uints(self, seq):
+        self.uint(len(seq))
+        for n in seq:
+            self.uint(n)
+
+    def bytes(self, data):
+        self.uint(len(data))
+        self.buf += data
+
+    def section(self, ints):
+        """Write a list of unsigned integers."""
+        self.bytes(_encode_uints(ints))
+
+
+class _Reader:
+    """Decoder for the data written with a _Writer."""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def uint(self):
+        data = self.data
+        pos = self.pos
+        b = data[pos]
+        pos += 1
+        n = b & 0x7f
+        shift = 7
+        while b & 0x80:
+            b = data[pos]
+            pos += 1
+            n |= (b & 0x7f) << shift
+            shift += 7
+        self.pos = pos
+        return n
+
+    def int(self):
+        n = self.uint()
+        return -((n + 1) >> 1) if n & 1 else n >> 1
+
+    def uints(self):
+        return [self.uint() for _ in range(self.uint())]
+
+    def raw(self, n):
+        pos = self.pos
+        self.pos = pos + n
+        if self.pos > len(self.data):
+            raise ValueError('Truncated data')
+        return bytes(self.data[pos:self.pos])
+
+    def bytes(self):
+        return self.raw(self.uint())
+
+    def section(self):
+        """Read a list of unsigned integers."""
+        return _decode_uints(self.bytes())
+
+
+class _Dumper:
+    def __init__(self, encode):
+        self.encode = encode
+        self.strings = {}
+        self.values = {}
+        self.value_data = []
+        self.value_cache = {}
+        self.keep = []
+        self.debug = {}
+        self.debug_data = []
+        self.graphs = {}
+        self.nodes = {}
+
+    def string(self, s):
+        idx = self.strings.get(s, None)
+        if idx is None:
+            idx = len(self.strings)
+            self.strings[s] = idx
+        return idx
+
+    def value(self, v):
+        idx = self.value_cache.get(id(v), None)
+        if idx is None:
+            w = _Writer()
+            self.write_value(w, v)
+            data = bytes(w.buf)
+            idx = self.values.get(data, None)
+            if idx is None:
+                idx = len(self.value_data)
+                self.values[data] = idx
+                self.value_data.append(data)
+            self.value_cache[id(v)] = idx
+            # The id of v may not be reused while the cache is in use
+            self.keep.append(v)
+        return idx
+
+    def tracking_id(self, tid):
+        if isinstance(tid, ANFNode) and tid not in self.nodes:
+            tid = None
+        return self.value(tid)
+
+    def write_value(self, w, v):
+        t = type(v)
+        if v is None:
+            w.uint(_NONE)
+        elif v is True:
+            w.uint(_TRUE)
+        elif v is False:
+            w.uint(_FALSE)
+        elif t is int:
+            w.uint(_INT)
+            w.int(v)
+        elif t is float:
+            w.uint(_FLOAT)
+            w.buf += struct.pack('<d', v)
+        elif t is complex:
+            w.uint(_COMPLEX)
+            w.buf += struct.pack('<dd', v.real, v.imag)
+        elif t is str:
+            w.uint(_STR)
+            w.uint(self.string(v))
+        elif t is bytes:
+            w.uint(_BYTES)
+            w.bytes(v)
+        elif v is Ellipsis:
+            w.uint(_ELLIPSIS)
+        elif t is tuple or t is list:
+            elems = [self.value(x) for x in v]
+            w.uint(_TUPLE if t is tuple else _LIST)
+            w.uints(elems)
+        elif t is dict:
+            items = [(self.value(k), self.value(x)) for k, x in v.items()]
+            w.uint(_DICT)
+            w.uint(len(items))
+            for k, x in items:
+                w.uint(k)
+                w.uint(x)
+        elif t is Graph:
+            if v not in self.graphs:
+                raise TypeError(f'Cannot serialize {v}, which is not part'
+                                f' of the serialized graphs')
+            w.uint(_GRAPH)
+            w.uint(self.graphs[v])
+        elif isinstance(v, ANFNode):
+            if v not in self.nodes:
+                raise TypeError(f'Cannot serialize node {v}, which is not'
+                                f' part of the serialized graphs')
+            w.uint(_NODE)
+            w.uint(self.nodes[v])
+        elif isinstance(v, Primitive) and _primitives.get(v.name) is v:
+            w.uint(_PRIM)
+            w.uint(self.string(v.name))
+        elif dtype.ismyiatype(v, generic=False):
+            generic = self.value(v.generic)
+            params = self.value(list(v._params.values()))
+            w.uint(_DTYPE)
+            w.uint(generic)
+            w.uint(params)
+        elif t is Named and v in dtype.tag_to_dataclass:
+            cls = self.value(dtype.tag_to_dataclass[v])
+            w.uint(_CLASSTAG)
+            w.uint(cls)
+        elif t is numpy.ndarray:
+            shape = self.value(v.shape)
+            w.uint(_NDARRAY)
+            w.uint(self.string(v.dtype.str))
+            w.uint(shape)
+            w.bytes(numpy.ascontiguousarray(v).tobytes())
+        elif isinstance(v, numpy.generic):
+            w.uint(_NPSCALAR)
+            w.uint(self.string(v.dtype.str))
+            w.bytes(v.tobytes())
+        elif t is SymbolicKeyInstance:
+            node = self.value(v.node)
+            abstract = self.value(v.abstract)
+            w.uint(_SYMKEY)
+            w.uint(node)
+            w.uint(abstract)
+        else:
+            self.write_other(w, v)
+
+    def write_other(self, w, v):
+        from ..abstract import data as D
+        from ..abstract.ref import CONTEXTLESS
+        t = type(v)
+        if t in (D.AbstractScalar, D.AbstractType, D.AbstractError):
+            values = self.value(dict(v.values))
+            w.uint({D.AbstractScalar: _A_SCALAR,
+                    D.AbstractType: _A_TYPE,
+                    D.AbstractError: _A_ERROR}[t])
+            w.uint(values)
+        elif t in (D.AbstractArray, D.AbstractList, D.AbstractJTagged):
+            element = self.value(v.element)
+            values = self.value(dict(v.values))
+            w.uint({D.AbstractArray: _A_ARRAY,
+                    D.AbstractList: _A_LIST,
+                    D.AbstractJTagged: _A_JTAGGED}[t])
+            w.uint(element)
+            w.uint(values)
+        elif t is D.AbstractTuple:
+            elements = self.value(v.elements)
+            values = self.value(dict(v.values))
+            w.uint(_A_TUPLE)
+            w.uint(elements)
+            w.uint(values)
+        elif t is D.AbstractClass:
+            fields = [self.value(x) for x in
+                      (v.tag, v.attributes, v.methods, dict(v.values))]
+            w.uint(_A_CLASS)
+            for x in fields:
+                w.uint(x)
+        elif t is D.AbstractFunction:
+            poss = v.get_sync()
+            if not isinstance(poss, D.Possibilities):
+                raise TypeError(f'Cannot serialize {v}')
+            # The possibilities are sorted so that equal sets are encoded
+            # the same way
+            fns = sorted(self.value(fn) for fn in poss)
+            w.uint(_A_FUNCTION)
+            w.uints(fns)
+        elif t is D.GraphFunction or t is D.MetaGraphFunction:
+            fn = self.value(v.graph if t is D.GraphFunction else v.metagraph)
+            tid = self.tracking_id(v.tracking_id)
+            w.uint(_F_GRAPH if t is D.GraphFunction else _F_METAGRAPH)
+            w.uint(fn)
+            w.uint(v.context is CONTEXTLESS)
+            w.uint(tid)
+        elif t is D.PrimitiveFunction:
+            prim = self.value(v.prim)
+            tid = self.tracking_id(v.tracking_id)
+            w.uint(_F_PRIM)
+            w.uint(prim)
+            w.uint(tid)
+        elif t is D.PartialApplication:
+            fn = self.value(v.fn)
+            args = self.value(v.args)
+            w.uint(_F_PARTIAL)
+            w.uint(fn)
+            w.uint(args)
+        elif t is D.JTransformedFunction:
+            fn = self.value(v.fn)
+            w.uint(_F_J)
+            w.uint(fn)
+        elif t is D.VirtualFunction:
+            args = self.value(v.args)
+            output = self.value(v.output)
+            w.uint(_F_VIRTUAL)
+            w.uint(args)
+            w.uint(output)
+        elif t is D.TypedPrimitive:
+            prim = self.value(v.prim)
+            args = self.value(v.args)
+            output = self.value(v.output)
+            w.uint(_F_TYPED)
+            w.uint(prim)
+            w.uint(args)
+            w.uint(output)
+        elif t is D.DummyFunction:
+            w.uint(_F_DUMMY)
+        else:
+            glob = _find_global(v)
+            if glob is not None:
+                w.uint(_GLOBAL)
+                w.uint(self.string(glob[0]))
+                w.uint(self.string(glob[1]))
+                return
+            key = self.encode(v) if self.encode else None
+            if key is None:
+                raise TypeError(f'Cannot serialize {v}')
+            key = self.value(key)
+            w.uint(_EXTERNAL)
+            w.uint(key)
+
+    def debug_index(self, info):
+        idx = self.debug.get(id(info), None)
+        if idx is None:
+            idx = len(self.debug_data)
+            self.debug[id(info)] = idx
+            self.debug_data.append(None)
+            self.keep.append(info)
+            name = getattr(info, 'name', None)
+            entry = [0 if name is None else self.string(name) + 1]
+            about = getattr(info, 'about', None)
+            if about is None:
+                entry.append(0)
+            else:
+                entry += (self.debug_index(about.debug) + 1,
+                          self.value(about.relation))
+            loc = getattr(info, 'location', None)
+            if loc is None:
+                entry.append(0)
+            else:
+                entry += (1, self.string(loc.filename), loc.line,
+                          loc.column, loc.line_end, loc.column_end,
+                          self.value(_ast_name(loc.node)))
+            entry.append(self.value(_ast_name(getattr(info, 'ast', None))))
+            self.debug_data[idx] = entry
+        return idx
+
+    def collect(self, roots):
+        """Find the graphs and the nodes of the cluster.
+
+        The graphs in abstract values and symbolic keys are included, so
+        that the graphs in the functions of specialized graphs' abstract
+        values, which are the graphs from before specialization, are kept.
+        """
+        from ..abstract import data as D
+        graphs = dict.fromkeys(roots)
+        nodes = []
+        seen = set()
+        seen_values = set()
+        todo = list(roots)
+        extra = []
+
+        def add_graph(g, queue=todo):
+            if g not in graphs:
+                graphs[g] = None
+                queue.append(g)
+
+        def walk(v):
+            if isinstance(v, (tuple, list, D.Possibilities)):
+                for x in v:
+                    walk(x)
+            elif isinstance(v, dict):
+                for x in v.values():
+                    walk(x)
+            elif isinstance(v, Graph):
+                add_graph(v, extra)
+            elif isinstance(v, (D.AbstractBase, D.Function,
+                                SymbolicKeyInstance)):
+                if id(v) in seen_values:
+                    return
+                seen_values.add(id(v))
+                self.keep.append(v)
+                if isinstance(v, SymbolicKeyInstance):
+                    if isinstance(v.node, ANFNode) and v.node.graph:
+                        add_graph(v.node.graph, extra)
+                    walk(v.abstract)
+                elif is_dataclass(v):
+                    for name in v.__dataclass_fields__:
+                        if name not in ('context', 'tracking_id'):
+                            walk(getattr(v, name))
+                else:
+                    walk(v.__dict__)
+
+        def include(node):
+            return EXCLUDE if node in seen else FOLLOW
+
+        while todo or extra:
+            # The graphs found through the abstract values, which may be
+            # in any order, come after the graphs used by the roots
+            g = todo.pop() if todo else extra.pop()
+            for node in dfs(g.return_, succ_deeper, include):
+                if node.is_special():
+                    raise TypeError(f'Cannot serialize special node {node}')
+                seen.add(node)
+                nodes.append(node)
+                if node.graph is not None:
+                    add_graph(node.graph)
+                if node.is_constant_graph():
+                    add_graph(node.value)
+                walk(node.abstract)
+                if node.is_constant():
+                    walk(node.value)
+        self.graphs = {g: i for i, g in enumerate(graphs)}
+        for g in self.graphs:
+            nodes += [p for p in g.parameters if p not in seen]
+        self.nodes = {node: i for i, node in enumerate(nodes)}
+        return nodes
+
+    def run(self, roots, file):
+        nodes = self.collect(roots)
+        graphs = self.graphs
+        node_index = self.nodes
+
+        kinds = []
+        for node in nodes:
+            if node.is_constant():
+                kinds.append(_CONSTANT)
+            else:
+                kinds += (_PARAMETER if node.is_parameter() else _APPLY,
+                          graphs[node.graph])
+
+        tail = []
+        for g in graphs:
+            tail += (self.debug_index(g.debug), self.value(g.flags),
+                     len(g.parameters))
+            tail += [node_index[p] for p in g.parameters]
+            tail.append(node_index[g.return_])
+        for node in nodes:
+            a = node.abstract
+            tail += (self.debug_index(node.debug),
+                     0 if a is None else self.value(a) + 1)
+            if node.is_constant():
+                tail.append(self.value(node.value))
+            elif node.is_apply():
+                tail.append(len(node.inputs))
+                tail += [node_index[i] for i in node.inputs]
+        debug = [len(self.debug_data)]
+        for entry in self.debug_data:
+            debug += entry
+
+        head = _Writer()
+        head.buf += MAGIC
+        head.uint(VERSION)
+        head.uint(len(graphs))
+        head.uints([graphs[g] for g in dict.fromkeys(roots)])
+        head.uint(len(nodes))
+        strings = [s.encode('utf8') for s in self.strings]
+        head.section([len(s) for s in strings])
+        head.bytes(b''.join(strings))
+        head.section(kinds)
+        head.uint(len(self.value_data))
+        file.write(head.buf)
+        file.write(b''.join(self.value_data))
+        end = _Writer()
+        end.section(debug)
+        end.section(tail)
+        file.write(end.buf)
+
+
+class _Loader:
+    def __init__(self, data, decode):
+        self.r = _Reader(data)
+        self.decode = decode
+
+    def read_value(self):
+        r = self.r
+        values = self.values
+        tag = r.uint()
+        if tag == _NONE:
+            return None
+        elif tag == _TRUE:
+            return True
+        elif tag == _FALSE:
+            return False
+        elif tag == _INT:
+            return r.int()
+        elif tag == _FLOAT:
+            return struct.unpack('<d', r.raw(8))[0]
+        elif tag == _COMPLEX:
+            return complex(*struct.unpack('<dd', r.raw(16)))
+        elif tag == _STR:
+            return self.strings[r.uint()]
+        elif tag == _BYTES:
+            return r.bytes()
+        elif tag == _ELLIPSIS:
+            return Ellipsis
+        elif tag == _TUPLE:
+            return tuple(values[i] for i in r.uints())
+        elif tag == _LIST:
+            return [values[i] for i in r.uints()]
+        elif tag == _DICT:
+            rval = {}
+            for _ in range(r.uint()):
+                k = values[r.uint()]
+                rval[k] = values[r.uint()]
+            return rval
+        elif tag == _GRAPH:
+            return self.graphs[r.uint()]
+        elif tag == _NODE:
+            return self.nodes[r.uint()]
+        elif tag == _PRIM:
+            return _primitives[self.strings[r.uint()]]
+        elif tag == _GLOBAL:
+            mod = self.strings[r.uint()]
+            name = self.strings[r.uint()]
+            rval = _lookup_global(mod, name)
+            if rval is None:
+                raise ValueError(f'Cannot find {name} in {mod}')
+            return rval
+        elif tag == _DTYPE:
+            generic = values[r.uint()]
+            params = values[r.uint()]
+            return generic.make_subtype(**dict(zip(generic._fields, params)))
+        elif tag == _CLASSTAG:
+            return dtype.pytype_to_myiatype(values[r.uint()]).tag
+        elif tag == _NDARRAY:
+            dt = numpy.dtype(self.strings[r.uint()])
+            shape = values[r.uint()]
+            return numpy.frombuffer(r.bytes(), dt).reshape(shape).copy()
+        elif tag == _NPSCALAR:
+            dt = numpy.dtype(self.strings[r.uint()])
+            return numpy.frombuffer(r.bytes(), dt)[0]
+        elif tag == _SYMKEY:
+            node = values[r.uint()]
+            return SymbolicKeyInstance(node, values[r.uint()])
+        elif tag == _EXTERNAL:
+            if self.decode is None:
+                raise ValueError('A decode function is required')
+            return self.decode(values[r.uint()])
+        return self.read_other(tag)
+
+    def read_other(self, tag):
+        from ..abstract import data as D
+        from ..abstract.ref import Context, CONTEXTLESS
+        r = self.r
+        values = self.values
+        if tag == _A_SCALAR:
+            return D.AbstractScalar(values[r.uint()]).intern()
+        elif tag == _A_TYPE or tag == _A_ERROR:
+            cls = D.AbstractType if tag == _A_TYPE else D.AbstractError
+            return cls(values[r.uint()][D.VALUE]).intern()
+        elif tag == _A_ARRAY or tag == _A_LIST:
+            cls = D.AbstractArray if tag == _A_ARRAY else D.AbstractList
+            element = values[r.uint()]
+            return cls(element, values[r.uint()]).intern()
+        elif tag == _A_JTAGGED:
+            element = values[r.uint()]
+            r.uint()
+            return D.AbstractJTagged(element).intern()
+        elif tag == _A_TUPLE:
+            elements = values[r.uint()]
+            return D.AbstractTuple(elements, values[r.uint()]).intern()
+        elif tag == _A_CLASS:
+            fields = [values[r.uint()] for _ in range(4)]
+            return D.AbstractClass(*fields).intern()
+        elif tag == _A_FUNCTION:
+            return D.AbstractFunction(*[values[i] for i in r.uints()])
+        elif tag == _F_GRAPH or tag == _F_METAGRAPH:
+            fn = values[r.uint()]
+            ctx = CONTEXTLESS if r.uint() else Context.empty()
+            tid = values[r.uint()]
+            if tag == _F_GRAPH:
+                return D.GraphFunction(fn, ctx, tid)
+            return D.MetaGraphFunction(fn, ctx, tid)
+        elif tag == _F_PRIM:
+            prim = values[r.uint()]
+            return D.PrimitiveFunction(prim, values[r.uint()])
+        elif tag == _F_PARTIAL:
+            fn = values[r.uint()]
+            return D.PartialApplication(fn, values[r.uint()])
+        elif tag == _F_J:
+            return D.JTransformedFunction(values[r.uint()])
+        elif tag == _F_VIRTUAL:
+            args = values[r.uint()]
+            return D.VirtualFunction(args, values[r.uint()])
+        elif tag == _F_TYPED:
+            prim = values[r.uint()]
+            args = values[r.uint()]
+            return D.TypedPrimitive(prim, args, values[r.uint()])
+        elif tag == _F_DUMMY:
+            return D.DummyFunction()
+        raise ValueError(f'Invalid value tag {tag}')
+
+    def run(self):
+        from ..parser import Location
+        r = self.r
+        if r.raw(len(MAGIC)) != MAGIC:
+            raise ValueError('Not a serialized graph')
+        version = r.uint()
+        if version != VERSION:
+            raise ValueError(f'Unsupported serialization version {version}')
+        self.graphs = graphs = [Graph() for _ in range(r.uint())]
+        roots = [graphs[i] for i in r.uints()]
+        nnodes = r.uint()
+        sizes = r.section()
+        blob = r.bytes()
+        self.strings = strings = []
+        pos = 0
+        for size in sizes:
+            strings.append(str(blob[pos:pos + size], 'utf8'))
+            pos += size
+
+        # Constants get their values once the values are loaded
+        self.nodes = nodes = []
+        nxt = iter(r.section()).__next__
+        for _ in range(nnodes):
+            kind = nxt()
+            if kind == _CONSTANT:
+                nodes.append(Constant(None))
+            elif kind == _PARAMETER:
+                nodes.append(Parameter(graphs[nxt()]))
+            else:
+                nodes.append(Apply([], graphs[nxt()]))
+
+        self.values = values = []
+        for _ in range(r.uint()):
+            values.append(self.read_value())
+
+        nxt = iter(r.section()).__next__
+        debug_data = []
+        for _ in range(nxt()):
+            name = nxt()
+            about = nxt()
+            if about:
+                about = (about - 1, values[nxt()])
+            if nxt():
+                loc = (strings[nxt()], nxt(), nxt(), nxt(), nxt(),
+                       values[nxt()])
+            else:
+                loc = None
+            debug_data.append((name, about, loc, values[nxt()]))
+        infos = [None] * len(debug_data)
+
+        nxt = iter(r.section()).__next__
+        for g in graphs:
+            infos[nxt()] = g.debug
+            g.flags.update(values[nxt()])
+            g.parameters = [nodes[nxt()] for _ in range(nxt())]
+            g.return_ = nodes[nxt()]
+        for node in nodes:
+            infos[nxt()] = node.debug
+            a = nxt()
+            if a:
+                node.abstract = values[a - 1]
+            if node.is_constant():
+                node.value = values[nxt()]
+            elif node.is_apply():
+                node.inputs = [nodes[nxt()] for _ in range(nxt())]
+        if r.pos != len(r.data):
+            raise ValueError('Unexpected data after the graphs')
+
+        for i, info in enumerate(infos):
+            if info is None:
+                infos[i] = NamedDebugInfo()
+        for info, (name, about, loc, ast_name) in zip(infos, debug_data):
+            if name:
+                info.name = strings[name - 1]
+            if about:
+                info.about = About(infos[about[0]], about[1])
+            if loc is not None:
+                *loc, node_name = loc
+                info.location = Location(*loc, _ast_node(node_name))
+            if ast_name is not None:
+                info.ast = _ast_node(ast_name)
+        return roots
+
+
+def dump(graphs, file, encode=None):
+    """Write graphs and the graphs they use to a binary file.
+
+    Arguments:
+        graphs: A root graph, or a list of root graphs.
+        file: A file open for writing in binary mode.
+        encode: A function that returns a key for a constant that cannot
+            be serialized otherwise, or None if it cannot be serialized.
+
+    Raises:
+        TypeError: If a constant cannot be serialized.
+
+    """
+    roots = [graphs] if isinstance(graphs, Graph) else list(graphs)
+    _Dumper(encode).run(roots, file)
+
+
+def load(file, decode=None):
+    """Read graphs written by `dump` from a binary file.
+
+    Arguments:
+        file: A file open for reading in binary mode.
+        decode: The function that maps the keys that `encode` returned in
+            `dump` back to values.
+
+    Returns:
+        The list of root graphs.
+
+    Raises:
+        ValueError: If the data was written by a different version of
+            this module, or if it is not valid.
+
+    """
+    return loads(file.read(), decode)
+
+
+def dumps(graphs, encode=None):
+    """Serialize graphs and the graphs they use to bytes."""
+    f = io.BytesIO()
+    dump(graphs, f, encode)
+    return f.getvalue()
+
+
+def loads(data, decode=None):
+    """Load the list of root graphs serialized by `dumps`."""
+    try:
+        return _Loader(data, decode).run()
+    except (IndexError, KeyError, StopIteration, TypeError,
+            struct.error) as err:
+        raise ValueError('Invalid serialized graph') from err
@@ -0,0 +1,357 @@
+"""Forward-mode automatic differentiation.
+
+The forward-mode version of a graph takes each of the graph's parameters
+followed by its tangent, and returns a pair of the graph's output and the
+output's tangent:
+
+    def f(x, y):                def jvp_f(x, dx, y, dy):
+        a = x * y                   a, da = jvp_scalar_mul(x, dx, y, dy)
+        return a + x       =>       return (a + x, da + dx)
+
+Each node is mapped to a primal node and a tangent node. Linear and
+non-differentiable primitives are applied inline, other primitives call
+their tangent rule (see `myia.prim.grad_implementations`), and calls to
+graphs call their forward-mode versions. Functions, wherever they appear,
+are represented by their forward-mode versions, and their tangent is
+`newenv`, as given by `zeros_like`.
+
+Unlike `myia.grad`, the transform is done before type inference, on the
+graphs given to the `jvp` MetaGraph, so that the result is inferred and
+optimized like any other graph. Tangent rules are flagged as core, so once
+the optimizer inlines them, each tangent computation sits in the same
+graph as the primal computation it derives from, and both are simplified
+together (e.g. `jvp_scalar_exp` reuses the exponential it computes).
+
+Graphs with free variables from outside of the transformed graphs are not
+supported, so jvp cannot be applied to closures, although a function
+given to jvp may define and use closures.
+"""
+
+import numpy
+
+from .abstract import AbstractFunction, AbstractScalar, AbstractArray, \
+    AbstractTuple, AbstractList, AbstractClass, GraphFunction, \
+    PrimitiveFunction, MetaGraphFunction, PartialApplication, ANYTHING, \
+    TYPE, broaden, build_value
+from .composite import zeros_like
+from .dtype import Bool, External, Number, ismyiatype
+from .graph_utils import toposort, FOLLOW, EXCLUDE
+from .info import About
+from .ir import Constant, Graph, MetaGraph
+from .prim import ops as P, Primitive
+from .prim.grad_implementations import PrimitiveJVP, apply_jvp, \
+    primitive_jvp
+from .utils import newenv
+
+
+def _interleave(primals, tangents):
+    return [x for pair in zip(primals, tangents) for x in pair]
+
+
+def _differentiable(a):
+    if isinstance(a, AbstractScalar):
+        return ismyiatype(a.values[TYPE], (Number, Bool))
+    return isinstance(a, (AbstractArray, AbstractTuple, AbstractList,
+                          AbstractClass))
+
+
+def _lift_constant(value, g):
+    """Return the primal and tangent nodes for a constant, used in g."""
+    if isinstance(value, Graph):
+        return Constant(jvp_graph(value)), Constant(newenv)
+    elif isinstance(value, Primitive):
+        return _lift_primitive(value), Constant(newenv)
+    elif isinstance(value, MetaGraph):
+        return Constant(metagraph_jvp(value)), Constant(newenv)
+    c = Constant(value)
+    if isinstance(value, (bool, int, float)):
+        return c, Constant(type(value)(0))
+    elif isinstance(value, (tuple, numpy.ndarray)):
+        return c, g.apply(zeros_like, c)
+    else:
+        return c, Constant(newenv)
+
+
+def _lift_primitive(prim):
+    """Return a node for the forward-mode version of prim."""
+    if prim is P.getattr:
+        # getattr is found through resolve in graphs that are not resolved
+        # ahead of inference, such as methods
+        return Constant(_jvp_getattr)
+    return Constant(primitive_jvp(prim))
+
+
+def _lift_function(fn, g):
+    """Return a node for the forward-mode version of fn, used in g."""
+    if isinstance(fn, GraphFunction):
+        return Constant(jvp_graph(fn.graph))
+    elif isinstance(fn, PrimitiveFunction):
+        return _lift_primitive(fn.prim)
+    elif isinstance(fn, MetaGraphFunction):
+        return Constant(metagraph_jvp(fn.metagraph))
+    elif isinstance(fn, PartialApplication):
+        args = []
+        for arg in fn.args:
+            value = build_value(arg, default=ANYTHING)
+            if value is ANYTHING:
+                raise NotImplementedError(
+                    'jvp of a partial application on unknown values'
+                )
+            args += _lift_constant(value, g)
+        return g.apply(P.partial, _lift_function(fn.fn, g), *args)
+    else:
+        raise NotImplementedError(f'jvp is not supported on {fn}')
+
+
+def _primal_function(fn):
+    if isinstance(fn, GraphFunction):
+        primal = fn.graph.transforms.get('primal', None)
+        if isinstance(primal, Graph):
+            return GraphFunction(primal, fn.context)
+        elif isinstance(primal, Primitive):
+            return PrimitiveFunction(primal)
+    elif isinstance(fn, MetaGraphFunction):
+        mg = fn.metagraph
+        if isinstance(mg, PrimitiveJVP):
+            return PrimitiveFunction(mg.prim)
+        elif isinstance(mg, JVPMetaGraph):
+            return MetaGraphFunction(mg.metagraph, fn.context)
+    elif isinstance(fn, PartialApplication):
+        return PartialApplication(
+            _primal_function(fn.fn),
+            tuple(_primal_abstract(a) for a in fn.args[0::2])
+        )
+    return fn
+
+
+def _primal_abstract(a):
+    """Return the abstract value of the primal version of a function.
+
+    The abstract value a describes the forward-mode version of the function.
+    Other values are returned unchanged.
+    """
+    if isinstance(a, AbstractFunction):
+        return AbstractFunction(*[_primal_function(fn)
+                                  for fn in a.get_sync()])
+    return a
+
+
+class _JVPTransformer:
+    """Transform graphs to their forward-mode versions.
+
+    The graphs are created as soon as they are needed, with their
+    parameters, and their bodies are filled in afterwards, once the nodes
+    that nested graphs may use as free variables can be mapped.
+    """
+
+    def __init__(self):
+        self.repl = {}
+        self.graphs = set()
+        self.todo = []
+
+    def graph(self, g):
+        ng = g.transforms.get('jvp', None)
+        if ng is None:
+            with About(g.debug, 'jvp'):
+                ng = Graph()
+            ng.flags.update(g.flags)
+            ng.transforms['primal'] = g
+            g.transforms['jvp'] = ng
+            for p in g.parameters:
+                with About(p.debug, 'copy'):
+                    primal = ng.add_parameter()
+                with About(p.debug, 'jvp_tangent'):
+                    tangent = ng.add_parameter()
+                self.repl[p] = (primal, tangent)
+            self.graphs.add(g)
+            self.todo.append(g)
+        return ng
+
+    def run(self, g):
+        rval = self.graph(g)
+        while self.todo:
+            g = self.todo.pop()
+            ng = g.transforms['jvp']
+            ng.output = ng.apply(P.make_tuple, *self.get(g.output, ng))
+        return rval
+
+    def get(self, node, ng):
+        """Return the primal and tangent nodes for node, used in ng."""
+        if node.is_constant(Graph):
+            return Constant(self.graph(node.value)), Constant(newenv)
+        elif node.is_constant():
+            return _lift_constant(node.value, ng)
+        if node not in self.repl:
+            if node.graph not in self.graphs:
+                raise NotImplementedError(
+                    f'jvp is not supported on closures ({node.graph} has a'
+                    f' free variable)'
+                )
+            self.process(node)
+        return self.repl[node]
+
+    def process(self, root):
+        g = root.graph
+
+        def include(node):
+            if node.graph is g and node not in self.repl:
+                return FOLLOW
+            return EXCLUDE
+
+        for node in toposort(root, lambda n: n.inputs, include):
+            if node.is_apply():
+                with About(node.debug, 'jvp'):
+                    self.repl[node] = self.apply(node)
+
+    def apply(self, node):
+        ng = node.graph.transforms['jvp']
+        fn, *args = node.inputs
+        if fn.is_constant(Primitive):
+            prim = fn.value
+            if prim is P.partial:
+                jfn, _ = self.get(args[0], ng)
+                rest = [x for a in args[1:] for x in self.get(a, ng)]
+                return ng.apply(P.partial, jfn, *rest), Constant(newenv)
+            pairs = [self.get(a, ng) for a in args]
+            primals = [p for p, _ in pairs]
+            tangents = [t for _, t in pairs]
+            if prim is P.resolve:
+                raw = ng.apply(prim, *primals)
+                res = ng.apply(_dual, raw)
+            elif prim is P.getattr:
+                raw = ng.apply(prim, *primals)
+                res = ng.apply(_getattr_dual, raw, *pairs[0], primals[1])
+            else:
+                return apply_jvp(ng, prim, primals, tangents)
+        else:
+            jfn, _ = self.get(fn, ng)
+            res = ng.apply(jfn, *[x for a in args for x in self.get(a, ng)])
+        return (ng.apply(P.tuple_getitem, res, 0),
+                ng.apply(P.tuple_getitem, res, 1))
+
+
+def jvp_graph(g):
+    """Return the forward-mode version of g.
+
+    g may not have free variables. The result is cached in
+    `g.transforms['jvp']`.
+    """
+    if 'jvp' in g.transforms:
+        return g.transforms['jvp']
+    return _JVPTransformer().run(g)
+
+
+class JVPMetaGraph(MetaGraph):
+    """Forward-mode version of a MetaGraph.
+
+    The MetaGraph generates a graph from the abstract values of the primal
+    arguments, and that graph is transformed.
+    """
+
+    def __init__(self, metagraph):
+        """Initialize a JVPMetaGraph."""
+        super().__init__(f'jvp_{metagraph}')
+        self.metagraph = metagraph
+
+    def normalize_args(self, args):
+        """Normalize the primal arguments as the MetaGraph does."""
+        primals = self.metagraph.normalize_args(tuple(args[0::2]))
+        tangents = [broaden(t, None) for t in args[1::2]]
+        return tuple(_interleave(primals, tangents))
+
+    def generate_graph(self, args):
+        """Generate the forward-mode graph.
+
+        Functions are given to the MetaGraph in their primal versions, as
+        it would be given them in the primal graph.
+        """
+        primals = tuple(_primal_abstract(a) for a in args[0::2])
+        return jvp_graph(self.metagraph.generate_graph(primals))
+
+
+_metagraph_jvps = {}
+
+
+def metagraph_jvp(mg):
+    """Return the forward-mode version of mg."""
+    if mg not in _metagraph_jvps:
+        _metagraph_jvps[mg] = JVPMetaGraph(mg)
+    return _metagraph_jvps[mg]
+
+
+class _Dual(MetaGraph):
+    """Return a value's primal and tangent representations.
+
+    This is used for values that are only known after inference, such as
+    the ones given by `resolve`: functions are replaced by their
+    forward-mode versions, and other values are paired with zeros.
+    """
+
+    def generate_graph(self, args):
+        value, = args
+        g = Graph()
+        g.debug.name = self.name
+        p = g.add_parameter()
+        if isinstance(value, AbstractFunction):
+            primal = _lift_function(value.get_unique(), g)
+            tangent = Constant(newenv)
+        elif _differentiable(value):
+            primal, tangent = p, g.apply(zeros_like, p)
+        else:
+            primal, tangent = p, Constant(newenv)
+        g.output = g.apply(P.make_tuple, primal, tangent)
+        g.flags['core'] = True
+        return g
+
+
+class _GetattrDual(MetaGraph):
+    """Return the primal and tangent representations of getattr(x, item).
+
+    The result of getattr is given, along with x, its tangent and item. Fields
+    of dataclasses are taken on the tangent, and methods are bound to both
+    the object and its tangent.
+    """
+
+    def generate_graph(self, args):
+        res, data, _, item = args
+        g = Graph()
+        g.debug.name = self.name
+        p, x, dx, _ = [g.add_parameter() for _ in args]
+        static = isinstance(data, AbstractScalar) \
+            and ismyiatype(data.values[TYPE], External)
+        if isinstance(res, AbstractFunction):
+            fn = res.get_unique()
+            if isinstance(fn, PartialApplication) and not static:
+                method = _lift_function(fn.fn, g)
+                primal = g.apply(P.partial, method, x, dx)
+            else:
+                primal = _lift_function(fn, g)
+            tangent = Constant(newenv)
+        elif isinstance(data, AbstractClass):
+            primal = p
+            tangent = g.apply(P.getattr, dx, build_value(item))
+        elif _differentiable(res):
+            primal, tangent = p, g.apply(zeros_like, p)
+        else:
+            primal, tangent = p, Constant(newenv)
+        g.output = g.apply(P.make_tuple, primal, tangent)
+        g.flags['core'] = True
+        return g
+
+
+_dual = _Dual('dual')
+_getattr_dual = _GetattrDual('getattr_dual')
+
+
+def _make_jvp_getattr():
+    g = Graph()
+    g.debug.name = 'jvp_getattr'
+    x, dx, item, _ = [g.add_parameter() for _ in range(4)]
+    raw = g.apply(P.getattr, x, item)
+    g.output = g.apply(_getattr_dual, raw, x, dx, item)
+    g.flags['core'] = True
+    g.transforms['primal'] = P.getattr
+    return g
+
+
+_jvp_getattr = _make_jvp_getattr()
@@ -3,7 +3,9 @@
 from .opt import (  # noqa
     VarNode, sexp_to_node, sexp_to_graph,
     PatternSubstitutionOptimization,
-    NodeMap, pattern_replacer,
+    DiscriminationNet, NodeMap, pattern_replacer,
+    Worklist,
+    OptimizerStatistics,
     LocalPassOptimizer,
     GraphTransform,
 )
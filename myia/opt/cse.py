@@ -6,7 +6,7 @@ from collections import defaultdict
 from ..abstract import AbstractFunction, TypedPrimitive
 from ..graph_utils import toposort
 from ..ir import succ_incoming
-from ..utils import Partializable
+from ..utils import Partializable, prof_counter
 
 
 def _absof(node):
@@ -26,12 +26,20 @@ def _absof(node):
         return node.abstract
 
 
-def cse(root, manager):
-    """Apply CSE on root."""
+def cse(root, manager, stats=None):
+    """Apply CSE on root.
+
+    If stats is an OptimizerStatistics, the number of nodes that were
+    compared to an equivalent candidate and the number of nodes that were
+    merged are recorded under the 'cse' rule.
+    """
+    start = prof_counter()
     hashes = {}
     groups = defaultdict(list)
     manager.add_graph(root)
     changes = False
+    attempts = 0
+    replacements = 0
 
     for g in manager.graphs:
         for node in toposort(g.return_, succ_incoming):
@@ -56,6 +64,7 @@ def cse(root, manager):
 
     for h, group in groups.items():
         main, *others = group
+        attempts += len(others)
         for other in others:
             if main.graph is not other.graph:
                 # This could happen because of a hash collision
@@ -75,8 +84,13 @@ def cse(root, manager):
 
             if repl:
                 changes = True
+                replacements += 1
                 manager.replace(other, main)
 
+    if stats is not None:
+        stats.add_rule('cse', attempts=attempts, matches=replacements,
+                       replacements=replacements,
+                       time=prof_counter() - start)
     return changes
 
 
@@ -90,5 +104,6 @@ class CSE(Partializable):
 
     def __call__(self, root):
         """Apply CSE on root."""
-        chg = cse(root, self.optimizer.resources.manager)
+        chg = cse(root, self.optimizer.resources.manager,
+                  getattr(self.optimizer, 'stats', None))
         return chg and self.report_changes
@@ -5,8 +5,8 @@ from collections import deque
 
 from ..ir import ANFNode, Apply, Constant, Graph, Special, manage
 from ..prim import Primitive
-from ..utils.unify import Unification, Var
-from ..utils import OrderedSet
+from ..utils.unify import Unification, Var, SVar, UnionVar, Seq
+from ..utils import OrderedSet, prof_counter
 
 
 class VarNode(Special):
@@ -113,20 +113,28 @@ class PatternSubstitutionOptimization:
                 interest = None
         self.interest = interest
 
-    def __call__(self, optimizer, node):
+    def __call__(self, optimizer, node, equiv=None):
         """Return a replacement for the node, if the pattern matches.
 
         The replacement will be instantiated in the graph of the root of the
         pattern, except for matched nodes in the pattern, which are kept
         unchanged in the replacement.
 
+        Args:
+            optimizer: The optimizer this is called from.
+            node: The node to match.
+            equiv: The bindings of the pattern's variables, if the node is
+                already known to match, e.g. through a DiscriminationNet.
+                Otherwise the node is unified with the pattern.
+
         Returns:
             * None if the pattern does not match.
             * A subgraph for the reification of the replacement, with
               variables filled in, if the pattern matches.
 
         """
-        equiv = self.unif.unify(node, self.pattern)
+        if equiv is None:
+            equiv = self.unif.unify(node, self.pattern)
         if equiv is not None:
             if callable(self.replacement):
                 return self.replacement(optimizer, node, equiv)
@@ -147,6 +155,172 @@ def pattern_replacer(*pattern, interest=False):
     return deco
 
 
+_keyable_types = (bool, int, float, str, type(None), Primitive, Graph)
+
+
+class _Unsupported(Exception):
+    """Raised for patterns that cannot be indexed in a DiscriminationNet."""
+
+
+class _NetNode:
+    """Node of a DiscriminationNet.
+
+    Attributes:
+        applies: Maps an arity to the node for Apply with that many inputs.
+        variadic: Maps (s, a) to the node for Apply with an SVar at index
+            s, followed by a inputs.
+        constants: Maps a value to the node for Constant with that value.
+        wild: The node for any subterm bound to a variable.
+        entries: Patterns that end here, as (index, opt, vars, exact).
+
+    """
+
+    __slots__ = ('applies', 'variadic', 'constants', 'wild', 'entries')
+
+    def __init__(self):
+        self.applies = {}
+        self.variadic = {}
+        self.constants = {}
+        self.wild = None
+        self.entries = []
+
+
+class DiscriminationNet:
+    """Index of optimizations by the shape of the nodes they match.
+
+    The patterns of PatternSubstitutionOptimizations are flattened in
+    preorder and stored in a trie that discriminates on the arity of Apply
+    nodes and on the value of constants, while variables match any subterm.
+    Matching a node walks the trie once for all patterns, collecting the
+    subterms bound to each variable on the way.
+
+    A pattern is exact if its variables, including those that stand for the
+    graphs of its Apply nodes, are distinct and are not UnionVars. The
+    bindings of an exact pattern are checked against each variable's filter
+    and are the same as what unification would return. Other patterns, and
+    optimizations that are not pattern-based, are returned as candidates
+    without bindings.
+
+    """
+
+    def __init__(self, opts=()):
+        """Initialize a DiscriminationNet."""
+        self.root = _NetNode()
+        self.always = []
+        self._count = 0
+        for opt in opts:
+            self.add(opt)
+
+    def add(self, opt):
+        """Add an optimization to the net."""
+        idx = self._count
+        self._count += 1
+        if isinstance(opt, PatternSubstitutionOptimization):
+            captures = []
+            try:
+                tn = self._insert(self.root, opt.pattern, captures)
+            except _Unsupported:
+                pass
+            else:
+                exact = (all(isinstance(v, Var)
+                             and not isinstance(v, UnionVar)
+                             for v in captures)
+                         and len(set(captures)) == len(captures))
+                tn.entries.append((idx, opt, tuple(captures), exact))
+                return
+        self.always.append((idx, opt))
+
+    def _insert(self, tn, p, captures):
+        v = getattr(p, '__var__', None)
+        if v is not None:
+            if isinstance(v, SVar):
+                raise _Unsupported()
+            captures.append(v)
+            if tn.wild is None:
+                tn.wild = _NetNode()
+            return tn.wild
+
+        if p.is_apply():
+            inputs = p.inputs
+            svars = [i for i, inp in enumerate(inputs)
+                     if isinstance(getattr(inp, '__var__', None), SVar)]
+            captures.append(p.graph)
+            if not svars:
+                tn = tn.applies.setdefault(len(inputs), _NetNode())
+            elif len(svars) == 1:
+                s, = svars
+                key = (s, len(inputs) - s - 1)
+                tn = tn.variadic.setdefault(key, _NetNode())
+                captures.append(inputs[s].__var__)
+                inputs = inputs[:s] + inputs[s + 1:]
+            else:
+                raise _Unsupported()
+            for inp in inputs:
+                tn = self._insert(tn, inp, captures)
+            return tn
+
+        if p.is_constant() and type(p.value) in _keyable_types:
+            return tn.constants.setdefault(p.value, _NetNode())
+
+        raise _Unsupported()
+
+    def match(self, node):
+        """Return the optimizations that may apply to a node.
+
+        Returns:
+            A list of (opt, equiv) pairs, in the order the optimizations
+            were added. equiv holds the bindings of the pattern's
+            variables, or is None if the pattern must still be unified
+            with the node.
+
+        """
+        results = [(idx, opt, None) for idx, opt in self.always]
+        stack = [(self.root, (node,), ())]
+        while stack:
+            tn, pending, caps = stack.pop()
+            if not pending:
+                for idx, opt, vars, exact in tn.entries:
+                    if not exact:
+                        results.append((idx, opt, None))
+                        continue
+                    equiv = {}
+                    for v, x in zip(vars, caps):
+                        if not v.matches(x):
+                            break
+                        equiv[v] = x
+                    else:
+                        results.append((idx, opt, equiv))
+                continue
+
+            x = pending[-1]
+            rest = pending[:-1]
+            if tn.wild is not None:
+                stack.append((tn.wild, rest, caps + (x,)))
+            if x.is_apply():
+                inputs = x.inputs
+                n = len(inputs)
+                child = tn.applies.get(n, None)
+                if child is not None:
+                    stack.append((child, rest + tuple(reversed(inputs)),
+                                  caps + (x.graph,)))
+                for (s, a), child in tn.variadic.items():
+                    if s + a <= n:
+                        fixed = inputs[:s] + inputs[n - a:]
+                        seq = Seq(inputs[s:n - a])
+                        stack.append((child, rest + tuple(reversed(fixed)),
+                                      caps + (x.graph, seq)))
+            elif x.is_constant() and tn.constants:
+                try:
+                    child = tn.constants.get(x.value, None)
+                except TypeError:
+                    child = None
+                if child is not None:
+                    stack.append((child, rest, caps))
+
+        results.sort(key=lambda r: r[0])
+        return [(opt, equiv) for _, opt, equiv in results]
+
+
 class NodeMap:
     """Mapping of node to optimizer.
 
@@ -158,11 +332,15 @@ class NodeMap:
 
     Other than None, only primitives are currently supported as interests.
 
+    The optimizers for each interest are compiled into a DiscriminationNet
+    on demand, so that `match` only returns those that fit the node.
+
     """
 
     def __init__(self):
         """Create a NodeMap."""
         self._d = dict()
+        self._nets = dict()
 
     def register(self, interests, opt=None):
         """Register an optimizer for some interests."""
@@ -180,20 +358,227 @@ class NodeMap:
 
         # There could be the option to return do_register also.
         do_register(opt)
+        self._nets.clear()
 
-    def get(self, node):
-        """Get a list of optimizers that could apply for a node."""
-        res = []
-        res.extend(self._d.get(None, []))
+    def _interests(self, node):
+        yield None
         if node.is_apply():
             if node.inputs[0].is_constant():
-                res.extend(self._d.get(node.inputs[0].value, []))
+                yield node.inputs[0].value
             if node.inputs[0].is_constant_graph():
-                res.extend(self._d.get(Graph, []))
+                yield Graph
             if node.inputs[0].is_apply():
-                res.extend(self._d.get(Apply, []))
+                yield Apply
+
+    def get(self, node):
+        """Get a list of optimizers that could apply for a node."""
+        res = []
+        for interest in self._interests(node):
+            res.extend(self._d.get(interest, []))
         return res
 
+    def match(self, node):
+        """Get the optimizers that match a node, with their bindings.
+
+        This returns the same optimizers as `get`, in the same order, but
+        without the patterns that cannot match the node. See
+        `DiscriminationNet.match` for the format.
+        """
+        res = []
+        for interest in self._interests(node):
+            opts = self._d.get(interest, None)
+            if opts is None:
+                continue
+            net = self._nets.get(interest, None)
+            if net is None:
+                net = DiscriminationNet(opts)
+                self._nets[interest] = net
+            res.extend(net.match(node))
+        return res
+
+
+class Worklist:
+    """Track the nodes that need to be revisited as graphs change.
+
+    A Worklist subscribes to the events of a GraphManager. A node needs to be
+    revisited when it is new, or when its inputs or uses change. Nodes that
+    refer to a graph that changed, or whose set of users changed, also need to
+    be revisited, since some optimizations (e.g. inlining) depend on these.
+
+    Attributes:
+        manager: The GraphManager to track.
+        full: Whether all nodes should be visited. This is the case
+            initially, and must be set again if the graph is replaced.
+        nodes: The nodes that were added or had their edges changed.
+        graphs: The graphs that changed.
+
+    """
+
+    def __init__(self, manager):
+        """Initialize a Worklist."""
+        self.manager = manager
+        self.open()
+
+    def open(self):
+        """Start tracking changes.
+
+        All nodes are initially marked for revisiting.
+        """
+        self.reset(full=True)
+        evts = self.manager.events
+        evts.add_node.register(self._on_add_node)
+        evts.add_edge.register(self._on_mod_edge)
+        evts.drop_edge.register(self._on_mod_edge)
+
+    def close(self):
+        """Stop tracking changes."""
+        evts = self.manager.events
+        evts.add_node.remove(self._on_add_node)
+        evts.add_edge.remove(self._on_mod_edge)
+        evts.drop_edge.remove(self._on_mod_edge)
+
+    def reset(self, full=False):
+        """Empty the worklist, or mark all nodes for revisiting."""
+        self.full = full
+        self.nodes = OrderedSet()
+        self.graphs = OrderedSet()
+
+    def __bool__(self):
+        return self.full or bool(self.nodes)
+
+    def _on_add_node(self, event, node):
+        self.nodes.add(node)
+        if node.graph is not None:
+            self.graphs.add(node.graph)
+
+    def _on_mod_edge(self, event, node, key, inp):
+        self.nodes.add(node)
+        self.nodes.add(inp)
+        self.graphs.add(node.graph)
+        if inp.is_constant_graph():
+            self.graphs.add(inp.value)
+
+    def untyped(self):
+        """Check whether a node without an abstract type was introduced."""
+        all_nodes = self.manager.all_nodes
+        return any(node.abstract is None and node in all_nodes
+                   for node in self.nodes)
+
+    def pop(self, root=None):
+        """Return the nodes to revisit, and empty the worklist.
+
+        Arguments:
+            root: If given, only return nodes that belong to graphs
+                reachable from this graph.
+        """
+        mng = self.manager
+        nodes, graphs = self.nodes, self.graphs
+        self.reset()
+
+        todo = OrderedSet()
+        for node in nodes:
+            if node in mng.all_nodes:
+                todo.add(node)
+                todo.update(user for user, _ in mng.uses[node])
+        for g in graphs:
+            if g in mng.graphs:
+                for ct in mng.graph_constants[g]:
+                    todo.update(user for user, _ in mng.uses[ct])
+
+        if root is not None:
+            scope = mng.graphs_reachable[root] | {root}
+            todo = OrderedSet(node for node in todo if node.graph in scope)
+        return todo
+
+
+def _rule_name(opt):
+    name = getattr(opt, 'name', None)
+    return name or getattr(opt, '__name__', None) or str(opt)
+
+
+class OptimizerStatistics:
+    """Statistics about the phases and rules of an optimizer.
+
+    Attributes:
+        iterations: The number of iterations of the optimizer's loop.
+        phases: Maps each phase name to a dict with the number of
+            iterations in which it ran ('iterations'), how many of these
+            changed the graph ('changes'), and the time spent ('time').
+        rules: Maps each rule name to a dict with the number of nodes it
+            was tried on ('attempts'), how many matched its pattern
+            ('matches'), how many were changed ('replacements'), and the
+            time spent ('time').
+
+    """
+
+    def __init__(self):
+        """Initialize OptimizerStatistics."""
+        self.iterations = 0
+        self.phases = {}
+        self.rules = {}
+
+    def add_phase(self, name, ran, changes, time):
+        """Record a run of a phase."""
+        rec = self.phases.get(name, None)
+        if rec is None:
+            rec = dict(iterations=0, changes=0, time=0.0)
+            self.phases[name] = rec
+        rec['iterations'] += bool(ran)
+        rec['changes'] += bool(changes)
+        rec['time'] += time
+
+    def add_rule(self, rule, attempts=0, matches=0, replacements=0,
+                 time=0.0):
+        """Record uses of a rule.
+
+        Arguments:
+            rule: The rule, or its name.
+            attempts: The number of nodes it was tried on.
+            matches: The number of nodes that matched its pattern.
+            replacements: The number of nodes that were changed.
+            time: The time spent in the rule.
+        """
+        if not isinstance(rule, str):
+            rule = _rule_name(rule)
+        rec = self.rules.get(rule, None)
+        if rec is None:
+            rec = dict(attempts=0, matches=0, replacements=0, time=0.0)
+            self.rules[rule] = rec
+        rec['attempts'] += attempts
+        rec['matches'] += matches
+        rec['replacements'] += replacements
+        rec['time'] += time
+
+    def hot_rules(self, key='time', n=None):
+        """Return the n rules with the highest value for key.
+
+        Returns:
+            A list of (name, record) pairs, in decreasing order.
+
+        """
+        res = sorted(self.rules.items(), key=lambda item: -item[1][key])
+        return res if n is None else res[:n]
+
+    def report(self):
+        """Return the statistics as a dict of plain data."""
+        return {
+            'iterations': self.iterations,
+            'phases': {name: dict(rec) for name, rec in self.phases.items()},
+            'rules': {name: dict(rec) for name, rec in self.hot_rules()},
+        }
+
+    def print(self):
+        """Print the statistics, with the costliest rules first."""
+        print(f"  Iterations: {self.iterations}")
+        for name, rec in self.phases.items():
+            print(f"  Phase {name}: {rec['iterations']} iterations, "
+                  f"{rec['changes']} with changes, {rec['time']:.3g}s")
+        print(f"  {'Rule':40} {'attempts':>9} {'matches':>8} "
+              f"{'replaced':>8} {'time':>8}")
+        for name, rec in self.hot_rules():
+            print(f"  {name:40} {rec['attempts']:9} {rec['matches']:8} "
+                  f"{rec['replacements']:8} {rec['time']:8.3g}s")
+
 
 class LocalPassOptimizer:
     """Apply a set of local optimizations in bfs order."""
@@ -203,12 +588,16 @@ class LocalPassOptimizer:
         self.node_map = node_map
         self.optimizer = optimizer
 
-    def __call__(self, graph):
+    def __call__(self, graph, worklist=None):
         """Apply optimizations on given graphs in node order.
 
         This will visit the nodes from the output to the inputs in a
         bfs manner while avoiding parts of the graph that are dropped
         due to optimizations.
+
+        If a non-full worklist is given, only the nodes it contains are
+        visited, along with the nodes that are changed in the process. The
+        worklist then records the changes for the next call.
         """
         if self.optimizer is not None:
             mng = self.optimizer.resources.manager
@@ -219,7 +608,15 @@ class LocalPassOptimizer:
         seen = set([graph])
         todo = deque()
         changes = False
-        todo.append(graph.output)
+
+        if worklist is None or worklist.full:
+            follow = True
+            todo.append(graph.output)
+            if worklist is not None:
+                worklist.reset()
+        else:
+            follow = False
+            todo.extend(worklist.pop(graph))
 
         while len(todo) > 0:
             n = todo.popleft()
@@ -231,12 +628,13 @@ class LocalPassOptimizer:
 
             changes |= chg
 
-            if new.is_constant(Graph):
-                if new.value not in seen:
-                    todo.appendleft(new.value.output)
-                    seen.add(new.value)
-            else:
-                todo.extendleft(reversed(new.inputs))
+            if follow or chg:
+                if new.is_constant(Graph):
+                    if new.value not in seen:
+                        todo.appendleft(new.value.output)
+                        seen.add(new.value)
+                else:
+                    todo.extendleft(reversed(new.inputs))
 
             if chg:
                 # Since there was changes, re-schedule the parent node(s)
@@ -247,13 +645,30 @@ class LocalPassOptimizer:
         return changes
 
     def apply_opt(self, mng, n):
-        """Apply optimizations passes according to the node map."""
+        """Apply optimizations passes according to the node map.
+
+        If the optimizer collects statistics, the attempts, matches,
+        replacements and time of each rule are recorded.
+        """
+        stats = getattr(self.optimizer, 'stats', None)
         loop = True
         changes = False
         while loop:
             loop = False
-            for transformer in self.node_map.get(n):
-                new = transformer(self.optimizer, n)
+            for transformer, equiv in self.node_map.match(n):
+                if stats is None:
+                    _, new = self._apply_rule(transformer, n, equiv)
+                else:
+                    start = prof_counter()
+                    matched, new = self._apply_rule(transformer, n, equiv)
+                    stats.add_rule(
+                        transformer,
+                        attempts=1,
+                        matches=int(matched),
+                        replacements=int(new is True
+                                         or bool(new and new is not n)),
+                        time=prof_counter() - start
+                    )
                 if new is True:
                     changes = True
                     continue
@@ -266,6 +681,16 @@ class LocalPassOptimizer:
 
         return n, changes
 
+    def _apply_rule(self, transformer, n, equiv):
+        # Return whether the rule matched and its result.
+        if isinstance(transformer, PatternSubstitutionOptimization):
+            if equiv is None:
+                equiv = transformer.unif.unify(n, transformer.pattern)
+                if equiv is None:
+                    return False, None
+            return True, transformer(self.optimizer, n, equiv)
+        return True, transformer(self.optimizer, n)
+
 
 class GraphTransform:
     """Represents a graph transform.
@@ -32,14 +32,17 @@ Block
 
 import ast
 import asttokens
+import hashlib
 import inspect
+import os
+import sys
 import textwrap
 from types import FunctionType
 from typing import Dict, List, NamedTuple, Optional, Tuple, \
     overload as pyoverload
 
 from .info import About, DebugInherit, NamedDebugInfo
-from .ir import ANFNode, Apply, Constant, Graph, Parameter
+from .ir import ANFNode, Apply, Constant, Graph, Parameter, serialize
 from .prim import ops as primops
 from .utils import ModuleNamespace, ClosureNamespace
 
@@ -47,6 +50,16 @@ from .utils import ModuleNamespace, ClosureNamespace
 _parse_cache = {}
 
 
+# Directory in which parsed graphs are saved, to be loaded by the processes
+# that parse the same functions again. The cache is not used if this is None.
+cache_dir = None
+
+# Whether to compute the exact extent of each node in the source code with
+# asttokens, which is where most of the parsing time goes. If False, the
+# locations only give where each node starts.
+precise_locations = True
+
+
 class Location(NamedTuple):
     """A location in source code.
 
@@ -76,6 +89,7 @@ class MyiaSyntaxError(Exception):
 
 operations_ns = ModuleNamespace('myia.operations')
 builtins_ns = ModuleNamespace('builtins')
+_module_namespaces = {ns.label: ns for ns in (operations_ns, builtins_ns)}
 
 
 ast_map = {
@@ -123,16 +137,119 @@ def parse(func):
     The result of the parsing is cached: multiple calls to parse on the same
     function will return the same graph. It should therefore be cloned prior
     to manipulation.
+
+    If `cache_dir` is set, parsed graphs are also saved in that directory,
+    and other processes load them from there instead of parsing the same
+    functions again.
     """
     if func in _parse_cache:
         return _parse_cache[func]
     parser = Parser(func)
-    graph = parser.parse()
+    if cache_dir is None:
+        graph = parser.parse()
+    else:
+        graph = _parse_cached(parser, cache_dir)
     graph.flags.update(getattr(func, '_myia_flags', {}))
     _parse_cache[func] = graph
     return graph
 
 
+_source_digests = {}
+
+
+def _source_digest(fn):
+    """Return a hash of the source file that fn is defined in.
+
+    Finding the exact source of fn takes about as long as loading its
+    graph, so the whole file is hashed instead, once per process.
+    """
+    lines, _ = inspect.findsource(fn)
+    filename = inspect.getsourcefile(fn)
+    entry = _source_digests.get(filename, None)
+    if entry is None or entry[0] is not lines:
+        digest = hashlib.sha256(''.join(lines).encode()).hexdigest()
+        entry = (lines, digest)
+        _source_digests[filename] = entry
+    return entry[1]
+
+
+def _parse_cached(parser, directory):
+    """Parse using the cache in the given directory.
+
+    The graph is looked up by a hash of the source code, of where the
+    function is in it, and of the names that it may resolve in the
+    function's closure rather than its module, so that the graph is parsed
+    again when any of these change. The key also includes a digest of
+    Myia's own code, so that the entries are not used by another version
+    of Myia.
+
+    Entries that cannot be loaded are deleted and parsed again.
+    """
+    from .pipeline.cache import code_digest
+
+    fn = parser.function
+    key = hashlib.sha256(repr((
+        serialize.VERSION,
+        code_digest(),
+        sys.version,
+        precise_locations,
+        parser.filename,
+        parser.line_offset,
+        fn.__module__,
+        fn.__qualname__,
+        fn.__code__.co_freevars,
+        _source_digest(fn),
+    )).encode()).hexdigest()
+    path = os.path.join(directory, f'{key}.myia')
+
+    def encode(value):
+        if value is parser.global_namespace:
+            return ('global',)
+        elif value is parser.closure_namespace:
+            return ('closure',)
+        elif type(value) is ModuleNamespace:
+            return ('module', value.label)
+        return None
+
+    def decode(ref):
+        if ref[0] == 'global':
+            return parser.global_namespace
+        elif ref[0] == 'closure':
+            return parser.closure_namespace
+        else:
+            return _module_namespaces.get(ref[1], None) \
+                or ModuleNamespace(ref[1])
+
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        # Missing or unreadable entry
+        data = None
+    if data is not None:
+        try:
+            graph, = serialize.loads(data, decode)
+            return graph
+        except ValueError:
+            # Corrupt or stale entry
+            try:
+                os.remove(path)
+            except OSError:  # pragma: no cover
+                pass
+    graph = parser.parse()
+    try:
+        data = serialize.dumps(graph, encode)
+    except TypeError:
+        # Some constant cannot be saved
+        return graph
+    os.makedirs(directory, exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return graph
+
+
 class Parser:
     """Parser for a function.
 
@@ -150,6 +267,8 @@ class Parser:
         closure_namespace: The Namespace in which to resolve the function's
             nonlocal variables. It will be embedded in the graph for every
             nonlocal variable to resolve.
+        precise_locations: Whether to compute the exact extent of nodes in
+            the source code.
         graph: The graph of the function being parsed.
 
     """
@@ -157,7 +276,9 @@ class Parser:
     def __init__(self, function: FunctionType) -> None:
         """Construct a parser."""
         self.function = function
-        _, self.line_offset = inspect.getsourcelines(function)
+        # This is where inspect.getsourcelines starts, decorators included
+        self.line_offset = function.__code__.co_firstlineno
+        self.precise_locations = precise_locations
         self.filename: str = inspect.getfile(function)
         # This is used to resolve the function's globals.
         self.global_namespace = ModuleNamespace(function.__module__)
@@ -177,8 +298,13 @@ class Parser:
             node0 = node
             node1 = node
         if hasattr(node0, 'lineno') and hasattr(node0, 'col_offset'):
-            li1, col1 = node0.first_token.start
-            li2, col2 = node1.last_token.end
+            if self.precise_locations:
+                li1, col1 = node0.first_token.start
+                li2, col2 = node1.last_token.end
+            else:
+                li1, col1 = node0.lineno, node0.col_offset
+                li2 = getattr(node1, 'end_lineno', node1.lineno)
+                col2 = getattr(node1, 'end_col_offset', node1.col_offset)
             li1 += self.line_offset - 1
             li2 += self.line_offset - 1
             col1 += self.col_offset
@@ -210,7 +336,10 @@ class Parser:
         src = textwrap.dedent(src0)
         # We need col_offset to compensate for the dedent
         self.col_offset = len(src0.split('\n')[0]) - len(src.split('\n')[0])
-        tree = asttokens.ASTTokens(src, parse=True).tree
+        if self.precise_locations:
+            tree = asttokens.ASTTokens(src, parse=True).tree
+        else:
+            tree = ast.parse(src)
         function_def = tree.body[0]
         assert isinstance(function_def, ast.FunctionDef)
         graph = self._process_function(None, function_def).graph
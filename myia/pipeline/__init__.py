@@ -6,6 +6,8 @@ from .pipeline import (  # noqa
     pipeline_function
 )
 
+from .cache import StepCache  # noqa
+
 from .standard import (  # noqa
     standard_resources,
     standard_pipeline,
@@ -0,0 +1,502 @@
+"""Memoization of pipeline steps.
+
+The steps that declare that they are `cacheable` have their outputs stored
+in a StepCache, keyed by the step's configuration, the pipeline's
+resources and the keys of the step's inputs. The key of an input is the
+hash of its serialization, along with the graphs it refers to, or, for an
+output of a cacheable step that cannot be serialized, a key derived from
+the key of that step. So the same function compiled by two pipelines that
+share their first steps, such as `standard_pipeline` and
+`standard_debug_pipeline`, is only inferred and optimized once.
+
+On a hit, the outputs of a step are only loaded if a step that is not a
+hit uses them, as fresh copies, since steps may modify the graphs they are
+given. Outputs that cannot be serialized, such as the inference context,
+are not stored: if a step needs one, the step that produced it is run
+again. They are left out of the pipeline's results if they were not
+needed.
+
+The resources and the configuration of the steps are identified when a
+pipeline first runs, and are assumed not to change afterwards. The tables
+that are globals in Myia's modules, such as the object map, are identified
+by their name, since they are only filled as they are used. Values that
+cannot be serialized, and configurations that refer to objects that cannot
+be named, such as lambdas, make keys that are only valid in the current
+process. Entries with such keys are not written to disk.
+
+User functions that the graphs refer to are identified by their code and
+by the values of the globals they use, so keys change when a global is
+rebound. The resolve step is not cached, since it reads the globals of the
+functions it resolves, which are not part of its input graph.
+"""
+
+import hashlib
+import marshal
+import os
+import sys
+import threading
+from collections import OrderedDict
+from types import CodeType, FunctionType
+
+from .. import dtype
+from ..abstract import InferenceMemo
+from ..ir import Constant, Graph, serialize
+from ..prim import Primitive
+from ..utils import overload, Overload, Partial
+
+
+# Arguments that do not influence the results of the steps
+_ignored_args = {'profile'}
+
+
+_globals = None
+
+
+def _global_names():
+    """Return the names of the objects that are globals in Myia's modules.
+
+    The objects are mapped by id.
+    """
+    global _globals
+    if _globals is None:
+        _globals = {}
+        for modname, mod in list(sys.modules.items()):
+            if modname.split('.')[0] == 'myia':
+                for name, value in vars(mod).items():
+                    if not name.startswith('__'):
+                        _globals.setdefault(id(value), (modname, name))
+    return _globals
+
+
+def _lookup(modname, qualname):
+    obj = sys.modules.get(modname, None)
+    for part in qualname.split('.'):
+        obj = getattr(obj, part, None)
+    return obj
+
+
+class _Local:
+    """Token for an object that is only identified by its id."""
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __repr__(self):
+        return f'<local {id(self.obj)}>'
+
+
+@overload(bootstrap=True)
+def _token(self, x: (tuple, list)):
+    return (type(x).__name__, *[self(y) for y in x])
+
+
+@overload  # noqa: F811
+def _token(self, x: dict):
+    name = _global_names().get(id(x), None)
+    if name is not None:
+        # Tables such as the object map may be filled as they are used
+        return ('global', *name)
+    return ('dict', *[(self(k), self(v)) for k, v in x.items()])
+
+
+@overload  # noqa: F811
+def _token(self, x: Partial):
+    return ('partial', self(x.func), self(x.keywords))
+
+
+@overload  # noqa: F811
+def _token(self, x: Overload):
+    return ('overload', *[(self(t), self(fn))
+                          for t, fn in x._uncached_map.items()])
+
+
+@overload  # noqa: F811
+def _token(self, x: Primitive):
+    return ('prim', x.name)
+
+
+@overload  # noqa: F811
+def _token(self, x: InferenceMemo):
+    # The memo holds inference results, which do not depend on it
+    return ('memo',)
+
+
+def _code_names(code):
+    """Return the global names used by code and the code nested in it."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= _code_names(const)
+    return names
+
+
+# Functions whose token is being computed, to stop at recursive references
+_in_progress = threading.local()
+
+
+@overload  # noqa: F811
+def _token(self, x: FunctionType):
+    name = x.__qualname__
+    if '<' not in name or _lookup(x.__module__, name) is x:
+        base = ('global', x.__module__, name)
+    else:
+        base = _Local(x)
+    if x.__module__.split('.')[0] == 'myia':
+        # Myia's own code is covered by code_digest
+        return base
+    active = getattr(_in_progress, 'functions', None)
+    if active is None:
+        active = _in_progress.functions = set()
+    if x in active:
+        return ('recursive', base)
+    active.add(x)
+    try:
+        # The function's code, and the values of the globals and of the
+        # free variables it refers to
+        code = hashlib.sha256(marshal.dumps(x.__code__)).hexdigest()
+        glob = tuple((name, self(x.__globals__[name]))
+                     for name in sorted(_code_names(x.__code__))
+                     if name in x.__globals__)
+        cells = []
+        for cell in x.__closure__ or ():
+            try:
+                cells.append(self(cell.cell_contents))
+            except ValueError:
+                # Empty cell
+                cells.append(None)
+        return ('function', base, code, glob, tuple(cells))
+    finally:
+        active.discard(x)
+
+
+@overload  # noqa: F811
+def _token(self, x: object):
+    if x is None or isinstance(x, (bool, int, float, str, bytes)):
+        return x
+    elif dtype.ismyiatype(x):
+        return ('type', repr(x))
+    mod = getattr(x, '__module__', None)
+    name = getattr(x, '__qualname__', None)
+    if isinstance(mod, str) and isinstance(name, str):
+        # Functions defined in functions, and lambdas, share their names
+        if '<' not in name or _lookup(mod, name) is x:
+            return ('global', mod, name)
+        return _Local(x)
+    name = getattr(x, '__name__', None)
+    if isinstance(name, str):
+        return (self(type(x)), name)
+    name = _global_names().get(id(x), None)
+    if name is not None:
+        return ('global', *name)
+    return _Local(x)
+
+
+def _is_stable(token):
+    if isinstance(token, tuple):
+        return all(_is_stable(t) for t in token)
+    return not isinstance(token, _Local)
+
+
+_code_digest = None
+
+
+def code_digest():
+    """Return a digest of Myia's source code.
+
+    It is part of the keys of the entries on disk, so that they are not
+    used by a different version of Myia.
+    """
+    global _code_digest
+    if _code_digest is None:
+        h = hashlib.sha256()
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for path, dirs, files in sorted(os.walk(root)):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.py'):
+                    with open(os.path.join(path, name), 'rb') as f:
+                        h.update(name.encode())
+                        h.update(f.read())
+        _code_digest = h.hexdigest()
+    return _code_digest
+
+
+class StepCache:
+    """Store of the outputs of the cacheable steps of pipelines.
+
+    The StepCache is given to the pipelines as their `step_cache`
+    resource, and is shared by all the pipelines it is given to:
+
+    >>> cache = StepCache()
+    >>> pipeline = standard_pipeline.configure_resources(step_cache=cache)
+
+    The least recently used entries are dropped first.
+
+    Attributes:
+        directory: If not None, the entries are also saved in this
+            directory, and the entries that are not in memory are looked
+            up there.
+        maxsize: The maximum number of entries kept in memory.
+        hits: The number of steps that were not run.
+        misses: The number of cacheable steps that were run.
+
+    """
+
+    def __init__(self, directory=None, maxsize=256):
+        """Initialize a StepCache."""
+        self.directory = directory
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # id(obj) -> (obj, token, whether the token is stable)
+        self._tokens = {}
+
+    def token(self, obj):
+        """Return a token that identifies obj, and whether it is stable.
+
+        Stable tokens describe obj by value, and classes and other objects
+        that have a name by their name. Functions are also described by
+        their code and by the values of the globals and free variables
+        they refer to, so that a function is not confused with a new
+        definition of the same name, and that its key changes when a
+        global that it uses is rebound. Other objects are
+        identified by their id, which is only valid in this process, so
+        they are kept alive by the cache.
+        """
+        entry = self._tokens.get(id(obj), None)
+        if entry is None:
+            token = _token(obj)
+            entry = (obj, token, _is_stable(token))
+            if not isinstance(obj, FunctionType):
+                # The globals of functions may be rebound
+                self._tokens[id(obj)] = entry
+        return entry[1:]
+
+    def fingerprint(self, value):
+        """Return a digest of value and whether it is stable.
+
+        The digest is computed from the serialization of value and of
+        the graphs it refers to. Objects that cannot be serialized are
+        identified by their id.
+        """
+        stable = True
+
+        def encode(obj):
+            nonlocal stable
+            token, obj_stable = self.token(obj)
+            stable = stable and obj_stable
+            return repr(token)
+
+        g = Graph()
+        g.output = Constant(value)
+        data = serialize.dumps(g, encode)
+        return hashlib.sha256(data).hexdigest(), stable
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.step')
+
+    def get(self, key, stable):
+        """Return the entry at key, or None.
+
+        An entry is a list of the names of the outputs of a step, and a
+        dict of the serialized outputs that could be stored.
+        """
+        entry = self.entries.get(key, None)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        elif self.directory is not None and stable:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    entry = marshal.loads(f.read())
+            except Exception:
+                # Missing or unreadable entry
+                return None
+            self._add(key, entry)
+        return entry
+
+    def put(self, key, stable, results):
+        """Store the results of a step at key, and return the entry."""
+        stored = {}
+        for name, value in results.items():
+            g = Graph()
+            g.output = Constant(value)
+            try:
+                stored[name] = serialize.dumps(g)
+            except TypeError:
+                pass
+        entry = (list(results), stored)
+        self._add(key, entry)
+        if self.directory is not None and stable:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(marshal.dumps(entry))
+            os.replace(tmp, path)
+        return entry
+
+    def _add(self, key, entry):
+        self.entries[key] = entry
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries from memory."""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def session(self, pipeline):
+        """Return a _CacheSession to run steps of the pipeline."""
+        return _CacheSession(self, pipeline)
+
+
+@overload  # noqa: F811
+def _token(self, x: StepCache):
+    return ('step_cache',)
+
+
+class _Lazy:
+    """Output of a step that was not run.
+
+    The output is loaded from its serialized value, or else computed by
+    running the step again, with the arguments it was given. It is only
+    loaded once, so that the steps that use it get the same value, as they
+    would if the step had run.
+    """
+
+    def __init__(self, name, data=None, step=None, args=None):
+        self.name = name
+        self.data = data
+        self.step = step
+        self.args = args
+        self.value = None
+        self.loaded = False
+
+    @property
+    def stored(self):
+        return self.data is not None
+
+
+class _CacheSession:
+    """Keys and lazy outputs for one run of a pipeline."""
+
+    def __init__(self, cache, pipeline):
+        self.cache = cache
+        self.pipeline = pipeline
+        self.keys = {}
+        self.resources = cache.token(pipeline.defn.resources)
+
+    def step_key(self, step, args):
+        """Return the key for running step on args, and whether it is stable.
+
+        Returns None if an argument cannot be fingerprinted.
+        """
+        res_token, stable = self.resources
+        step_token, step_stable = self.cache.token(
+            self.pipeline.defn.steps[step.name]
+        )
+        stable = stable and step_stable
+        arg_keys = []
+        for name, value in sorted(args.items()):
+            if name in _ignored_args:
+                continue
+            if isinstance(value, _Lazy) or name in self.keys:
+                arg_key, arg_stable = self.keys[name]
+            else:
+                try:
+                    arg_key, arg_stable = self.cache.fingerprint(value)
+                except (TypeError, ValueError):
+                    return None
+                self.keys[name] = (arg_key, arg_stable)
+            stable = stable and arg_stable
+            arg_keys.append((name, arg_key))
+        data = repr((serialize.VERSION, code_digest() if stable else None,
+                     res_token, step_token, arg_keys))
+        return hashlib.sha256(data.encode()).hexdigest(), stable
+
+    def lookup(self, step, args, key, stable):
+        """Return the lazy outputs of step for args, if they are stored."""
+        entry = self.cache.get(key, stable)
+        if entry is None:
+            self.cache.misses += 1
+            return None
+        self.cache.hits += 1
+        names, stored = entry
+        results = {}
+        for name in names:
+            if name in stored:
+                results[name] = _Lazy(name, data=stored[name])
+            else:
+                results[name] = _Lazy(name, step=step, args=args)
+        self.set_keys(key, stable, entry)
+        return results
+
+    def store(self, key, stable, results):
+        """Store the results of a step, run with the given key."""
+        self.set_keys(key, stable, self.cache.put(key, stable, results))
+
+    def set_keys(self, key, stable, entry):
+        """Set the keys of the outputs of a step.
+
+        The key of a stored output is the hash of its serialization, which
+        is stable. The key of another output is derived from the key of the
+        step.
+        """
+        names, stored = entry
+        for name in names:
+            if name in stored:
+                digest = hashlib.sha256(stored[name]).hexdigest()
+                self.keys[name] = (digest, True)
+            else:
+                data = f'{key}/{name}'.encode()
+                self.keys[name] = (hashlib.sha256(data).hexdigest(), stable)
+
+    def forget(self, results):
+        """Forget the keys of the results of a step that is not cached."""
+        for name in results:
+            self.keys.pop(name, None)
+
+    def materialize(self, args, needed=None):
+        """Replace the lazy values in args by actual values.
+
+        Arguments:
+            args: The arguments.
+            needed: The names of the arguments to materialize, or None
+                for all of them.
+
+        Returns:
+            The new arguments.
+
+        """
+        args = dict(args)
+        for name, value in list(args.items()):
+            if isinstance(value, _Lazy) and (needed is None or name in needed):
+                args[name] = self.load(value)
+        return args
+
+    def load(self, lazy):
+        """Return the value of a _Lazy."""
+        if not lazy.loaded:
+            if lazy.stored:
+                g, = serialize.loads(lazy.data)
+                value = g.output.value
+                mng = getattr(self.pipeline.resources, 'manager', None)
+                if isinstance(value, Graph) and mng is not None:
+                    mng.add_graph(value)
+            else:
+                results = lazy.step.step(**self.materialize(lazy.args))
+                value = results[lazy.name]
+            lazy.value = value
+            lazy.loaded = True
+        return lazy.value
+
+    def finish(self, args):
+        """Return the final results of a run.
+
+        Stored outputs are loaded, and the others are dropped.
+        """
+        return {name: self.load(value) if isinstance(value, _Lazy) else value
+                for name, value in args.items()
+                if not isinstance(value, _Lazy) or value.stored}
@@ -154,7 +154,13 @@ class PipelineDefinition:
         )
 
     def make(self):
-        """Create a Pipeline from this definition."""
+        """Create a Pipeline from this definition.
+
+        Each Pipeline has its own resources, but the parts of them that do
+        not change once built (the converter's initial table, the
+        inferrers' setup) are shared by all the Pipelines, so making a
+        Pipeline for each run is cheap.
+        """
         return Pipeline(self)
 
     def run(self, **args):
@@ -239,8 +245,13 @@ class _PipelineSlice:
 
         Errors are put in the 'error' key of the result, and the step
         at which an error happened is put in the 'error_step' key.
+
+        If the pipeline has a `step_cache` resource, the cacheable steps
+        are skipped when their outputs are in the cache (see `StepCache`).
         """
         profile = args.get('profile', no_prof)
+        cache = getattr(self.pipeline.resources, 'step_cache', None)
+        session = cache.session(self.pipeline) if cache else None
         with profile:
             for step in self.pipeline._seq[self.slice]:
                 if 'error' in args:
@@ -249,17 +260,40 @@ class _PipelineSlice:
                     valid_args, rest = partition_keywords(step.step, args)
                     try:
                         with profile.step(step.name):
-                            results = step.step(**valid_args)
-                            if (not isinstance(results, dict) and
-                                    len(valid_args) == 1):
-                                field_name, = valid_args.keys()
-                                results = {field_name: results}
+                            if session:
+                                results = self._run_cached(
+                                    session, step, valid_args
+                                )
+                            else:
+                                results = self._run(step, valid_args)
                             args = {**args, **results}
                     except Exception as e:
                         args['error'] = e
                         args['error_step'] = step
+            if session:
+                args = session.finish(args)
             return args
 
+    def _run(self, step, valid_args):
+        results = step.step(**valid_args)
+        if not isinstance(results, dict) and len(valid_args) == 1:
+            field_name, = valid_args.keys()
+            results = {field_name: results}
+        return results
+
+    def _run_cached(self, session, step, valid_args):
+        key = step.cacheable and session.step_key(step, valid_args)
+        if key:
+            results = session.lookup(step, valid_args, *key)
+            if results is not None:
+                return results
+        results = self._run(step, session.materialize(valid_args))
+        if key and 'error' not in results:
+            session.store(*key, results)
+        else:
+            session.forget(results)
+        return results
+
     def __call__(self, **args):
         results = self.run_and_catch(**args)
         if 'error' in results:
@@ -280,7 +314,22 @@ class PipelineResource(Partializable):
 
 
 class PipelineStep(PipelineResource):
-    """Step in a Pipeline."""
+    """Step in a Pipeline.
+
+    Attributes:
+        cacheable: Whether the outputs of the step only depend on its
+            inputs and configuration, so that they can be stored in the
+            pipeline's `step_cache` resource (see `StepCache`). This can
+            be changed with the `cacheable` key of `pipeline_init`.
+
+    """
+
+    cacheable = False
+
+    def __init__(self, pipeline_init):
+        """Initialize a PipelineStep."""
+        super().__init__(pipeline_init)
+        self.cacheable = pipeline_init.get('cacheable', self.cacheable)
 
     def step(self, **kwargs):
         """Execute this step only.
@@ -294,13 +343,25 @@ class PipelineStep(PipelineResource):
         return self.pipeline[:self.name](**args)
 
 
-def pipeline_function(fn):
+def pipeline_function(fn=None, *, cacheable=False):
     """Create a pipeline step from a function.
 
     The provided function must receive `self` as its first argument, and
     then the pipeline fields it needs (the variable names are inspected
     by the pipeline to determine what values to give this step).
+
+    Arguments:
+        fn: The function.
+        cacheable: Whether the outputs of the function only depend on its
+            inputs, so that the step can be skipped if they were computed
+            before (see `PipelineStep`).
     """
+    if fn is None:
+        return lambda fn: pipeline_function(fn, cacheable=cacheable)
+
     class PipelineStepFunction(PipelineStep):
         step = fn
+    PipelineStepFunction.cacheable = cacheable
+    PipelineStepFunction.__module__ = fn.__module__
+    PipelineStepFunction.__qualname__ = fn.__qualname__
     return PipelineStepFunction.partial()
@@ -6,10 +6,13 @@ from types import FunctionType
 
 from .. import dtype, operations, parser, composite as C
 from ..specialize import TypeSpecializer
-from ..abstract import AbstractFunction, InferenceEngine
-from ..ir import Graph, clone
-from ..prim import ops as P
-from ..utils import overload, TypeMap
+from ..abstract import AbstractFunction, InferenceEngine, InferenceError, \
+    TypedPrimitive, GraphFunction, Context, VirtualReference, \
+    abstract_clone, concretize_abstract
+from ..graph_utils import toposort, FOLLOW, NOFOLLOW
+from ..ir import Constant, Graph, clone, succ_incoming
+from ..prim import ops as P, Primitive
+from ..utils import overload, OrderedSet, TypeMap
 
 from .pipeline import PipelineResource
 
@@ -284,6 +287,55 @@ class _Unconverted:
         self.value = value
 
 
+_type_map = {
+    bool: dtype.Bool,
+    int: dtype.Int,
+    float: dtype.Float,
+    np.ndarray: dtype.Array,
+    np.int8: dtype.Int,
+    np.int16: dtype.Int,
+    np.int32: dtype.Int,
+    np.int64: dtype.Int,
+    np.float16: dtype.Float,
+    np.float32: dtype.Float,
+    np.float64: dtype.Float,
+    tuple: dtype.Tuple,
+    list: dtype.List,
+}
+
+
+_object_map_tables = {}
+
+
+def _object_map_table(object_map, py_implementations, method_map):
+    """Return the table a ConverterResource starts from.
+
+    The table only depends on its sources, so it is built once for each
+    combination of them and copied by each ConverterResource. It is built
+    again if entries were registered in object_map or py_implementations
+    in the meantime.
+    """
+    key = (id(object_map), id(py_implementations), id(method_map))
+    sizes = (len(object_map), len(py_implementations))
+    entry = _object_map_tables.get(key, None)
+    if entry is not None and entry[1] == sizes:
+        return entry[2]
+    table = {}
+    for k, v in object_map.items():
+        table[k] = _Unconverted(v)
+    for prim, impl in py_implementations.items():
+        table[impl] = prim
+    for t1, t2 in _type_map.items():
+        for name, prim in method_map[t2].items():
+            method = getattr(t1, name, None)
+            if method is not None:
+                table[method] = _Unconverted(prim)
+    # The sources are kept so that their ids are not reused
+    _object_map_tables[key] = \
+        ((object_map, py_implementations, method_map), sizes, table)
+    return table
+
+
 class ConverterResource(PipelineResource):
     """Convert a Python object into an object that can be in a Myia graph."""
 
@@ -291,32 +343,11 @@ class ConverterResource(PipelineResource):
         """Initialize a Converter."""
         super().__init__(pipeline_init)
         self.converter = converter
-        self.object_map = {}
-        for k, v in object_map.items():
-            self.object_map[k] = _Unconverted(v)
-        for prim, impl in self.resources.py_implementations.items():
-            self.object_map[impl] = prim
-        type_map = {
-            bool: dtype.Bool,
-            int: dtype.Int,
-            float: dtype.Float,
-            np.ndarray: dtype.Array,
-            np.int8: dtype.Int,
-            np.int16: dtype.Int,
-            np.int32: dtype.Int,
-            np.int64: dtype.Int,
-            np.float16: dtype.Float,
-            np.float32: dtype.Float,
-            np.float64: dtype.Float,
-            tuple: dtype.Tuple,
-            list: dtype.List,
-        }
-        mmap = self.resources.method_map
-        for t1, t2 in type_map.items():
-            for name, prim in mmap[t2].items():
-                method = getattr(t1, name, None)
-                if method is not None:
-                    self.object_map[method] = _Unconverted(prim)
+        self.object_map = dict(_object_map_table(
+            object_map,
+            self.resources.py_implementations,
+            self.resources.method_map,
+        ))
 
     def __call__(self, value):
         """Convert a value."""
@@ -333,28 +364,91 @@ class ConverterResource(PipelineResource):
         return v
 
 
+class _NotLocal(Exception):
+    """Raised when graphs cannot be respecialized in place."""
+
+
+@abstract_clone.variant
+def _check_no_function(self, x: AbstractFunction):
+    raise _NotLocal()
+
+
+def _own_nodes(g):
+    """Return the nodes of g and the nodes it uses, in order."""
+    def include(node):
+        return FOLLOW if node.graph is g else NOFOLLOW
+
+    return list(toposort(g.return_, succ_incoming, include))
+
+
 class InferenceResource(PipelineResource):
-    """Performs inference and specialization."""
+    """Performs inference and specialization.
+
+    The resource keeps track of the graphs that change after they are
+    specialized, through the manager's events. `renormalize` does nothing
+    if none of the graphs reachable from the graph to renormalize changed
+    since it was specialized, for the same arguments. Otherwise, only the
+    graphs that changed are inferred again and their nodes are typed in
+    place, as long as the types seen by the other graphs stay the same.
+    When they do not, the whole cluster is inferred and specialized again.
+
+    If a memo is given, it is shared by the engines of all the pipelines
+    made with this resource, so that they can reuse each other's
+    inference results. There is none by default; it can be enabled with
+    `configure({'inferrer.memo': InferenceMemo()})`.
+
+    The other keyword arguments are passed to the InferenceEngine and
+    control how many contexts each graph may be inferred in.
+    """
 
     def __init__(self,
                  pipeline_init,
                  constructors,
-                 context_class):
+                 context_class,
+                 memo=None,
+                 max_contexts=None,
+                 broaden_after=None,
+                 max_depth=None):
         """Initialize an InferenceResource."""
         super().__init__(pipeline_init)
         self.manager = self.resources.manager
         self.context_class = context_class
         self.constructors = constructors
+        self.memo = memo
         self.engine = InferenceEngine(
             self.pipeline,
             constructors=self.constructors,
             context_class=self.context_class,
+            memo=self.memo,
+            max_contexts=max_contexts,
+            broaden_after=broaden_after,
+            max_depth=max_depth,
         )
+        self.dirty = OrderedSet()
+        self._argspec = None
+        self._normal = None
+        evts = self.manager.events
+        evts.add_node.register(self._on_mod_node)
+        evts.drop_node.register(self._on_mod_node)
+        evts.add_edge.register(self._on_mod_edge)
+        evts.drop_edge.register(self._on_mod_edge)
+        evts.add_graph.register(self._on_mod_graph)
+        evts.drop_graph.register(self._on_mod_graph)
+
+    def _on_mod_node(self, event, node):
+        if node.graph is not None:
+            self.dirty.add(node.graph)
+
+    def _on_mod_edge(self, event, node, key, inp):
+        self.dirty.add(node.graph)
+
+    def _on_mod_graph(self, event, graph):
+        self.dirty.add(graph)
 
     def infer(self, graph, argspec, outspec=None, clear=False):
         """Perform inference."""
         if clear:
-            self.engine.cache.clear()
+            self.engine.clear()
             for node in self.manager.all_nodes:
                 orig_t = node.abstract
                 node.abstract = None
@@ -362,10 +456,12 @@ class InferenceResource(PipelineResource):
                         and not isinstance(orig_t, AbstractFunction):
                     if orig_t is not None:
                         node.abstract = orig_t
+        argspec = tuple(arg['abstract'] if isinstance(arg, dict)
+                        else arg for arg in argspec)
+        self._argspec = argspec
         return self.engine.run(
             graph,
-            argspec=tuple(arg['abstract'] if isinstance(arg, dict)
-                          else arg for arg in argspec),
+            argspec=argspec,
             outspec=outspec,
         )
 
@@ -374,9 +470,220 @@ class InferenceResource(PipelineResource):
         spc = TypeSpecializer(self.engine)
         result = spc.run(graph, context)
         self.manager.keep_roots(result)
+        self.dirty.clear()
+        self._normal = (result, self._argspec)
         return result
 
+    def _is_last(self, graph, argspec):
+        """Check if graph is the result of the last specialization."""
+        if self._normal is None:
+            return False
+        normal, normal_argspec = self._normal
+        argspec = tuple(arg['abstract'] if isinstance(arg, dict)
+                        else arg for arg in argspec)
+        return graph is normal and argspec == normal_argspec
+
+    def is_normal(self, graph, argspec, outspec=None):
+        """Check whether renormalizing the graph would be useless.
+
+        This is the case if the graph was the result of the last
+        specialization, for the same argspec, and if none of the graphs it
+        may call changed since. The graph's output must also match
+        outspec, if it is given. A single changed graph makes the whole
+        cluster abnormal.
+        """
+        if not self._is_last(graph, argspec):
+            return False
+        if outspec is not None and outspec != graph.output.abstract:
+            return False
+        if self.dirty:
+            reach = self.manager.graphs_reachable[graph]
+            if graph in self.dirty or any(g in reach for g in self.dirty):
+                return False
+        return True
+
+    def _ancestors(self, g):
+        parents = self.manager.parents
+        res = []
+        g = parents.get(g, None)
+        while g is not None:
+            res.append(g)
+            g = parents.get(g, None)
+        return res
+
+    async def _reinfer(self, engine, g):
+        """Infer g with the abstract values of its and its parents' params.
+
+        The context of g is built from the parameters of the graphs it
+        is nested in, so that it can refer to their nodes.
+        """
+        ctx = Context.empty()
+        for parent in reversed(self._ancestors(g)):
+            args = tuple(p.abstract for p in parent.parameters)
+            ctx = ctx.add(parent, args)
+        inf = engine.get_inferrer_for(GraphFunction(g, ctx))
+        argrefs = [VirtualReference(p.abstract) for p in g.parameters]
+        await inf.run(engine, None, argrefs)
+
+    async def _collect(self, engine, graphs, nodes):
+        """Return the values of the nodes of each graph, and their calls.
+
+        The calls of a function constant map the arguments it was called
+        with to the result. None is returned if a graph was not inferred
+        in exactly one context.
+        """
+        values = {}
+        calls = {}
+        for g in graphs:
+            contexts = engine.graph_contexts.get(g, ())
+            if len(contexts) != 1:
+                return None
+            ctx, = contexts
+            for node in nodes[g]:
+                v = await engine.ref(node, ctx).get()
+                values[node] = v = await concretize_abstract(v)
+                if node.is_constant() and isinstance(v, AbstractFunction):
+                    inf = engine.get_inferrer_for(v.get_unique())
+                    calls[node] = {
+                        tuple([await concretize_abstract(a) for a in args]):
+                        await concretize_abstract(out)
+                        for args, out in list(inf.cache.items())
+                    }
+        return values, calls
+
+    def respecialize_dirty(self, graph):
+        """Infer and specialize again, in place, the graphs that changed.
+
+        The graphs that did not change keep their abstract values, and all
+        the graphs keep their identities. The changed graphs are inferred
+        with the abstract values of their parameters, and a call they make
+        to another graph uses the abstract value of its output.
+
+        Returns False if the changes cannot be handled this way: if they
+        change the type of a node that was already typed, need a graph to
+        be specialized for new arguments, or give new functions to the
+        graphs that did not change. The nodes of the changed graphs may then
+        have lost their abstract values, and the graph must be
+        renormalized as a whole.
+        """
+        mng = self.manager
+        reach = mng.graphs_reachable[graph]
+        graphs = [g for g in self.dirty
+                  if (g is graph or g in reach) and g in mng.graphs]
+        dirty = set(graphs)
+
+        # Each use of a function gets its own constant, since its abstract
+        # value depends on the call.
+        for g in graphs:
+            for node in _own_nodes(g):
+                if node.is_constant() and len(mng.uses[node]) > 1 \
+                        and (node.abstract is None
+                             or isinstance(node.abstract, AbstractFunction)):
+                    for user, i in list(mng.uses[node]):
+                        if user.graph in dirty:
+                            mng.set_edge(user, i, Constant(node.value))
+        nodes = {g: _own_nodes(g) for g in graphs}
+
+        # The abstract values from the last specialization that are used
+        kept = []
+        old = {}
+        for g in graphs:
+            for parent in [g, *self._ancestors(g)]:
+                kept += [p.abstract for p in parent.parameters]
+            for node in nodes[g]:
+                if node.is_constant_graph() and node.value not in dirty:
+                    kept.append(node.value.output.abstract)
+                if node.is_constant():
+                    if node.abstract is not None \
+                            and not isinstance(node.abstract,
+                                               AbstractFunction):
+                        kept.append(node.abstract)
+                        continue
+                elif node.graph is not g or not node.is_apply():
+                    kept.append(node.abstract)
+                    continue
+                old[node] = node.abstract
+        try:
+            for a in kept:
+                # They may refer to graphs that are gone
+                _check_no_function(a)
+        except _NotLocal:
+            return False
+
+        for node in old:
+            node.abstract = None
+        # The inferrers of the main engine would remember the calls made
+        # here, so a separate engine is used.
+        engine = InferenceEngine(
+            self.pipeline,
+            constructors=self.constructors,
+            context_class=self.context_class,
+        )
+        try:
+            for g in graphs:
+                if not any(parent in dirty for parent in self._ancestors(g)):
+                    engine.run_coroutine(self._reinfer(engine, g))
+            values = engine.run_coroutine(
+                self._collect(engine, graphs, nodes)
+            )
+        except InferenceError:
+            return False
+        if values is None:
+            return False
+        values, calls = values
+
+        new = {}
+        for node, prev in old.items():
+            v = values[node]
+            if node.is_apply():
+                if isinstance(v, AbstractFunction):
+                    # The graphs that did not change would still refer to
+                    # the previous value.
+                    if node is node.graph.return_ \
+                            or any(user.graph not in dirty
+                                   for user, _ in mng.uses[node]):
+                        return False
+                elif prev is not None and v != prev:
+                    return False
+            elif isinstance(v, AbstractFunction):
+                fn_calls = calls[node]
+                if not fn_calls:
+                    return False
+                if node.is_constant(Primitive):
+                    if len(fn_calls) != 1:
+                        return False
+                    (args, out), = fn_calls.items()
+                    v = AbstractFunction(
+                        TypedPrimitive(node.value, args, out)
+                    )
+                elif node.is_constant_graph():
+                    params = tuple(p.abstract
+                                   for p in node.value.parameters)
+                    if any(args != params for args in fn_calls):
+                        return False
+                else:
+                    return False
+            new[node] = v
+
+        for node, v in new.items():
+            node.abstract = v
+        self.dirty.clear()
+        return True
+
     def renormalize(self, graph, argspec, outspec=None):
-        """Perform inference and specialization."""
+        """Perform inference and specialization.
+
+        The graph is returned as is if it is already normal, as
+        determined by `is_normal`. Otherwise, if it is the result of the
+        last specialization, for the same argspec, the graphs that changed
+        since are inferred and specialized again in place, if
+        `respecialize_dirty` can do it. Otherwise, all the graphs it can
+        reach are inferred and specialized again.
+        """
+        if self.is_normal(graph, argspec, outspec):
+            return graph
+        if self._is_last(graph, argspec) and self.respecialize_dirty(graph):
+            if outspec is None or outspec == graph.output.abstract:
+                return graph
         _, context = self.infer(graph, argspec, outspec, clear=True)
         return self.specialize(graph, context)
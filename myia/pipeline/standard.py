@@ -26,7 +26,9 @@ standard_resources = dict(
     inferrer=InferenceResource.partial(
         constructors=abstract_inferrer_constructors,
         context_class=Context,
-    )
+        memo=None,
+    ),
+    step_cache=None,
 )
 
 
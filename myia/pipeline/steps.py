@@ -5,17 +5,18 @@ The steps are listed in roughly the same order they should be called.
 
 
 import numpy as np
+from collections import OrderedDict
 from itertools import count
 
 from .. import dtype
 from ..abstract import AbstractTuple, AbstractList, AbstractClass, \
-    AbstractArray, TYPE, AbstractScalar
+    AbstractArray, TYPE, AbstractScalar, InferenceStatistics
 from ..cconv import closure_convert
 from ..ir import Graph
 from ..opt import lib as optlib, CSE, erase_class, erase_tuple, NodeMap, \
-    LocalPassOptimizer
+    LocalPassOptimizer, OptimizerStatistics, Worklist
 from ..prim import vm_registry
-from ..utils import overload, flatten, no_prof
+from ..utils import overload, no_prof, prof_counter
 from ..validate import validate, whitelist as default_whitelist, \
     validate_abstract as default_validate_abstract
 from ..vm import VM
@@ -41,6 +42,8 @@ class Optimizer(PipelineStep):
         graph: The optimized graph.
     """
 
+    cacheable = True
+
     def __init__(self,
                  pipeline_init,
                  phases,
@@ -48,6 +51,7 @@ class Optimizer(PipelineStep):
         """Initialize an Optimizer."""
         super().__init__(pipeline_init)
         self.run_only_once = run_only_once
+        self.stats = None
         self.phases = []
         self.names = []
         for name, spec in phases.items():
@@ -67,30 +71,111 @@ class Optimizer(PipelineStep):
             self.run_only_once = True
 
     def step(self, graph, argspec=None, outspec=None, profile=no_prof):
-        """Optimize the graph using the given patterns."""
+        """Optimize the graph using the given patterns.
+
+        Each phase is given a Worklist that records the changes made to the
+        graph since it last ran:
+
+        * Local passes only revisit the nodes affected by these changes.
+        * Renormalization runs if nodes without a type were introduced. If
+          the graph changed otherwise, it is deferred until the local passes
+          stop making changes, since types may only be refined then.
+        * Other phases only run if the graph changed.
+
+        Once no phase reports changes, all local passes are run over the
+        whole graph to confirm that the fixpoint is reached.
+
+        If profiling, an OptimizerStatistics is recorded in the profile
+        under this step's name, with the number of iterations of each
+        phase and the attempts, matches and replacements of each rule.
+        """
+        mng = self.resources.manager
+        worklists = [Worklist(mng) for _ in self.phases]
+        self.stats = profile.record(self.name, OptimizerStatistics)
+        try:
+            return self._run(graph, argspec, outspec, worklists, profile)
+        finally:
+            self.stats = None
+            for wl in worklists:
+                wl.close()
+
+    def _run(self, graph, argspec, outspec, worklists, profile):
+        mng = self.resources.manager
+        # Whether local passes changed the graph since it was last typed.
+        # The input graph should be fully typed.
+        stale = False
+
+        stats = self.stats
         with profile:
             counter = count(1)
             changes = True
             while changes:
                 with profile.lap(next(counter)):
+                    if stats is not None:
+                        stats.iterations += 1
                     changes = False
-                    nn = iter(self.names)
-                    for opt in self.phases:
-                        with profile.step(next(nn)):
+                    local_changes = False
+                    exhaustive = True
+                    for name, opt, wl in zip(self.names, self.phases,
+                                             worklists):
+                        start = prof_counter()
+                        ran = True
+                        chg = False
+                        with profile.step(name):
                             if opt == 'renormalize':
-                                assert argspec is not None
-                                graph = self.resources.inferrer.renormalize(
-                                    graph, argspec, outspec
+                                graph, ran = self._renormalize(
+                                    graph, argspec, outspec, worklists, wl,
+                                    stale and not local_changes
                                 )
-                            elif opt(graph):
-                                changes = True
+                                if ran:
+                                    stale = False
+                                wl.reset()
+                            elif isinstance(opt, LocalPassOptimizer):
+                                exhaustive &= wl.full
+                                ran = bool(wl)
+                                chg = opt(graph, wl)
+                                if chg:
+                                    local_changes = stale = True
+                            elif wl:
+                                chg = opt(graph)
+                                wl.reset()
+                            else:
+                                ran = False
+                        changes = changes or bool(chg)
+                        if stats is not None:
+                            stats.add_phase(name, ran, chg,
+                                            prof_counter() - start)
                     if self.run_only_once:
                         break
+                    if not changes and not exhaustive:
+                        # Confirm the fixpoint with full passes
+                        for opt, wl in zip(self.phases, worklists):
+                            if isinstance(opt, LocalPassOptimizer):
+                                wl.full = True
+                        changes = True
             with profile.step('keep_roots'):
-                self.resources.manager.keep_roots(graph)
+                mng.keep_roots(graph)
             res = {'graph': graph}
             return res
 
+    def _renormalize(self, graph, argspec, outspec, worklists, wl, stale):
+        if not stale and not wl.untyped():
+            return graph, False
+        assert argspec is not None
+        # All nodes must be revisited anyway, so there is no need to track
+        # the new ones.
+        for wl2 in worklists:
+            wl2.close()
+        try:
+            graph = self.resources.inferrer.renormalize(
+                graph, argspec, outspec
+            )
+            self.resources.manager.add_graph(graph)
+        finally:
+            for wl2 in worklists:
+                wl2.open()
+        return graph, True
+
 
 #########
 # Parse #
@@ -117,7 +202,10 @@ def step_parse(self, input):
 ###########
 
 
+# The result depends on the current values of the globals, which are not
+# part of the input graph, so it is not cached
 step_resolve = Optimizer.partial(
+    pipeline_init={'cacheable': False},
     run_only_once=True,
     phases=dict(
         resolve=[optlib.resolve_globals]
@@ -130,10 +218,13 @@ step_resolve = Optimizer.partial(
 #########
 
 
-@pipeline_function
-def step_infer(self, graph, argspec):
+@pipeline_function(cacheable=True)
+def step_infer(self, graph, argspec, profile=no_prof):
     """Infer types, shapes, values, etc. for the graph.
 
+    If profiling, an InferenceStatistics is recorded in the profile under
+    this step's name.
+
     Inputs:
         graph: The graph to infer.
         argspec: Information about argument types.
@@ -142,6 +233,8 @@ def step_infer(self, graph, argspec):
         outspec: Inference results for the graph's output.
         inference_context: The Context for the root graph.
     """
+    engine = self.resources.inferrer.engine
+    engine.stats = profile.record(self.name, InferenceStatistics)
     try:
         res, context = self.resources.inferrer.infer(graph, argspec)
         return {'outspec': res,
@@ -152,6 +245,8 @@ def step_infer(self, graph, argspec):
         # if an error occurred.
         return {'error': exc,
                 'error_step': self}
+    finally:
+        engine.stats = None
 
 
 ##############
@@ -159,7 +254,7 @@ def step_infer(self, graph, argspec):
 ##############
 
 
-@pipeline_function
+@pipeline_function(cacheable=True)
 def step_specialize(self, graph, inference_context):
     """Specialize the graph according to argument types.
 
@@ -181,7 +276,7 @@ def step_specialize(self, graph, inference_context):
 ####################
 
 
-@pipeline_function
+@pipeline_function(cacheable=True)
 def step_erase_class(self, graph, argspec, outspec):
     """Replace the Class type by Tuple type.
 
@@ -333,7 +428,7 @@ step_opt2 = Optimizer.partial(
 ####################
 
 
-@pipeline_function
+@pipeline_function(cacheable=True)
 def step_erase_tuple(self, graph, argspec, outspec, erase_class=False):
     """Expand Tuple in graph parameters whenever possible.
 
@@ -372,6 +467,8 @@ class Validator(PipelineStep):
         None.
     """
 
+    cacheable = True
+
     def __init__(self,
                  pipeline_init,
                  whitelist=default_whitelist,
@@ -400,7 +497,7 @@ step_validate = Validator.partial()
 ######################
 
 
-@pipeline_function
+@pipeline_function(cacheable=True)
 def step_cconv(self, graph):
     """Closure convert the graph.
 
@@ -419,145 +516,287 @@ def step_cconv(self, graph):
 ############################
 
 
+class _ConverterBuilder:
+    """Build the source code of a converter function.
+
+    The converter is generated for given types, as straight-line code, so
+    that it does not dispatch on the types or iterate over the fields of
+    the values when it is called.
+    """
+
+    def __init__(self, validate):
+        self.validate = validate
+        self.lines = []
+        self.env = {'np': np}
+        self.count = count()
+
+    def var(self):
+        return f'v{next(self.count)}'
+
+    def const(self, value):
+        name = f'c{next(self.count)}'
+        self.env[name] = value
+        return name
+
+    def emit(self, line):
+        self.lines.append(line)
+
+    def check(self, cond, msg):
+        if self.validate:
+            self.emit(f'if not ({cond}): raise TypeError({msg!r})')
+
+    def unpack(self, x, n):
+        """Assign the n elements of x to new variables."""
+        vs = [self.var() for _ in range(n)]
+        if vs:
+            self.emit(f'{", ".join(vs)}, = {x}')
+        return vs
+
+    def function(self, name, nparams, gen):
+        """Generate a function.
+
+        Arguments:
+            name: The name of the function.
+            nparams: The number of parameters of the function.
+            gen: Called with the builder and the names of the parameters,
+                returns the expression to return.
+        """
+        params = [self.var() for _ in range(nparams)]
+        ret = gen(self, params)
+        body = ''.join(f'    {line}\n' for line in self.lines)
+        src = f'def {name}({", ".join(params)}):\n{body}    return {ret}\n'
+        exec(compile(src, f'<{name}>', 'exec'), self.env)
+        return self.env[name]
+
+
+def _tuple_expr(parts):
+    return f'({", ".join(parts)}{"," if len(parts) == 1 else ""})'
+
+
 @overload(bootstrap=True)
-def convert_arg(self, arg, orig_t: AbstractTuple):
-    if not isinstance(arg, tuple):
-        raise TypeError('Expected tuple')
+def _gen_arg(self, b, x, orig_t: AbstractTuple):
     oe = orig_t.elements
-    if len(arg) != len(oe):
-        raise TypeError(f'Expected {len(oe)} elements')
-    return list(flatten(self(x, o)
-                        for x, o in zip(arg, oe)))
+    b.check(f'isinstance({x}, tuple)', 'Expected tuple')
+    b.check(f'len({x}) == {len(oe)}', f'Expected {len(oe)} elements')
+    return [y for v, o in zip(b.unpack(x, len(oe)), oe)
+            for y in self(b, v, o)]
 
 
 @overload  # noqa: F811
-def convert_arg(self, arg, orig_t: AbstractList):
-    if not isinstance(arg, list):
-        raise TypeError('Expected list')
-    ot = orig_t.element
-    return [list(flatten(self(x, ot) for x in arg))]
+def _gen_arg(self, b, x, orig_t: AbstractList):
+    conv = b.const(arg_converter((orig_t.element,), b.validate))
+    b.check(f'isinstance({x}, list)', 'Expected list')
+    v = b.var()
+    b.emit(f'{v} = [y for e in {x} for y in {conv}(e)]')
+    return [v]
 
 
 @overload  # noqa: F811
-def convert_arg(self, arg, orig_t: AbstractClass):
+def _gen_arg(self, b, x, orig_t: AbstractClass):
     dc = dtype.tag_to_dataclass[orig_t.tag]
-    if not isinstance(arg, dc):
-        raise TypeError(f'Expected {dc.__qualname__}')
-    arg = tuple(getattr(arg, attr) for attr in orig_t.attributes)
-    oe = list(orig_t.attributes.values())
-    return list(flatten(self(x, o)
-                        for x, o in zip(arg, oe)))
+    b.check(f'isinstance({x}, {b.const(dc)})', f'Expected {dc.__qualname__}')
+    rval = []
+    for attr, o in orig_t.attributes.items():
+        v = b.var()
+        b.emit(f'{v} = {x}.{attr}')
+        rval += self(b, v, o)
+    return rval
 
 
 @overload  # noqa: F811
-def convert_arg(self, arg, orig_t: AbstractArray):
-    if not isinstance(arg, np.ndarray):
-        raise TypeError('Expected ndarray')
+def _gen_arg(self, b, x, orig_t: AbstractArray):
     et = orig_t.element
     assert isinstance(et, AbstractScalar)
     et = et.values[TYPE]
     assert dtype.ismyiatype(et, dtype.Number)
-    dt = dtype.type_to_np_dtype(et)
-    if arg.dtype != dt:
-        raise TypeError('Wrong dtype')
-    return [arg]
+    dt = b.const(dtype.type_to_np_dtype(et))
+    b.check(f'isinstance({x}, np.ndarray)', 'Expected ndarray')
+    b.check(f'{x}.dtype == {dt}', 'Wrong dtype')
+    return [x]
 
 
 @overload  # noqa: F811
-def convert_arg(self, arg, orig_t: AbstractScalar):
+def _gen_arg(self, b, x, orig_t: AbstractScalar):
     t = orig_t.values[TYPE]
-    if dtype.ismyiatype(t, dtype.Int):
-        if not isinstance(arg, int):
-            raise TypeError(f'Expected int')
-    elif dtype.ismyiatype(t, dtype.Float):
-        if not isinstance(arg, float):
-            raise TypeError(f'Expected float')
-    elif dtype.ismyiatype(t, dtype.Bool):
-        if not isinstance(arg, bool):
-            raise TypeError(f'Expected bool')
-    else:
-        raise TypeError(f'Invalid type: {t}')
-    return [arg]
+    for base, pytype in ((dtype.Int, int),
+                         (dtype.Float, float),
+                         (dtype.Bool, bool)):
+        if dtype.ismyiatype(t, base):
+            b.check(f'isinstance({x}, {pytype.__name__})',
+                    f'Expected {pytype.__name__}')
+            return [x]
+    b.emit(f'raise TypeError({f"Invalid type: {t}"!r})')
+    return [x]
 
 
 @overload(bootstrap=True)
-def convert_result(self, res, orig_t, vm_t: AbstractClass):
-    dc = dtype.tag_to_dataclass[orig_t.tag]
-    oe = orig_t.attributes.values()
-    ve = vm_t.attributes.values()
-    tup = tuple(self(getattr(res, attr), o, v)
-                for attr, o, v in zip(orig_t.attributes, oe, ve))
-    return dc(*tup)
+def _gen_result(self, b, x, orig_t, vm_t: AbstractClass):
+    dc = b.const(dtype.tag_to_dataclass[orig_t.tag])
+    parts = []
+    for attr, o, v in zip(orig_t.attributes,
+                          orig_t.attributes.values(),
+                          vm_t.attributes.values()):
+        y = b.var()
+        b.emit(f'{y} = {x}.{attr}')
+        parts.append(self(b, y, o, v))
+    return f'{dc}({", ".join(parts)})'
 
 
 @overload  # noqa: F811
-def convert_result(self, res, orig_t, vm_t: AbstractList):
-    ot = orig_t.element
-    vt = vm_t.element
-    return [self(x, ot, vt) for x in res]
+def _gen_result(self, b, x, orig_t, vm_t: AbstractList):
+    conv = result_converter(orig_t.element, vm_t.element)
+    return f'[{b.const(conv)}(e) for e in {x}]'
 
 
 @overload  # noqa: F811
-def convert_result(self, res, orig_t, vm_t: AbstractTuple):
+def _gen_result(self, b, x, orig_t, vm_t: AbstractTuple):
     # If the EraseClass opt was applied, orig_t may be Class
-    orig_is_class = isinstance(orig_t, AbstractClass)
-    if orig_is_class:
+    if isinstance(orig_t, AbstractClass):
         oe = orig_t.attributes.values()
     else:
         oe = orig_t.elements
     ve = vm_t.elements
-    tup = tuple(self(x, o, v)
-                for x, o, v in zip(res, oe, ve))
-    if orig_is_class:
-        dc = dtype.tag_to_dataclass[orig_t.tag]
-        return dc(*tup)
+    parts = [self(b, y, o, v)
+             for y, o, v in zip(b.unpack(x, len(ve)), oe, ve)]
+    if isinstance(orig_t, AbstractClass):
+        dc = b.const(dtype.tag_to_dataclass[orig_t.tag])
+        return f'{dc}({", ".join(parts)})'
     else:
-        return tup
+        return _tuple_expr(parts)
 
 
 @overload  # noqa: F811
-def convert_result(self, arg, orig_t, vm_t: AbstractScalar):
-    if isinstance(arg, np.ndarray):
-        return arg.item()
-    else:
-        return arg
+def _gen_result(self, b, x, orig_t, vm_t: AbstractScalar):
+    return f'({x}.item() if isinstance({x}, np.ndarray) else {x})'
 
 
 @overload  # noqa: F811
-def convert_result(self, arg, orig_t, vm_t: AbstractArray):
-    return arg
+def _gen_result(self, b, x, orig_t, vm_t: object):
+    return x
 
 
-@pipeline_function
-def step_wrap(self,
-              graph,
-              output,
-              argspec,
-              outspec,
-              orig_argspec=None,
-              orig_outspec=None,
-              erase_class=False,
-              erase_tuple=False):
-        """Convert args to vm format, and output from vm format."""
+# Generated converters, the least recently used first
+_converters = OrderedDict()
+_max_converters = 1024
+
+
+def _converter(key, make):
+    """Return the converter at key, generating it with make if needed."""
+    conv = _converters.get(key, None)
+    if conv is None:
+        conv = make()
+        _converters[key] = conv
+        while len(_converters) > _max_converters:
+            _converters.popitem(last=False)
+    else:
+        _converters.move_to_end(key)
+    return conv
+
+
+def arg_converter(orig_argspec, validate=True):
+    """Return a function that converts arguments to the VM's format.
+
+    Classes are converted to tuples, and the other values are checked
+    against their abstract value. The function returns a tuple of the
+    converted arguments. It is generated once for each argspec.
+
+    Arguments:
+        orig_argspec: The abstract values of the arguments.
+        validate: Whether to check that the arguments match the argspec.
+            Without the checks, wrong arguments give wrong results.
+    """
+    orig_argspec = tuple(orig_argspec)
+
+    def make():
+        def gen(b, params):
+            return _tuple_expr([y for x, o in zip(params, orig_argspec)
+                                for y in _gen_arg(b, x, o)])
+        return _ConverterBuilder(validate).function(
+            'convert_args', len(orig_argspec), gen
+        )
+
+    return _converter(('arg', orig_argspec, validate), make)
+
+
+def result_converter(orig_t, vm_t):
+    """Return a function that converts a result from the VM's format.
+
+    Tuples that were classes in orig_t are converted back to classes, and
+    scalars in arrays are extracted. The function is generated once for
+    each pair of types.
+    """
+    def make():
+        def gen(b, params):
+            x, = params
+            return _gen_result(b, x, orig_t, vm_t)
+        return _ConverterBuilder(False).function(
+            'convert_result', 1, gen
+        )
+
+    return _converter(('result', orig_t, vm_t), make)
+
+
+class OutputWrapper(PipelineStep):
+    """Pipeline step to convert args to vm format, and output from vm format.
+
+    Inputs:
+        graph: The graph that was compiled.
+        output: The compiled function.
+        argspec: The abstract values of the arguments of the graph.
+        outspec: The abstract value of the output of the graph.
+        orig_argspec: The abstract values of the arguments, before
+            erase_class.
+        orig_outspec: The abstract value of the output, before
+            erase_class.
+
+    Outputs:
+        output: The wrapped function. Its `convert_args` and
+            `convert_result` attributes are the converters it uses, and
+            its `fn` attribute is the compiled function.
+    """
+
+    def __init__(self, pipeline_init, validate=True):
+        """Initialize an OutputWrapper.
+
+        Arguments:
+            pipeline_init: See PipelineStep.
+            validate: Whether to check that the arguments match the
+                argspec. Trusted callers can skip the checks.
+        """
+        super().__init__(pipeline_init)
+        self.validate = validate
+
+    def step(self,
+             graph,
+             output,
+             argspec,
+             outspec,
+             orig_argspec=None,
+             orig_outspec=None,
+             erase_class=False,
+             erase_tuple=False):
+        """Wrap the output."""
         if not (erase_class and erase_tuple):
             raise AssertionError(
                 'OutputWrapper step requires the erase_class/tuple steps'
             )
         fn = output
-        orig_arg_t = orig_argspec or argspec
-        orig_out_t = orig_outspec or outspec
-        vm_out_t = graph.return_.abstract
+        convert_args = arg_converter(orig_argspec or argspec, self.validate)
+        convert_result = result_converter(orig_outspec or outspec,
+                                          graph.return_.abstract)
 
         def wrapped(*args):
-            args = tuple(flatten(convert_arg(arg, ot) for arg, ot in
-                                 zip(args, orig_arg_t)))
-            res = fn(*args)
-            res = convert_result(res, orig_out_t, vm_out_t)
-            return res
+            return convert_result(fn(*convert_args(*args)))
 
+        wrapped.fn = fn
+        wrapped.convert_args = convert_args
+        wrapped.convert_result = convert_result
         return {'output': wrapped}
 
 
+step_wrap = OutputWrapper.partial()
+
+
 ################
 # Debug export #
 ################
@@ -2,15 +2,19 @@
 
 Each primitive is associated to an augmented function, which returns a pair of
 the (augmented) original primitive's output and a backpropagator function.
+
+Primitives are also associated to tangent rules for forward mode (see
+`myia.jvp`). A tangent rule takes each argument of the primitive followed by
+its tangent, and returns a pair of the primitive's output and its tangent.
 """
 
-from ..abstract import AbstractFunction, GraphFunction
+from ..abstract import AbstractFunction, GraphFunction, MetaGraphFunction
 from ..composite import zeros_like
 from ..debug.label import short_labeler, short_relation_symbols as syms
 from ..info import NamedDebugInfo, About
 from ..ir import Constant, Graph, manage, clone, MetaGraph
 from ..pipeline import standard_pipeline
-from ..utils import Registry, newenv
+from ..utils import LazyRegistry, newenv
 
 from . import ops as primops
 from .py_implementations import \
@@ -18,12 +22,21 @@ from .py_implementations import \
     scalar_add, scalar_mul, scalar_div, scalar_sub, scalar_usub, \
     scalar_log, scalar_pow, tuple_setitem, switch, shape, transpose, \
     array_to_scalar, scalar_to_array, distribute, array_reduce, dot, \
-    reshape, scalar_cast, typeof, invert_permutation
+    reshape, scalar_cast, typeof, invert_permutation, scalar_exp, \
+    scalar_sin, scalar_cos, scalar_tan, array_map
+
 
+_parse = None
 
-parse = standard_pipeline \
-    .select('parse') \
-    .make_transformer('input', 'graph')
+
+def parse(fn):
+    """Parse fn into a graph, with the standard pipeline's parser."""
+    global _parse
+    if _parse is None:
+        _parse = standard_pipeline \
+            .select('parse') \
+            .make_transformer('input', 'graph')
+    return _parse(fn)
 
 
 _flags = {'ignore_values': True}
@@ -83,29 +96,39 @@ def bprop_to_augm(prim, fn, flags):
     return clone(outer)
 
 
-augmented_graphs = Registry()
+# The augmented graphs are only parsed the first time they are needed,
+# which keeps the import of this module cheap.
+augmented_graphs = LazyRegistry()
 register = augmented_graphs.register
 
 
 def register_bprop(prim, **flags):
     """Register an augmented function for prim, given a backpropagator."""
     def deco(fn):
-        g = bprop_to_augm(prim, fn, flags)
-        return register(prim)(g)
+        augmented_graphs.register_lazy(prim)(
+            lambda: bprop_to_augm(prim, fn, flags)
+        )
+        return fn
     return deco
 
 
+def augm_to_graph(prim, fn):
+    """Parse the augmented function fn for prim."""
+    g = parse(fn)
+    for g2 in manage(g, weak=True).graphs:
+        name = short_labeler.name(g2)
+        name = name.replace('__fprop__', syms['grad_fprop'])
+        g2.debug.name = name.replace('__bprop__', syms['grad_bprop'])
+        g2.flags.update(_flags)
+    g.transforms['primal'] = prim
+    return g
+
+
 def register_augm(prim):
     """Register an augmented function for prim."""
     def deco(fn):
-        g = parse(fn)
-        for g2 in manage(g, weak=True).graphs:
-            name = short_labeler.name(g2)
-            name = name.replace('__fprop__', syms['grad_fprop'])
-            g2.debug.name = name.replace('__bprop__', syms['grad_bprop'])
-            g2.flags.update(_flags)
-        g.transforms['primal'] = prim
-        return register(prim)(g)
+        augmented_graphs.register_lazy(prim)(lambda: augm_to_graph(prim, fn))
+        return fn
     return deco
 
 
@@ -404,3 +427,290 @@ class ArrayReduceGradient(MetaGraph):
 register(primops.array_reduce)(
     ArrayReduceGradient(name='array_reduce_gradient')
 )
+
+
+#################
+# Tangent rules #
+#################
+
+
+tangent_rules = LazyRegistry()
+
+
+_jvp_flags = {'core': True}
+
+
+def register_jvp(prim):
+    """Register a tangent rule for prim.
+
+    Rules are flagged as core, so that the optimizer inlines them into the
+    forward-mode graphs that call them.
+    """
+    def build(fn):
+        g = parse(fn)
+        g.flags.update(_jvp_flags)
+        g.transforms['primal'] = prim
+        return g
+
+    def deco(fn):
+        tangent_rules.register_lazy(prim)(lambda: build(fn))
+        return fn
+    return deco
+
+
+def _all_tangents(args, tangents):
+    return tangents
+
+
+def _first_tangent(args, tangents):
+    return (tangents[0], *args[1:])
+
+
+def _switch_tangents(args, tangents):
+    cond, _, _ = args
+    _, dtb, dfb = tangents
+    return (cond, dtb, dfb)
+
+
+def _tuple_setitem_tangents(args, tangents):
+    _, idx, _ = args
+    ddata, _, dvalue = tangents
+    return (ddata, idx, dvalue)
+
+
+def _make_record_tangents(args, tangents):
+    return (args[0], *tangents[1:])
+
+
+# Primitives that are linear in some of their arguments. Their tangent is
+# computed by applying them on the tangents of these arguments, and on the
+# other arguments as they are.
+linear_tangents = {
+    primops.scalar_add: _all_tangents,
+    primops.scalar_sub: _all_tangents,
+    primops.scalar_uadd: _all_tangents,
+    primops.scalar_usub: _all_tangents,
+    primops.identity: _all_tangents,
+    primops.make_tuple: _all_tangents,
+    primops.scalar_to_array: _all_tangents,
+    primops.array_to_scalar: _all_tangents,
+    primops.tuple_getitem: _first_tangent,
+    primops.scalar_cast: _first_tangent,
+    primops.distribute: _first_tangent,
+    primops.reshape: _first_tangent,
+    primops.transpose: _first_tangent,
+    primops.switch: _switch_tangents,
+    primops.tuple_setitem: _tuple_setitem_tangents,
+    primops.make_record: _make_record_tangents,
+}
+
+
+# Primitives whose output has a null tangent.
+nondifferentiable = {
+    primops.scalar_eq, primops.scalar_ne,
+    primops.scalar_lt, primops.scalar_gt,
+    primops.scalar_le, primops.scalar_ge,
+    primops.scalar_trunc, primops.scalar_floor,
+    primops.bool_not, primops.bool_and, primops.bool_or, primops.bool_eq,
+    primops.typeof, primops.hastype,
+    primops.shape, primops.broadcast_shape, primops.invert_permutation,
+    primops.tuple_len, primops.list_len, primops.array_len,
+}
+
+
+def apply_jvp(g, prim, args, tangents):
+    """Apply prim on args and their tangents in g.
+
+    Returns:
+        A pair of nodes for the output and its tangent.
+
+    """
+    if prim in linear_tangents:
+        spec = linear_tangents[prim]
+        return (g.apply(prim, *args),
+                g.apply(prim, *spec(args, tangents)))
+    elif prim in nondifferentiable:
+        out = g.apply(prim, *args)
+        return out, g.apply(zeros_like, out)
+    elif prim in tangent_rules:
+        interleaved = [x for pair in zip(args, tangents) for x in pair]
+        res = g.apply(tangent_rules[prim], *interleaved)
+        return (g.apply(primops.tuple_getitem, res, 0),
+                g.apply(primops.tuple_getitem, res, 1))
+    else:
+        raise NotImplementedError(f'No tangent rule for {prim}')
+
+
+class PrimitiveJVP(MetaGraph):
+    """Generate the tangent rule of a primitive that has no rule graph.
+
+    This is used when such a primitive is used as a value rather than
+    called directly, e.g. `array_map(scalar_add, xs, ys)`.
+    """
+
+    def __init__(self, prim):
+        """Initialize a PrimitiveJVP."""
+        super().__init__(f'jvp_{prim}')
+        self.prim = prim
+
+    def generate_graph(self, args):
+        """Generate the tangent rule."""
+        g = Graph()
+        g.debug.name = self.name
+        params = [g.add_parameter() for _ in args]
+        out, dout = apply_jvp(g, self.prim, params[0::2], params[1::2])
+        g.output = g.apply(primops.make_tuple, out, dout)
+        g.flags.update(_jvp_flags)
+        g.transforms['primal'] = self.prim
+        return g
+
+
+_primitive_jvps = {}
+
+
+def primitive_jvp(prim):
+    """Return the tangent rule of prim, as a Graph or a MetaGraph."""
+    if prim in tangent_rules:
+        return tangent_rules[prim]
+    if prim not in _primitive_jvps:
+        _primitive_jvps[prim] = PrimitiveJVP(prim)
+    return _primitive_jvps[prim]
+
+
+def jvp_primal(fn):
+    """Return the primitive whose tangent rule is fn, if any."""
+    if isinstance(fn, GraphFunction):
+        return fn.graph.transforms.get('primal', None)
+    elif isinstance(fn, MetaGraphFunction) \
+            and isinstance(fn.metagraph, PrimitiveJVP):
+        return fn.metagraph.prim
+    return None
+
+
+@register_jvp(primops.scalar_mul)
+def jvp_scalar_mul(x, dx, y, dy):
+    """Tangent rule for primitive `scalar_mul`."""
+    return (scalar_mul(x, y),
+            scalar_add(scalar_mul(dx, y), scalar_mul(x, dy)))
+
+
+@register_jvp(primops.scalar_div)
+def jvp_scalar_div(x, dx, y, dy):
+    """Tangent rule for primitive `scalar_div`."""
+    out = scalar_div(x, y)
+    return (out, scalar_div(scalar_sub(dx, scalar_mul(out, dy)), y))
+
+
+@register_jvp(primops.scalar_pow)
+def jvp_scalar_pow(x, dx, y, dy):
+    """Tangent rule for primitive `scalar_pow`."""
+    out = scalar_pow(x, y)
+    return (out,
+            scalar_add(
+                scalar_mul(dx, scalar_mul(y, scalar_pow(x, scalar_sub(y, 1)))),
+                scalar_mul(dy, scalar_mul(scalar_log(x), out))
+            ))
+
+
+@register_jvp(primops.scalar_exp)
+def jvp_scalar_exp(x, dx):
+    """Tangent rule for primitive `scalar_exp`."""
+    out = scalar_exp(x)
+    return (out, scalar_mul(dx, out))
+
+
+@register_jvp(primops.scalar_log)
+def jvp_scalar_log(x, dx):
+    """Tangent rule for primitive `scalar_log`."""
+    return (scalar_log(x), scalar_div(dx, x))
+
+
+@register_jvp(primops.scalar_sin)
+def jvp_scalar_sin(x, dx):
+    """Tangent rule for primitive `scalar_sin`."""
+    return (scalar_sin(x), scalar_mul(dx, scalar_cos(x)))
+
+
+@register_jvp(primops.scalar_cos)
+def jvp_scalar_cos(x, dx):
+    """Tangent rule for primitive `scalar_cos`."""
+    return (scalar_cos(x), scalar_usub(scalar_mul(dx, scalar_sin(x))))
+
+
+@register_jvp(primops.scalar_tan)
+def jvp_scalar_tan(x, dx):
+    """Tangent rule for primitive `scalar_tan`."""
+    out = scalar_tan(x)
+    return (out, scalar_mul(dx, scalar_add(scalar_mul(out, out), 1)))
+
+
+@register_jvp(primops.dot)
+def jvp_dot(x, dx, y, dy):
+    """Tangent rule for primitive `dot`."""
+    return (dot(x, y),
+            array_map(scalar_add, dot(dx, y), dot(x, dy)))
+
+
+class ArrayMapJVP(MetaGraph):
+    """Generate the tangent rule for array_map.
+
+    Sketch of the rule:
+
+        array_map(f, xs, ys, ...) =>
+
+        def jvp_array_map(jf, df, xs, dxs, ys, dys, ...):
+            f_out = lambda x, dx, y, dy, ...: jf(x, dx, y, dy, ...)[0]
+            f_dout = lambda x, dx, y, dy, ...: jf(x, dx, y, dy, ...)[1]
+            return (array_map(f_out, xs, dxs, ys, dys, ...),
+                    array_map(f_dout, xs, dxs, ys, dys, ...))
+
+    jf is the forward-mode version of f.
+    """
+
+    def generate_graph(self, args):
+        """Generate the tangent rule."""
+        g = Graph()
+        g.debug.name = self.name
+        jf, _, *arrays = [g.add_parameter() for _ in args]
+        results = []
+        for i in range(2):
+            func = Graph()
+            fparams = [func.add_parameter() for _ in arrays]
+            call = func.apply(jf, *fparams)
+            func.output = func.apply(primops.tuple_getitem, call, i)
+            results.append(g.apply(primops.array_map, func, *arrays))
+        g.output = g.apply(primops.make_tuple, *results)
+        g.flags.update(_jvp_flags)
+        return g
+
+
+tangent_rules.register(primops.array_map)(ArrayMapJVP(name='jvp_array_map'))
+
+
+class ArrayReduceJVP(MetaGraph):
+    """Generate the tangent rule for array_reduce.
+
+    As for its gradient, the tangent rule of array_reduce is only
+    supported over the `scalar_add` operation, which is linear.
+    """
+
+    def generate_graph(self, args):
+        """Generate the tangent rule."""
+        jf, _, _, _, _, _ = args
+        assert isinstance(jf, AbstractFunction)
+        assert jvp_primal(jf.get_unique()) is primops.scalar_add
+        g = Graph()
+        g.debug.name = self.name
+        _, _, arr, darr, shp, _ = [g.add_parameter() for _ in args]
+        g.output = g.apply(
+            primops.make_tuple,
+            g.apply(primops.array_reduce, primops.scalar_add, arr, shp),
+            g.apply(primops.array_reduce, primops.scalar_add, darr, shp),
+        )
+        g.flags.update(_jvp_flags)
+        return g
+
+
+tangent_rules.register(primops.array_reduce)(
+    ArrayReduceJVP(name='jvp_array_reduce')
+)
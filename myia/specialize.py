@@ -6,7 +6,8 @@ from dataclasses import replace as dc_replace
 from .abstract import GraphFunction, concretize_abstract, \
     AbstractFunction, AbstractError, build_value, MyiaTypeError, \
     TypedPrimitive, BaseGraphInferrer, broaden, \
-    TrackedInferrer, PrimitiveFunction, MetaGraphFunction
+    TrackedInferrer, PrimitiveFunction, MetaGraphFunction, \
+    MetaGraphInferrer
 from .abstract import Context, Unspecializable, \
     DEAD, POLY, VirtualReference
 from .ir import GraphCloner, Constant, Graph, MetaGraph
@@ -141,10 +142,23 @@ class _GraphSpecializer:
 
         assert _visible(self.graph, fn.context.graph)
 
+        if isinstance(inf, MetaGraphInferrer):
+            await self._find_generated_graph(inf, argvals)
+
         ctx = inf.make_context(self.specializer.engine, argvals)
         v = await self.specializer._specialize(ctx.graph, ctx, None)
         return _const(v, a)
 
+    async def _find_generated_graph(self, inf, argvals):
+        # The graph was generated for arguments that may contain Pendings,
+        # so it is registered under their concretized version as well, so
+        # that the MetaGraph does not generate a new one.
+        if argvals in inf.graph_cache:
+            return
+        for k, g in list(inf.graph_cache.items()):
+            kc = tuple([await concretize_abstract(x) for x in k])
+            inf.graph_cache[kc] = g
+
     async def _find_choices(self, inf):
         if inf not in self.specializer.infcaches:
             rcache = {}
@@ -6,17 +6,19 @@ from .merge import (  # noqa
 )
 
 from .misc import (  # noqa
-    Named, UNKNOWN, Registry, repr_, list_str, TypeMap, smap,
+    Named, UNKNOWN, Registry, LazyRegistry, repr_, list_str, TypeMap, smap,
     Event, Events, NS, Namespace, ModuleNamespace, ClosureNamespace, eprint,
     is_dataclass_type, as_frozen, Overload, overload, ErrorPool, flatten,
     SymbolicKeyInstance, EnvInstance, newenv
 )
 
 from .partial import (  # noqa
-    partition_keywords, Partial, Partializable
+    argspec, partition_keywords, Partial, Partializable
 )
 
-from .profile import Profile, no_prof, print_profile  # noqa
+from .profile import (  # noqa
+    Profile, no_prof, print_profile, prof_counter, aggregate_profiles
+)
 
 from .unify import (  # noqa
     Unification, Var, Seq, SVar, UnionVar, RestrictedVar, PredicateSet,
@@ -24,3 +26,5 @@ from .unify import (  # noqa
 )
 
 from .orderedset import OrderedSet  # noqa
+
+from .hamt import HAMT  # noqa
@@ -0,0 +1,281 @@
+"""Implementation of a persistent hash array mapped trie (HAMT)."""
+
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+
+def _hash(key):
+    return hash(key) & _HASH_MASK
+
+
+def _popcount(x):
+    return bin(x).count('1')
+
+
+def _size(entry):
+    return 1 if type(entry) is tuple else entry.size
+
+
+class _Bitmap:
+    """Node that maps up to 32 slots to leaves or subnodes.
+
+    Leaves are (hash, key, value) tuples. Only the slots that are used are
+    stored, in order, and the bitmap tells which slots these are.
+    """
+
+    __slots__ = ('bitmap', 'entries', 'size')
+
+    def __init__(self, bitmap, entries, size):
+        self.bitmap = bitmap
+        self.entries = entries
+        self.size = size
+
+    @staticmethod
+    def single(leaf, shift):
+        if shift >= _HASH_BITS:
+            return _Collision((leaf,))
+        bit = 1 << ((leaf[0] >> shift) & _MASK)
+        return _Bitmap(bit, (leaf,), 1)
+
+    def get(self, h, key, shift, default):
+        bit = 1 << ((h >> shift) & _MASK)
+        if not self.bitmap & bit:
+            return default
+        e = self.entries[_popcount(self.bitmap & (bit - 1))]
+        if type(e) is tuple:
+            return e[2] if e[0] == h and e[1] == key else default
+        return e.get(h, key, shift + _BITS, default)
+
+    def set(self, leaf, shift):
+        """Return a node with leaf, and whether its key is new."""
+        h = leaf[0]
+        bit = 1 << ((h >> shift) & _MASK)
+        idx = _popcount(self.bitmap & (bit - 1))
+        entries = self.entries
+        if not self.bitmap & bit:
+            return _Bitmap(self.bitmap | bit,
+                           entries[:idx] + (leaf,) + entries[idx:],
+                           self.size + 1), True
+        e = entries[idx]
+        if type(e) is tuple:
+            if e[0] == h and e[1] == leaf[1]:
+                new, added = leaf, False
+            else:
+                new, added = _pair(e, leaf, shift + _BITS), True
+        else:
+            new, added = e.set(leaf, shift + _BITS)
+        return _Bitmap(self.bitmap,
+                       entries[:idx] + (new,) + entries[idx + 1:],
+                       self.size + added), added
+
+    def merge(self, other, shift, combine):
+        """Merge two nodes at the same position."""
+        if type(other) is not _Bitmap:
+            return _merge_slow(self, other, shift, combine)
+        b1 = self.bitmap
+        b2 = other.bitmap
+        e1 = self.entries
+        e2 = other.entries
+        if not b1 & b2:
+            # Disjoint: the entries of both nodes are reused as they are
+            entries = []
+            i1 = i2 = 0
+            bits = b1 | b2
+            while bits:
+                bit = bits & -bits
+                bits ^= bit
+                if b1 & bit:
+                    entries.append(e1[i1])
+                    i1 += 1
+                else:
+                    entries.append(e2[i2])
+                    i2 += 1
+            return _Bitmap(b1 | b2, tuple(entries), self.size + other.size)
+        entries = []
+        size = 0
+        i1 = i2 = 0
+        bits = b1 | b2
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            if b1 & bit and b2 & bit:
+                new = _merge_entries(e1[i1], e2[i2], shift + _BITS, combine)
+                i1 += 1
+                i2 += 1
+            elif b1 & bit:
+                new = e1[i1]
+                i1 += 1
+            else:
+                new = e2[i2]
+                i2 += 1
+            entries.append(new)
+            size += _size(new)
+        return _Bitmap(b1 | b2, tuple(entries), size)
+
+    def leaves(self):
+        for e in self.entries:
+            if type(e) is tuple:
+                yield e
+            else:
+                yield from e.leaves()
+
+
+class _Collision:
+    """Node for keys whose hashes are entirely equal."""
+
+    __slots__ = ('entries',)
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    @property
+    def size(self):
+        return len(self.entries)
+
+    def get(self, h, key, shift, default):
+        for e in self.entries:
+            if e[1] == key:
+                return e[2]
+        return default
+
+    def set(self, leaf, shift):
+        for i, e in enumerate(self.entries):
+            if e[1] == leaf[1]:
+                entries = self.entries
+                return _Collision(entries[:i] + (leaf,) + entries[i + 1:]), \
+                    False
+        return _Collision(self.entries + (leaf,)), True
+
+    def merge(self, other, shift, combine):
+        return _merge_slow(self, other, shift, combine)
+
+    def leaves(self):
+        return iter(self.entries)
+
+
+def _pair(leaf1, leaf2, shift):
+    """Return a node with two leaves whose keys differ."""
+    if shift >= _HASH_BITS:
+        return _Collision((leaf1, leaf2))
+    i1 = (leaf1[0] >> shift) & _MASK
+    i2 = (leaf2[0] >> shift) & _MASK
+    if i1 == i2:
+        return _Bitmap(1 << i1, (_pair(leaf1, leaf2, shift + _BITS),), 2)
+    elif i1 < i2:
+        return _Bitmap((1 << i1) | (1 << i2), (leaf1, leaf2), 2)
+    else:
+        return _Bitmap((1 << i1) | (1 << i2), (leaf2, leaf1), 2)
+
+
+def _merge_entries(e1, e2, shift, combine):
+    if e1 is e2 and type(e1) is not tuple:
+        # Shared subtree: there is nothing to find out about its structure
+        return _map_values(e1, lambda v: combine(v, v))
+    if type(e1) is tuple:
+        if type(e2) is tuple:
+            if e1[0] == e2[0] and e1[1] == e2[1]:
+                return (e1[0], e1[1], combine(e1[2], e2[2]))
+            return _pair(e1, e2, shift)
+        e1 = _Bitmap.single(e1, shift)
+    elif type(e2) is tuple:
+        e2 = _Bitmap.single(e2, shift)
+    return e1.merge(e2, shift, combine)
+
+
+def _merge_slow(n1, n2, shift, combine):
+    node = n1
+    for h, k, v in n2.leaves():
+        v1 = node.get(h, k, shift, _absent)
+        if v1 is not _absent:
+            v = combine(v1, v)
+        node, _ = node.set((h, k, v), shift)
+    return node
+
+
+def _map_values(node, fn):
+    if type(node) is _Collision:
+        return _Collision(tuple((h, k, fn(v)) for h, k, v in node.entries))
+    return _Bitmap(
+        node.bitmap,
+        tuple((e[0], e[1], fn(e[2])) if type(e) is tuple
+              else _map_values(e, fn)
+              for e in node.entries),
+        node.size
+    )
+
+
+_absent = object()
+_empty = _Bitmap(0, (), 0)
+
+
+class HAMT:
+    """Persistent map with structural sharing.
+
+    `set` returns a new HAMT and leaves the original unchanged, in
+    O(log n) time, since only the path to the modified entry is copied.
+    Merging two maps reuses the subtrees that only one of them has.
+    """
+
+    __slots__ = ('_root',)
+
+    def __init__(self, contents={}):
+        """Create a HAMT with the given contents."""
+        root = _empty
+        for k, v in dict(contents).items():
+            root, _ = root.set((_hash(k), k, v), 0)
+        self._root = root
+
+    @classmethod
+    def _make(cls, root):
+        rval = cls.__new__(cls)
+        rval._root = root
+        return rval
+
+    def get(self, key, default=None):
+        """Return the value for key, or default."""
+        return self._root.get(_hash(key), key, 0, default)
+
+    def set(self, key, value):
+        """Return a new HAMT in which key is mapped to value."""
+        root, _ = self._root.set((_hash(key), key, value), 0)
+        return self._make(root)
+
+    def merge(self, other, combine):
+        """Return the union of this HAMT and other.
+
+        The values of keys that are in both maps are combined with
+        `combine(self_value, other_value)`.
+        """
+        if not other._root.size:
+            return self
+        if not self._root.size:
+            return other
+        return self._make(self._root.merge(other._root, 0, combine))
+
+    def items(self):
+        """Iterate over the (key, value) pairs, in no particular order."""
+        for _, k, v in self._root.leaves():
+            yield k, v
+
+    def __getitem__(self, key):
+        rval = self.get(key, _absent)
+        if rval is _absent:
+            raise KeyError(key)
+        return rval
+
+    def __contains__(self, key):
+        return self.get(key, _absent) is not _absent
+
+    def __iter__(self):
+        for _, k, _ in self._root.leaves():
+            yield k
+
+    def __len__(self):
+        return self._root.size
+
+    def __repr__(self):
+        contents = ', '.join(f'{k!r}: {v!r}' for k, v in self.items())
+        return f'HAMT({{{contents}}})'
@@ -9,6 +9,8 @@ from typing import Any, Dict, List, TypeVar
 from colorama import AnsiToWin32
 from dataclasses import dataclass
 
+from .hamt import HAMT
+
 
 builtins_d = vars(builtins)
 
@@ -58,6 +60,40 @@ class Registry(Dict[T1, T2]):
         return deco
 
 
+class LazyRegistry(Registry):
+    """Registry whose implementations can be built on first use.
+
+    `register_lazy` takes a function without arguments that builds the
+    implementation. It is called the first time the primitive is looked up,
+    and its result is kept.
+    """
+
+    def __init__(self) -> None:
+        """Initialize a LazyRegistry."""
+        super().__init__()
+        self._builders = {}
+
+    def register_lazy(self, prim):
+        """Register a function that builds the implementation of prim."""
+        def deco(build):
+            """Decorate the function."""
+            self._builders[prim] = build
+            return build
+        return deco
+
+    def __getitem__(self, prim):
+        if not super().__contains__(prim) and prim in self._builders:
+            self[prim] = self._builders[prim]()
+        return super().__getitem__(prim)
+
+    def __contains__(self, prim):
+        return super().__contains__(prim) or prim in self._builders
+
+    def get(self, prim, default=None):
+        """Return the implementation of prim, or default."""
+        return self[prim] if prim in self else default
+
+
 def repr_(obj: Any, **kwargs: Any):
     """Return unique string representation of object with additional info.
 
@@ -596,11 +632,17 @@ class EnvInstance:
 
     Keys are SymbolicKeyInstances, which represent nodes in the graph along
     with inferred properties.
+
+    The contents are stored in a HAMT, so that set and add share the
+    structure of the environments they start from instead of copying them.
     """
 
     def __init__(self, _contents={}):
         """Initialize a EnvType."""
-        self._contents = dict(_contents)
+        if isinstance(_contents, HAMT):
+            self._contents = _contents
+        else:
+            self._contents = HAMT(_contents)
 
     def get(self, key, default):
         """Get the sensitivity list for the given key."""
@@ -608,20 +650,11 @@ class EnvInstance:
 
     def set(self, key, value):
         """Set a value for the given key."""
-        rval = EnvInstance(self._contents)
-        rval._contents[key] = value
-        return rval
+        return EnvInstance(self._contents.set(key, value))
 
     def add(self, other):
         """Add two EnvInstances."""
-        rval = EnvInstance(self._contents)
-        for k, v in other._contents.items():
-            v0 = rval._contents.get(k)
-            if v0 is not None:
-                rval._contents[k] = _add(v0, v)
-            else:
-                rval._contents[k] = v
-        return rval
+        return EnvInstance(self._contents.merge(other._contents, _add))
 
     def __len__(self):
         return len(self._contents)
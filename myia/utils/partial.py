@@ -2,11 +2,33 @@
 
 
 import inspect
+from weakref import WeakKeyDictionary
 
 
 from .merge import merge
 
 
+_argspecs = WeakKeyDictionary()
+
+
+def argspec(f):
+    """Return the full argument specification of f, cached.
+
+    Bound methods are looked up through their function, so that the spec
+    is computed once for all the instances of a class. Pipelines look up
+    the same constructors and steps every time they are made or run.
+    """
+    key = getattr(f, '__func__', f)
+    try:
+        spec = _argspecs.get(key, None)
+    except TypeError:
+        return inspect.getfullargspec(f)
+    if spec is None:
+        spec = inspect.getfullargspec(f)
+        _argspecs[key] = spec
+    return spec
+
+
 def partition_keywords(f, kw):
     """Partitions keywords into compatible and incompatible with f.
 
@@ -14,7 +36,7 @@ def partition_keywords(f, kw):
         good: key/value pairs that the function f recognizes.
         bad: key/value pairs that the function f does not recognize.
     """
-    spec = inspect.getfullargspec(f)
+    spec = argspec(f)
     if spec.varkw:
         return kw, {}
     valid = spec.args + spec.kwonlyargs
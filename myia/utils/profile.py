@@ -1,5 +1,9 @@
 """Utilities to help support profiling."""
 
+import csv
+import json
+import math
+import tracemalloc
 from time import perf_counter as prof_counter  # noqa
 
 
@@ -49,6 +53,10 @@ class Profile:
     It is expected that the sum of sub-profiles will equal the time
     spent in a specific step.  Any difference is reported as overhead.
 
+    Steps may also attach records to the profile, which hold structured
+    data that does not fit in the timings, e.g. statistics about the rules
+    applied by an optimizer.
+
     A profile is delimited using the python with statement:
 
         with profile:
@@ -58,33 +66,69 @@ class Profile:
     with statements.  The nesting can be through functions calls of
     other forms of control flow.
 
+    Besides the nested dict of timings in `d`, the profile keeps the list
+    of the contexts in the order they ended, which can be exported with
+    `chrome_trace` or `write_csv`, and aggregated over many profiles with
+    `aggregate_profiles`.
+
+    Arguments:
+        memory: Whether to measure the memory allocated by each context
+            with tracemalloc, which is started for the duration of the
+            profile if it is not already running. This slows down the
+            profiled code.
+
     """
 
-    def __init__(self):
+    def __init__(self, memory=False):
         """Create a Profile with its initial context."""
         self.ctx = None
         self.ctx = ProfContext(None, self)
         self.d = dict()
         self.ctx.d = self.d
+        self.records = dict()
+        self.contexts = []
+        self.memory = memory
+        self._tracing = False
 
     def __enter__(self):
+        if self.ctx.parent is None and self.memory \
+                and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
         self.ctx.start = prof_counter()
         return self.ctx
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
         self.ctx.stop = prof_counter()
         self.ctx.d['__total__'] = self.ctx.stop - self.ctx.start
+        if self.ctx.parent is None and self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
         return None
 
     def print(self):
         """Print a formatted version of the profile."""
-        return print_profile(self.d)
+        print_profile(self.d)
+        for name, record in self.records.items():
+            print(f"{name}:")
+            record.print()
+
+    def record(self, name, factory):
+        """Return the record with the given name.
+
+        If there is no such record, it is created by calling factory
+        without arguments. Records are kept across steps, so that a step
+        that runs more than once accumulates its data in the same record.
+        """
+        if name not in self.records:
+            self.records[name] = factory()
+        return self.records[name]
 
     def step(self, name):
         """Start a step in the current context with the given name.
 
-        Nomes must be unique otherwise the previous record will be
-        overwritten.
+        If a step with the same name already ended in the current
+        context, this one is recorded as `name#2`, then `name#3`, etc.
 
             with profile:
                 with profile.step('start'):
@@ -114,6 +158,65 @@ class Profile:
         assert self.ctx.name is not None
         self.ctx = self.ctx.parent
 
+    def rows(self):
+        """Return a row for each context, in the order they started.
+
+        Each row is a dict with these keys:
+
+        * path: The keys of the context and of its ancestors, joined by
+          slashes, e.g. `opt/Cycle 1/opt`.
+        * name: The name of the context.
+        * depth: The number of ancestors of the context.
+        * start: The time the context started at, from the start of the
+          profile, in seconds.
+        * duration: The time spent in the context, in seconds.
+        * memory: The difference in the memory allocated by Python at the
+          end and at the start of the context, in bytes, or None if the
+          memory was not measured.
+        """
+        origin = self.ctx.start
+        return [{
+            'path': ctx.path,
+            'name': ctx.name,
+            'depth': ctx.path.count('/'),
+            'start': ctx.start - origin,
+            'duration': ctx.stop - ctx.start,
+            'memory': ctx.memory,
+        } for ctx in sorted(self.contexts, key=lambda ctx: ctx.start)]
+
+    def chrome_trace(self):
+        """Return the profile in Chrome's trace event format.
+
+        The result can be saved with `json.dump` and opened in
+        chrome://tracing or Perfetto.
+        """
+        events = []
+        for row in self.rows():
+            event = {
+                'name': row['name'],
+                'cat': row['path'],
+                'ph': 'X',
+                'ts': row['start'] * 1e6,
+                'dur': row['duration'] * 1e6,
+                'pid': 0,
+                'tid': 0,
+            }
+            if row['memory'] is not None:
+                event['args'] = {'memory': row['memory']}
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, file):
+        """Write the profile to a file in Chrome's trace event format."""
+        json.dump(self.chrome_trace(), file)
+
+    def write_csv(self, file):
+        """Write the rows of the profile to a file, as CSV."""
+        fields = ['path', 'name', 'depth', 'start', 'duration', 'memory']
+        writer = csv.DictWriter(file, fields)
+        writer.writeheader()
+        writer.writerows(self.rows())
+
 
 class ProfContext:
     """Utility class for Profile."""
@@ -124,23 +227,86 @@ class ProfContext:
         self.p = p
         self.parent = p.ctx
         self.d = dict()
+        self.key = name
+        self.memory = None
+
+    @property
+    def path(self):
+        """The keys of the context and of its ancestors, joined by '/'."""
+        if self.parent is None or self.parent.parent is None:
+            return self.key
+        return f'{self.parent.path}/{self.key}'
 
     def __enter__(self):
+        if self.p.memory and tracemalloc.is_tracing():
+            self._memory_start = tracemalloc.get_traced_memory()[0]
         self.start = prof_counter()
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
         self.stop = prof_counter()
+        if self.p.memory and tracemalloc.is_tracing():
+            self.memory = \
+                tracemalloc.get_traced_memory()[0] - self._memory_start
         self.d['__total__'] = self.stop - self.start
         if self.parent:
+            n = 1
+            while self.key in self.parent.d:
+                n += 1
+                self.key = f'{self.name}#{n}'
             if len(self.d) > 1:
-                self.parent.d[self.name] = self.d
+                self.parent.d[self.key] = self.d
             else:
-                self.parent.d[self.name] = self.d['__total__']
+                self.parent.d[self.key] = self.d['__total__']
+            self.p.contexts.append(self)
             self.p._pop()
         return None
 
 
+def _percentile(values, q):
+    """Return the q-th percentile of sorted values, by nearest rank."""
+    rank = max(math.ceil(q / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def aggregate_profiles(profiles):
+    """Aggregate the timings of many profiles.
+
+    The contexts are matched by path (see `Profile.rows`), so that e.g.
+    the times of each pipeline step can be summarized over many
+    compilations.
+
+    Returns:
+        A dict from each path to a dict with the number of profiles it is
+        in (`count`), and the `mean`, `p50`, `p99`, `min`, `max` and
+        `total` of its durations, in seconds. If the memory was measured,
+        `memory` is the mean of the memory deltas.
+
+    """
+    durations = {}
+    memory = {}
+    for prof in profiles:
+        for row in prof.rows():
+            durations.setdefault(row['path'], []).append(row['duration'])
+            if row['memory'] is not None:
+                memory.setdefault(row['path'], []).append(row['memory'])
+    results = {}
+    for path, ds in durations.items():
+        ds.sort()
+        results[path] = {
+            'count': len(ds),
+            'mean': sum(ds) / len(ds),
+            'p50': _percentile(ds, 50),
+            'p99': _percentile(ds, 99),
+            'min': ds[0],
+            'max': ds[-1],
+            'total': sum(ds),
+        }
+        if path in memory:
+            results[path]['memory'] = sum(memory[path]) / len(memory[path])
+    return results
+
+
 class NoProf:
     """Class that mimics Profile, but does nothing."""
 
@@ -162,5 +328,9 @@ class NoProf:
         """Does nothing."""
         return self
 
+    def record(self, name, factory):
+        """Return None, since nothing is recorded."""
+        return None
+
 
 no_prof = NoProf()
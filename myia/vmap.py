@@ -0,0 +1,527 @@
+"""Batching transform.
+
+The batched version of a function takes its arguments stacked along a new
+leading axis, the batch axis, and returns its results stacked the same
+way, as if it had been called on each example in turn:
+
+    def f(x, W):                def vmap_f(xs, W):
+        return x @ W + 1.0  =>      return reshape(dot(reshape(xs, ...),
+                                                       W), ...) + 1.0
+
+Arguments that are not batched, such as W here, are shared by all the
+examples.
+
+The transform works on the specialized graphs of the function, so that the
+type and the shape of every node are known. The function is specialized
+for one example, whose abstract values are those of the batched arguments
+without their batch axis, and each node of the result is either batched,
+if it depends on a batched argument, or not. Batched scalars are arrays of
+shape (B,), and batched arrays of shape S are arrays of shape (B, *S).
+Primitives on batched values are replaced by their batched equivalents,
+driven by the shapes of their arguments:
+
+* Scalar operations are mapped over the batch with `array_map`.
+* The shapes given to `reshape`, `distribute` and `array_reduce`, and the
+  permutations given to `transpose`, get an extra leading axis.
+* `dot` is a batched matrix product. A batched operand is multiplied with
+  an operand that is not batched in a single `dot`, by merging the batch
+  axis with the other axis of the batched operand.
+* Values that are not batched are broadcast along the batch axis when they
+  are combined with batched values.
+
+Calls to graphs use versions of the graphs that are transformed for the
+arguments that are batched, so that the values that do not depend on the
+examples are only computed once. Conditions, and so loops and recursion,
+can only depend on values that are not batched: selecting the result of
+each example would need an `array_map` over values of different types.
+Dataclasses can hold batched values only if the types of their fields
+allow arrays.
+"""
+
+from .abstract import AbstractScalar, AbstractArray, AbstractTuple, \
+    AbstractClass, AbstractFunction, MyiaShapeError, MyiaTypeError, \
+    ANYTHING, SHAPE, TYPE, VALUE, build_value, from_value
+from .graph_utils import toposort, FOLLOW, EXCLUDE
+from .info import About
+from .ir import Constant, Graph, MetaGraph, clone
+from .prim import ops as P, Primitive
+from .utils import overload
+
+
+@overload(bootstrap=True)
+def _unbatch(self, a: AbstractArray, sizes):
+    shp = a.values[SHAPE]
+    if not shp:
+        raise MyiaShapeError('A batched array must have a batch axis')
+    sizes.add(shp[0])
+    if len(shp) == 1:
+        return AbstractScalar({VALUE: ANYTHING,
+                               TYPE: a.element.values[TYPE]})
+    return AbstractArray(a.element, {SHAPE: shp[1:]})
+
+
+@overload  # noqa: F811
+def _unbatch(self, a: AbstractTuple, sizes):
+    return AbstractTuple([self(x, sizes) for x in a.elements])
+
+
+@overload  # noqa: F811
+def _unbatch(self, a: AbstractClass, sizes):
+    return AbstractClass(a.tag,
+                         {k: self(v, sizes) for k, v in a.attributes.items()},
+                         a.methods)
+
+
+@overload  # noqa: F811
+def _unbatch(self, a: object, sizes):
+    raise MyiaTypeError(f'Cannot batch along the first axis of {a}')
+
+
+def unbatch_abstract(args, in_axes):
+    """Return the abstract values of one example, and the batch size.
+
+    Arguments:
+        args: The abstract values of the batched arguments.
+        in_axes: For each argument, 0 if it is batched along its first
+            axis, or None if it is shared by all the examples.
+
+    """
+    sizes = set()
+    example = tuple(_unbatch(a, sizes) if axis == 0 else a
+                    for a, axis in zip(args, in_axes))
+    if not sizes:
+        raise MyiaTypeError('vmap needs at least one batched argument')
+    if len(sizes) > 1 or ANYTHING in sizes:
+        raise MyiaShapeError(
+            f'The batched arguments must have the same known batch size,'
+            f' not {sizes}'
+        )
+    size, = sizes
+    return example, size
+
+
+def _check_condition(batched):
+    if batched:
+        # Selecting the result of each example would need array_map on a
+        # condition and values of different types
+        raise NotImplementedError(
+            'vmap does not support conditions that depend on the examples'
+        )
+
+
+_scalar_prims = {
+    P.scalar_add, P.scalar_sub, P.scalar_mul, P.scalar_div, P.scalar_mod,
+    P.scalar_pow, P.scalar_trunc, P.scalar_floor, P.scalar_uadd,
+    P.scalar_usub, P.scalar_exp, P.scalar_log, P.scalar_sin, P.scalar_cos,
+    P.scalar_tan, P.scalar_eq, P.scalar_lt, P.scalar_gt, P.scalar_ne,
+    P.scalar_le, P.scalar_ge, P.bool_not, P.bool_and, P.bool_or, P.bool_eq,
+}
+
+
+class _Scope:
+    """Transformation of a graph for a pattern of batched parameters.
+
+    Attributes:
+        graph: The original graph.
+        new: The transformed graph.
+        parent: The scope of the graph's parent, for closures.
+        closures: Scopes of the graphs nested in this one.
+        repl: Maps the nodes of the graph to their transformed node, and
+            whether it is batched.
+        out: Whether the output is batched, or None while the graph is
+            transformed.
+        recursive: Whether the graph was called while it was transformed.
+
+    """
+
+    def __init__(self, batcher, graph, flags, force, parent):
+        self.batcher = batcher
+        self.graph = graph
+        self.force = force
+        self.parent = parent
+        self.closures = {}
+        self.repl = {}
+        self.out = None
+        self.recursive = False
+        with About(graph.debug, 'vmap'):
+            self.new = Graph()
+        for p, flag in zip(graph.parameters, flags):
+            with About(p.debug, 'copy'):
+                self.repl[p] = (self.new.add_parameter(), flag)
+
+    def run(self):
+        node, flag = self.get(self.graph.output)
+        if not flag and (self.force or self.recursive):
+            node = self.batcher.broadcast(self.new, node,
+                                          self.graph.output.abstract)
+            flag = True
+        self.new.output = node
+        self.out = flag
+
+    def find(self, graph):
+        """Return the scope of graph, from this scope or its parents."""
+        scope = self
+        while scope is not None and scope.graph is not graph:
+            scope = scope.parent
+        if scope is None:
+            raise NotImplementedError(
+                f'vmap is not supported on closures ({graph} has a free'
+                f' variable)'
+            )
+        return scope
+
+    def get(self, node):
+        """Return the transformed node, and whether it is batched."""
+        if node.is_constant():
+            return self.batcher.constant(self, node), False
+        scope = self.find(node.graph)
+        if node not in scope.repl:
+            scope.process(node)
+        return scope.repl[node]
+
+    def process(self, root):
+        def include(node):
+            if node.graph is self.graph and node not in self.repl:
+                return FOLLOW
+            return EXCLUDE
+
+        for node in toposort(root, lambda n: n.inputs, include):
+            # Functions are transformed where they are called, for the
+            # arguments they are called with
+            if node.is_apply() and (
+                    node is root
+                    or not isinstance(node.abstract, AbstractFunction)):
+                with About(node.debug, 'vmap'):
+                    self.repl[node] = self.batcher.call(
+                        self, node.inputs[0], node.inputs[1:], node.abstract
+                    )
+
+
+class _Batcher:
+    """Transform specialized graphs to batch them.
+
+    Attributes:
+        size: The batch size.
+        scopes: The scopes of the graphs that are not closures, by graph,
+            pattern of batched parameters, and whether the output is
+            forced to be batched.
+
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.scopes = {}
+
+    def graph(self, g, flags, scope=None, force=False):
+        """Return the transformed g, and whether its output is batched."""
+        flags = tuple(flags)
+        if g.free_variables_total:
+            parent = scope.find(g.parent)
+            table = parent.closures
+        else:
+            parent = None
+            table = self.scopes
+        key = (g, flags, force)
+        sc = table.get(key, None)
+        if sc is None:
+            sc = _Scope(self, g, flags, force, parent)
+            table[key] = sc
+            sc.run()
+        elif sc.out is None:
+            # The output will be broadcast if it is not batched
+            sc.recursive = True
+            return sc.new, True
+        return sc.new, sc.out
+
+    def constant(self, scope, node):
+        """Return a copy of a constant node, used in scope."""
+        value = node.value
+        if isinstance(value, Graph):
+            return Constant(self.graph(value, [False] * len(value.parameters),
+                                       scope)[0])
+        elif isinstance(value, (bool, int, float)) \
+                and isinstance(node.abstract, AbstractScalar):
+            # The type of a number may have been inferred from its uses
+            t = node.abstract.values[TYPE]
+            if t != from_value(value).values[TYPE]:
+                return scope.new.apply(P.scalar_cast, value, t)
+        return Constant(value)
+
+    def broadcast(self, ng, node, a):
+        """Broadcast node, of abstract value a, along the batch axis."""
+        if isinstance(a, AbstractScalar):
+            arr = ng.apply(P.scalar_to_array, node)
+            return ng.apply(P.distribute, arr, (self.size,))
+        elif isinstance(a, AbstractArray):
+            shp = a.values[SHAPE]
+            arr = ng.apply(P.reshape, node, (1, *shp))
+            return ng.apply(P.distribute, arr, (self.size, *shp))
+        elif isinstance(a, AbstractTuple):
+            return ng.apply(P.make_tuple, *[
+                self.broadcast(ng, ng.apply(P.tuple_getitem, node, i), x)
+                for i, x in enumerate(a.elements)
+            ])
+        raise NotImplementedError(f'vmap cannot broadcast {a}')
+
+    def function(self, scope, fn, flags, force=False):
+        """Return a node for the function fn, called with batched flags.
+
+        Also returns whether the output of the call is batched.
+        """
+        if fn.is_constant(Graph):
+            g, out = self.graph(fn.value, flags, scope, force)
+            return Constant(g), out
+        elif fn.is_apply() and fn.inputs[0].is_constant(Primitive):
+            prim = fn.inputs[0].value
+            if prim is P.partial:
+                bound = [scope.get(a) for a in fn.inputs[2:]]
+                g, out = self.function(scope, fn.inputs[1],
+                                       [f for _, f in bound] + list(flags),
+                                       force)
+                return (scope.new.apply(P.partial, g, *[n for n, _ in bound]),
+                        out)
+            elif prim is P.switch:
+                cond, cflag = scope.get(fn.inputs[1])
+                _check_condition(cflag)
+                branches = [self.branch(scope, b, flags, force)
+                            for b in fn.inputs[2:]]
+                outs = {out for _, out in branches if out is not None}
+                if len(outs) > 1:
+                    # Both branches must return batched values
+                    branches = [self.branch(scope, b, flags, True)
+                                for b in fn.inputs[2:]]
+                    outs = {True}
+                return (scope.new.apply(P.switch, cond,
+                                        *[b for b, _ in branches]),
+                        outs.pop() if outs else False)
+        raise NotImplementedError(f'vmap cannot transform calls to {fn}')
+
+    def branch(self, scope, fn, flags, force):
+        """Return a node for a branch of a switch, as `function` does.
+
+        Branches that the specializer found to be dead are constants that
+        are kept as they are, and for which None is returned.
+        """
+        if fn.is_constant() and not fn.is_constant(Graph):
+            return Constant(fn.value), None
+        return self.function(scope, fn, flags, force)
+
+    def call(self, scope, fn, args, abstract):
+        """Transform a call to fn, with result abstract, in scope."""
+        ng = scope.new
+        if fn.is_constant(Primitive):
+            pairs = [scope.get(a) for a in args]
+            nodes = [n for n, _ in pairs]
+            flags = [f for _, f in pairs]
+            if not any(flags):
+                return ng.apply(fn.value, *nodes), False
+            return self.primitive(ng, fn.value, nodes, flags,
+                                  [a.abstract for a in args], abstract)
+        pairs = [scope.get(a) for a in args]
+        if fn.is_constant(type):
+            # Dataclasses are built from batched fields
+            if not any(f for _, f in pairs):
+                return ng.apply(fn.value, *[n for n, _ in pairs]), False
+            return ng.apply(fn.value, *[
+                n if f else self.broadcast(ng, n, a.abstract)
+                for (n, f), a in zip(pairs, args)
+            ]), True
+        f, out = self.function(scope, fn, [f for _, f in pairs])
+        return ng.apply(f, *[n for n, _ in pairs]), out
+
+    def primitive(self, ng, prim, nodes, flags, abstracts, out):
+        """Apply the batched version of prim.
+
+        Arguments:
+            ng: The graph to apply it in.
+            prim: The primitive.
+            nodes: The transformed arguments.
+            flags: Whether each argument is batched.
+            abstracts: The abstract values of the original arguments.
+            out: The abstract value of the original result.
+
+        """
+        size = self.size
+
+        def batched(i):
+            if flags[i]:
+                return nodes[i]
+            return self.broadcast(ng, nodes[i], abstracts[i])
+
+        def static(*indexes):
+            for i in indexes:
+                if flags[i]:
+                    raise NotImplementedError(
+                        f'vmap does not support batched argument {i} of'
+                        f' {prim}'
+                    )
+
+        def shape(i):
+            return abstracts[i].values[SHAPE]
+
+        if prim in _scalar_prims:
+            return ng.apply(P.array_map, prim,
+                            *[batched(i) for i in range(len(nodes))]), True
+
+        elif prim in (P.scalar_to_array, P.array_to_scalar, P.identity):
+            # Batched scalars and batched arrays of shape () are the same
+            return nodes[0], True
+
+        elif prim is P.array_map:
+            static(0)
+            return ng.apply(prim, nodes[0],
+                            *[batched(i) for i in range(1, len(nodes))]), True
+
+        elif prim is P.array_reduce:
+            static(0, 2)
+            shp = out.values[SHAPE]
+            return ng.apply(prim, nodes[0], nodes[1], (size, *shp)), True
+
+        elif prim is P.distribute:
+            static(1)
+            shp = out.values[SHAPE]
+            pad = (1,) * (len(shp) - len(shape(0)))
+            arr = ng.apply(P.reshape, nodes[0], (size, *pad, *shape(0)))
+            return ng.apply(prim, arr, (size, *shp)), True
+
+        elif prim is P.reshape:
+            static(1)
+            return ng.apply(prim, nodes[0], (size, *out.values[SHAPE])), True
+
+        elif prim is P.transpose:
+            static(1)
+            perm = build_value(abstracts[1], default=ANYTHING)
+            if perm is ANYTHING:
+                raise NotImplementedError(
+                    'vmap needs the permutation of transpose to be constant'
+                )
+            perm = (0, *[p + 1 for p in perm])
+            return ng.apply(prim, nodes[0], perm), True
+
+        elif prim is P.dot:
+            return self.dot(ng, nodes, flags, shape(0), shape(1)), True
+
+        elif prim is P.shape:
+            # The shape of an example
+            shp = ng.apply(prim, nodes[0])
+            return ng.apply(P.make_tuple, *[
+                ng.apply(P.tuple_getitem, shp, i + 1)
+                for i in range(len(shape(0)))
+            ]), False
+
+        elif prim is P.make_tuple:
+            return ng.apply(prim, *[batched(i)
+                                    for i in range(len(nodes))]), True
+
+        elif prim in (P.tuple_getitem, P.getattr):
+            static(1)
+            return ng.apply(prim, *nodes), True
+
+        elif prim is P.tuple_setitem:
+            static(1)
+            return ng.apply(prim, batched(0), nodes[1], batched(2)), True
+
+        elif prim is P.make_record:
+            static(0)
+            return ng.apply(prim, nodes[0],
+                            *[batched(i) for i in range(1, len(nodes))]), True
+
+        elif prim is P.switch:
+            _check_condition(flags[0])
+            return ng.apply(prim, nodes[0], batched(1), batched(2)), True
+
+        raise NotImplementedError(f'vmap does not support {prim}')
+
+    def dot(self, ng, nodes, flags, shp1, shp2):
+        """Batched matrix product."""
+        size = self.size
+        (n, m), k = shp1, shp2[1]
+        x, y = nodes
+        if not flags[1]:
+            # (B, n, m) . (m, k): a single product on (B * n, m)
+            x = ng.apply(P.reshape, x, (size * n, m))
+            return ng.apply(P.reshape, ng.apply(P.dot, x, y), (size, n, k))
+        elif not flags[0]:
+            # (n, m) . (B, m, k): a single product on (m, B * k)
+            y = ng.apply(P.transpose, y, (1, 0, 2))
+            y = ng.apply(P.reshape, y, (m, size * k))
+            res = ng.apply(P.reshape, ng.apply(P.dot, x, y), (n, size, k))
+            return ng.apply(P.transpose, res, (1, 0, 2))
+        else:
+            # Multiply (B, n, m, 1) and (B, 1, m, k), and sum over m
+            full = (size, n, m, k)
+            x = ng.apply(P.reshape, x, (size, n, m, 1))
+            y = ng.apply(P.reshape, y, (size, 1, m, k))
+            prod = ng.apply(P.array_map, P.scalar_mul,
+                            ng.apply(P.distribute, x, full),
+                            ng.apply(P.distribute, y, full))
+            res = ng.apply(P.array_reduce, P.scalar_add, prod,
+                           (size, n, 1, k))
+            return ng.apply(P.reshape, res, (size, n, k))
+
+
+def vmap_graph(g, flags, size):
+    """Return the batched version of g, and whether its output is batched.
+
+    Arguments:
+        g: A specialized graph.
+        flags: Whether each parameter of g is batched.
+        size: The batch size.
+
+    """
+    return _Batcher(size).graph(g, flags)
+
+
+class VMapMetaGraph(MetaGraph):
+    """Batched version of a graph.
+
+    The graph is specialized for the abstract values of one example, and
+    the specialized graph is transformed by `vmap_graph`. The output is
+    always batched.
+
+    Attributes:
+        graph: The graph to batch.
+        in_axes: For each parameter of the graph, 0 if it is batched along
+            its first axis, or None.
+
+    """
+
+    def __init__(self, graph, in_axes):
+        """Initialize a VMapMetaGraph."""
+        super().__init__(f'vmap_{graph}')
+        self.graph = graph
+        self.in_axes = in_axes
+
+    def generate_graph(self, args):
+        """Generate the batched graph for the batched arguments."""
+        from .pipeline import standard_debug_pipeline
+
+        nargs = len(self.graph.parameters)
+        if len(args) != nargs:
+            raise MyiaTypeError(
+                f'Wrong number of arguments: expected {nargs},'
+                f' got {len(args)}'
+            )
+        if self.in_axes is None:
+            in_axes = (0,) * nargs
+        else:
+            in_axes = self.in_axes
+        example, size = unbatch_abstract(args, in_axes)
+        pip = standard_debug_pipeline.select('resolve', 'infer', 'specialize')
+        res = pip.run(graph=clone(self.graph, total=True), argspec=example)
+        g = res['graph']
+        batcher = _Batcher(size)
+        flags = [axis == 0 for axis in in_axes]
+        ng, _ = batcher.graph(g, flags, force=True)
+        return ng
+
+
+_vmap_graphs = {}
+
+
+def vmap_metagraph(g, in_axes=None):
+    """Return the VMapMetaGraph for g and in_axes."""
+    key = (g, in_axes)
+    if key not in _vmap_graphs:
+        _vmap_graphs[key] = VMapMetaGraph(g, in_axes)
+    return _vmap_graphs[key]
@@ -4,7 +4,7 @@ import math
 import numpy as np
 
 from myia.prim.py_implementations import distribute, scalar_to_array, dot, \
-    scalar_add, array_reduce, transpose
+    scalar_add, array_reduce, transpose, reshape
 
 from ..test_compile import parse_compare
 from ..common import MA, MB
@@ -159,3 +159,13 @@ def test_array_reduce2(x):
 @parse_compare((MA(2, 3),), array=True)
 def test_transpose(x):
     return transpose(x, (1, 0))
+
+
+@parse_compare((MA(2, 3),), array=True)
+def test_reshape(x):
+    return reshape(x, (3, 2))
+
+
+@parse_compare((MA(2, 3),), array=True)
+def test_reshape2(x):
+    return reshape(x, (1, 6, 1))
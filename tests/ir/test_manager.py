@@ -105,6 +105,16 @@ def _check_uses(manager):
             assert node2.inputs[key] is node
 
 
+def _check_nesting(manager):
+    # The nesting statistics are updated incrementally, so we compare them
+    # to those of a manager that computes them from scratch.
+    fresh = GraphManager(*manager.roots, manage=False)
+    assert fresh.graphs == manager.graphs
+    for key in ('graph_dependencies_total', 'parents', 'children', 'scopes',
+                'free_variables_total', 'graphs_reachable', 'recursive'):
+        assert getattr(manager, key) == getattr(fresh, key), key
+
+
 def check_manager(*stages, **specs):
     if specs and stages:
         raise Exception('Bad call to check_manager')
@@ -146,6 +156,7 @@ def check_manager(*stages, **specs):
                     for uses, new_node in operations:
                         _replace(tr, uses, new_node)
                 _check_uses(mng)
+                _check_nesting(mng)
                 stage.check(mng)
 
         return test
@@ -635,6 +646,18 @@ def test_mut_use_global(x, y):
     return swap(f, g)
 
 
+@check_manager(
+    Stage(graphs_reachable='X:f', recursive=''),
+    Stage(graphs_reachable='X:f,X; f:f,X', recursive='X; f'),
+    Stage(graphs_reachable='', recursive=''),
+)
+def test_mut_recursion(x, y):
+    def f(x):
+        return swap1(x, test_mut_recursion(x, y))
+
+    return swap2(f(x), x)
+
+
 #################
 # Miscellaneous #
 #################
@@ -0,0 +1,176 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+
+from myia.abstract import AbstractFunction, from_value
+from myia.dtype import Int, Float, Tuple
+from myia.graph_utils import dfs
+from myia.ir import Constant, Graph, succ_deeper
+from myia.ir.serialize import dump, load, dumps, loads, MAGIC
+from myia.parser import Parser
+from myia.pipeline import standard_debug_pipeline
+from myia.prim import ops as P
+from myia.utils import Namespace
+
+
+def _f(x, y):
+    def g(z):
+        return z * y
+
+    total = g(x)
+    while x > 0:
+        total = total + x
+        x = x - 1
+    if total > 10 and y != 3:
+        return total * 2
+    return -total
+
+
+def _literals(x):
+    return x, 'text', None, True, 2.5, 1j, ()
+
+
+def _parse(fn):
+    parser = Parser(fn)
+    return parser, parser.parse()
+
+
+def _codec(parser):
+    namespaces = [parser.global_namespace, parser.closure_namespace]
+
+    def encode(value):
+        if isinstance(value, Namespace):
+            if value not in namespaces:
+                namespaces.append(value)
+            return namespaces.index(value)
+        return None
+
+    return encode, namespaces.__getitem__
+
+
+@pytest.mark.parametrize('fn', [_f, _literals])
+def test_roundtrip(fn):
+    parser, g = _parse(fn)
+    encode, decode = _codec(parser)
+    data = dumps(g, encode)
+    g2, = loads(data, decode)
+    assert dumps(g2, encode) == data
+
+    nodes = set(dfs(g.return_, succ_deeper))
+    assert not nodes & set(dfs(g2.return_, succ_deeper))
+    assert [p.debug.name for p in g2.parameters] \
+        == [p.debug.name for p in g.parameters]
+
+    # The locations, and their nodes, are kept
+    loc, loc2 = g.output.debug.location, g2.output.debug.location
+    assert loc[:5] == loc2[:5]
+    assert isinstance(loc2.node, type(loc.node))
+
+
+def test_roundtrip_run():
+    parser, g = _parse(_f)
+    encode, decode = _codec(parser)
+    f = io.BytesIO()
+    dump(g, f, encode)
+    f.seek(0)
+    g2, = load(f, decode)
+    argspec = (from_value(1, broaden=True),) * 2
+    pip = standard_debug_pipeline.configure(parse=False)
+    fn = pip.run(graph=g2, argspec=argspec)['output']
+    assert fn(5, 4) == _f(5, 4)
+    assert fn(15, 4) == _f(15, 4)
+
+
+def test_unserializable():
+    g = Graph()
+    g.output = Constant(object())
+    with pytest.raises(TypeError):
+        dumps(g)
+    g2, = loads(dumps(g, lambda value: 'key'), lambda key: key * 2)
+    assert g2.output.value == 'keykey'
+
+
+def test_constants():
+    scalar = np.float32(1.5)
+    values = (Int[64], Tuple[Int[64], Float[32]], P.scalar_add, Exception,
+              np.arange(6).reshape((2, 3)), scalar, [1, {'a': -300}], b'x',
+              ..., 2 ** 80, -1)
+    g = Graph()
+    g.output = Constant(values)
+    g2, = loads(dumps(g))
+    values2 = g2.output.value
+    assert values2[:4] == values[:4]
+    assert values2[4].dtype == values[4].dtype
+    assert (values2[4] == values[4]).all()
+    assert type(values2[5]) is np.float32 and values2[5] == scalar
+    assert values2[6:] == values[6:]
+
+
+def test_interning():
+    g = Graph()
+    x = g.add_parameter()
+    out = x
+    for i in range(100):
+        out = g.apply(P.scalar_add, out, 1234.5)
+    g.output = out
+    # The constant and the primitive are only stored once
+    data = dumps(g)
+    assert data.count(struct.pack('<d', 1234.5)) == 1
+    assert data.count(b'scalar_add') == 1
+
+
+def _specialize(fn, *args):
+    argspec = tuple(from_value(arg, broaden=True) for arg in args)
+    pip = standard_debug_pipeline.select('parse', 'resolve', 'infer',
+                                         'specialize', 'erase_class', 'opt')
+    return pip.run(input=fn, argspec=argspec)['graph']
+
+
+def test_roundtrip_specialized():
+    g = _specialize(_f, 5, 4)
+    g2, = loads(dumps(g))
+    nodes = list(dfs(g.return_, succ_deeper))
+    nodes2 = list(dfs(g2.return_, succ_deeper))
+    assert len(nodes2) == len(nodes)
+    for node, node2 in zip(nodes, nodes2):
+        if node.is_constant_graph():
+            assert node2.is_constant_graph()
+        elif node.is_constant():
+            assert node2.value == node.value
+        a, a2 = node.abstract, node2.abstract
+        if isinstance(a, AbstractFunction):
+            assert len(a2.get_sync()) == len(a.get_sync())
+        else:
+            # Concrete abstract values are interned
+            assert a2 is a
+    argspec = tuple(p.abstract for p in g2.parameters)
+    pip = standard_debug_pipeline.select('erase_tuple', 'cconv', 'validate',
+                                         'export', 'wrap')
+    fn = pip.run(graph=g2, argspec=argspec, outspec=g2.output.abstract,
+                 erase_class=True)['output']
+    assert fn(5, 4) == _f(5, 4)
+
+
+def test_multiple_roots():
+    g1 = Graph()
+    g1.output = Constant(1)
+    g2 = Graph()
+    g2.output = g2.apply(P.scalar_add, g2.add_parameter(), Constant(g1))
+    h1, h2 = loads(dumps([g1, g2]))
+    assert h2.output.inputs[2].value is h1
+
+
+def test_version():
+    g = Graph()
+    g.output = Constant((1, 2.5, 'x'))
+    g2, = loads(dumps(g))
+    assert g2.output.value == (1, 2.5, 'x')
+    data = dumps(g)
+    with pytest.raises(ValueError):
+        loads(MAGIC + bytes([data[len(MAGIC)] + 1]) + data[len(MAGIC) + 1:])
+    with pytest.raises(ValueError):
+        loads(b'XXXX' + data[len(MAGIC):])
+    with pytest.raises(ValueError):
+        loads(data[:-3])
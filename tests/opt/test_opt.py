@@ -7,10 +7,10 @@ from myia.abstract import InferenceError
 from myia.ir import Constant, isomorphic, GraphCloner
 from myia.opt import PatternSubstitutionOptimization as psub, \
     LocalPassOptimizer, pattern_replacer, sexp_to_graph, \
-    cse, NodeMap
+    cse, NodeMap, Worklist, DiscriminationNet
 from myia.prim import Primitive, ops as prim
-from myia.utils import Merge
-from myia.utils.unify import Var, var
+from myia.utils import Merge, Profile
+from myia.utils.unify import Var, var, SVar
 
 from ..common import i64, f64, to_abstract_test
 
@@ -344,6 +344,88 @@ def test_cse():
     helper(f2, 12, 8)
 
 
+def test_discrimination_net():
+    Xs = SVar(Var())
+    C = var(lambda n: n.is_constant())
+
+    tup_first = psub((prim.tuple_getitem, (prim.make_tuple, Xs), 0), X,
+                     name='tup_first')
+    same_args = psub((prim.scalar_add, X, X), X, name='same_args')
+    getitem_ct = psub((prim.tuple_getitem, X, C), X, name='getitem_ct')
+    opts = [multiply_by_zero_l, multiply_by_zero_r, add_zero_r,
+            tup_first, same_args, getitem_ct, elim_R]
+    net = DiscriminationNet(opts)
+
+    def f(x, y):
+        a = x * 0
+        b = a + 0
+        c = (b, y)[0]
+        d = c + c
+        e = (x, y)[y]
+        return R(d + e)
+
+    g = parse(f)
+    for node in g.manager.all_nodes:
+        expected = [opt for opt in opts
+                    if opt.unif.unify(node, opt.pattern) is not None]
+        matches = net.match(node)
+        for opt, equiv in matches:
+            if equiv is not None:
+                assert equiv == opt.unif.unify(node, opt.pattern)
+        assert [opt for opt, equiv in matches if equiv is not None
+                or opt.unif.unify(node, opt.pattern) is not None] == expected
+
+    mul, = [node for node in g.manager.all_nodes
+            if node.is_apply(prim.scalar_mul)]
+    (opt, equiv), = net.match(mul)
+    assert opt is multiply_by_zero_r
+    assert equiv[X] is mul.inputs[1]
+
+    # Non-linear patterns must still be unified
+    d, = [node for node in g.manager.all_nodes
+          if node.is_apply(prim.scalar_add)
+          and node.inputs[1] is node.inputs[2]]
+    assert (same_args, None) in net.match(d)
+
+
+def test_worklist():
+
+    def f(x, y):
+        return R(x) * P(y)
+
+    g = parse(f)
+    mng = g.manager
+    nmap = NodeMap()
+    nmap.register(R, elim_R)
+    eq = LocalPassOptimizer(nmap)
+
+    wl = Worklist(mng)
+    assert wl.full
+    assert eq(g, wl)
+    assert not wl.full
+    # The multiplication had its input replaced
+    mul = g.output
+    assert mul in wl.nodes
+    assert mul in wl.pop(g)
+    assert not wl
+
+    # Nothing to do
+    assert not eq(g, wl)
+
+    # New changes are tracked
+    p_node = mul.inputs[2]
+    r_node = g.apply(R, p_node)
+    mng.set_edge(mul, 2, r_node)
+    assert r_node in wl.nodes
+    assert eq(g, wl)
+    assert mul.inputs[2] is p_node
+
+    wl.close()
+    r_node = g.apply(R, p_node)
+    mng.set_edge(mul, 2, r_node)
+    assert r_node not in wl.nodes
+
+
 opt_ok1 = psub(
     (prim.scalar_add, X, Y),
     (prim.scalar_mul, X, Y),
@@ -449,3 +531,51 @@ def test_type_tracking_newgraph():
         pip.run(input=fn2,
                 argspec=(to_abstract_test(f64),
                          to_abstract_test(f64)))
+
+
+def test_optimizer_statistics():
+
+    mul_same = psub(
+        (prim.scalar_mul, X, X),
+        (prim.scalar_add, X, X),
+        name='mul_same'
+    )
+
+    pip = scalar_pipeline \
+        .select('parse', 'infer', 'specialize',
+                'erase_class', 'opt', 'erase_tuple', 'validate') \
+        .configure({
+            'opt.phases.main': [opt_ok1, opt_ok2, mul_same,
+                                multiply_by_zero_r],
+        })
+
+    def fn(x, y):
+        return -(x + y)
+
+    prof = Profile()
+    pip.run(input=fn, argspec=(to_abstract_test(i64),
+                               to_abstract_test(i64)), profile=prof)
+    stats = prof.records['opt']
+    assert stats.iterations >= 2
+    assert stats.phases['main']['changes'] >= 1
+
+    rules = stats.report()['rules']
+    for name in ('opt_ok1', 'opt_ok2'):
+        assert rules[name]['attempts'] >= 1
+        assert rules[name]['matches'] == 1
+        assert rules[name]['replacements'] == 1
+    # scalar_mul(x, y) is created by opt_ok1 and tried, but does not match
+    assert rules['mul_same']['attempts'] >= 1
+    assert rules['mul_same']['matches'] == 0
+    assert rules['mul_same']['replacements'] == 0
+    # The node map knows that this one cannot match
+    assert 'multiply_by_zero_r' not in rules
+    assert 'cse' in rules
+
+    assert {name for name, _ in stats.hot_rules(key='replacements', n=2)} \
+        == {'opt_ok1', 'opt_ok2'}
+    prof.print()
+
+    # Nothing is recorded without a profile
+    assert pip.run(input=fn, argspec=(to_abstract_test(i64),
+                                      to_abstract_test(i64)))
@@ -8,7 +8,7 @@ from myia.abstract import (
     ANYTHING, MyiaTypeError,
     AbstractScalar as _S, AbstractTuple as T,
     AbstractJTagged, AbstractError, AbstractFunction,
-    InferenceLoop, to_abstract, build_value, amerge,
+    InferenceLoop, to_abstract, build_value, amerge, abstract_clone,
     Possibilities as _Poss,
     VALUE, TYPE, DEAD
 )
@@ -57,6 +57,42 @@ def test_build_value():
     assert build_value(to_abstract_test(pt)) == pt
 
 
+def test_loop():
+    loop = InferenceLoop(errtype=MyiaTypeError)
+    log = []
+
+    async def wait(p, name):
+        log.append((name, await p))
+        return name
+
+    async def fail():
+        raise MyiaTypeError('oops')
+
+    low = loop.create_pending(resolve=(lambda: 'low'), priority=(lambda: 1))
+    high = loop.create_pending(resolve=(lambda: 'high'),
+                               priority=(lambda: 2))
+    never = loop.create_pending(resolve=(lambda: 'never'),
+                                priority=(lambda: None))
+    t1 = loop.schedule(wait(low, 't1'))
+    t2 = loop.schedule(wait(high, 't2'))
+    t3 = loop.schedule(fail())
+    t4 = loop.schedule(wait(never, 't4'))
+    high.add_done_callback(lambda fut: log.append(('cb', fut.result())))
+    loop.run_forever()
+
+    # The highest priority Pending is forced first, and its waiters are
+    # resumed in the order they started waiting
+    assert log == [('cb', 'high'), ('t2', 'high'), ('t1', 'low')]
+    assert t1.result() == 't1'
+    assert t2.result() == 't2'
+    assert isinstance(t3.exception(), MyiaTypeError)
+    assert not t4.done()
+    errors = loop.collect_errors()
+    assert len(errors) == 2
+    assert errors[0] is t3.exception()
+    assert isinstance(errors[1], MyiaTypeError)
+
+
 def test_merge():
     a = T([S(1), S(t=ty.Int[64])])
     b = T([S(1), S(t=ty.Int[64])])
@@ -77,6 +113,26 @@ def test_merge():
         assert amerge("hello", "world", loop=None, forced=False)
 
 
+def test_intern():
+    a = T([S(1), S(t=ty.Int[64])])
+    b = T([S(1), S(t=ty.Int[64])])
+    assert a is not b
+    ai = a.intern()
+    assert ai is b.intern()
+    assert abstract_clone(b) is ai
+    assert abstract_clone(T([S(2), S(t=ty.Int[64])])) != ai
+    assert hash(a) == hash(b)
+
+    loop = InferenceLoop(MyiaTypeError)
+    p = loop.create_pending(resolve=None, priority=lambda: 0)
+    c = T([S(t=p), S(t=ty.Int[64])])
+    assert not c.is_concrete()
+    assert c.intern() is c
+    assert T([S(t=p), S(t=ty.Int[64])]).intern() is not c
+
+    assert amerge(ai, ai, loop=None, forced=True) is ai
+
+
 def test_merge_possibilities():
     a = Poss(1, 2)
     b = Poss(2, 3)
@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 import numpy as np
 import pytest
 
@@ -6,9 +8,10 @@ from myia.cconv import closure_convert
 from myia.dtype import Bool
 from myia.abstract import InferenceError
 from myia.ir import clone
-from myia.pipeline import \
+from myia.pipeline import standard_debug_pipeline, \
     scalar_parse as parse, scalar_debug_compile as compile
-from myia.pipeline.steps import convert_arg, convert_result
+from myia.pipeline import steps as pipeline_steps
+from myia.pipeline.steps import arg_converter, result_converter
 from myia.prim.py_implementations import getitem
 
 from .common import Point, Point3D, i64, f64, to_abstract_test, ai64_of, \
@@ -51,6 +54,92 @@ def test_myia_specialize_values():
     assert ft is not ff
 
 
+def test_myia_batched():
+    @myia
+    def f(x, W):
+        return x @ W + 1.0
+
+    xs = np.ones((4, 2, 3))
+    W = np.ones((3, 5))
+    res = f.batched(xs, W, in_axes=(0, None))
+    assert res.shape == (4, 2, 5)
+    assert (res == 4.0).all()
+
+    fb = f.compile_batched((xs, W), in_axes=(0, None))
+    assert fb is f.compile_batched((xs, W), in_axes=[0, None])
+    assert fb is not f.compile((xs[0], W))
+
+    # Both arguments batched
+    Ws = np.ones((4, 3, 5))
+    assert (f.batched(xs, Ws) == 4.0).all()
+
+
+def test_myia_stream():
+    @myia
+    def f(x, y):
+        return x * y + 1.0
+
+    items = [(np.full((2, 3), float(i)), np.ones((2, 3))) for i in range(5)]
+    expected = [x * y + 1.0 for x, y in items]
+
+    for depth in (1, 3):
+        res = list(f.stream(iter(items), depth=depth))
+        assert all((a == b).all() for a, b in zip(res, expected))
+    assert len(res) == 5
+
+    res = list(f.stream(items, batch_size=2))
+    assert len(res) == 5
+    assert all((a == b).all() for a, b in zip(res, expected))
+
+    # Items of different shapes are not stacked together
+    items2 = items[:1] + [(np.ones((3,)), np.ones((3,)))] + items[1:2]
+    res = list(f.stream(items2, batch_size=4))
+    assert [r.shape for r in res] == [(2, 3), (3,), (2, 3)]
+
+    # Shared arguments
+    W = np.ones((3, 2))
+    scalars = list(f.stream([(float(i), 2.0) for i in range(3)],
+                            batch_size=3, in_axes=(0, None)))
+    assert scalars == [1.0, 3.0, 5.0]
+    assert isinstance(scalars[0], float)
+
+    @myia
+    def g(x, W):
+        return x @ W, x
+
+    res = list(g.stream([(x, W) for x, _ in items], batch_size=2,
+                        in_axes=(0, None)))
+    assert all((a == x @ W).all() and (b == x).all()
+               for (a, b), (x, _) in zip(res, items))
+
+    # Errors are raised when the item is reached
+    stream = f.stream([(1.0, 2.0), (1.0,)])
+    assert next(stream) == 3.0
+    with pytest.raises(InferenceError):
+        next(stream)
+
+    with pytest.raises(ValueError):
+        next(f.stream(items, depth=0))
+
+
+def test_myia_stream_concurrent_calls():
+    @myia
+    def f(x, y):
+        return x * y + 1.0
+
+    # The stream compiles the calls to come while f is called and compiled
+    # for other shapes in this thread.
+    items = [(np.full((i + 1,), 2.0), np.ones((i + 1,))) for i in range(6)]
+    stream = f.stream(items, depth=3)
+    for i, res in enumerate(stream):
+        assert (res == np.full((i + 1,), 3.0)).all()
+        x = np.ones((i + 1, 2))
+        assert (f(x, x) == np.full((i + 1, 2), 2.0)).all()
+        assert f(float(i), 2.0) == 2.0 * i + 1.0
+    assert i == 5
+    assert len(f._cache) == 13
+
+
 def test_myia_struct_arg():
     @myia
     def f(pt):
@@ -72,7 +161,7 @@ def test_myia_return_struct():
 def test_convert_arg():
 
     def _convert(data, typ):
-        return convert_arg(data, to_abstract_test(typ))
+        return list(arg_converter((to_abstract_test(typ),))(data))
 
     # Leaves
 
@@ -134,9 +223,8 @@ def test_convert_arg():
 def test_convert_result():
 
     def _convert(data, typ1, typ2):
-        return convert_result(data,
-                              to_abstract_test(typ1),
-                              to_abstract_test(typ2))
+        return result_converter(to_abstract_test(typ1),
+                                to_abstract_test(typ2))(data)
 
     # Leaves
 
@@ -162,6 +250,109 @@ def test_convert_result():
         [pt, pt, pt]
 
 
+def test_arg_converter():
+
+    def _convert(data, typ, validate=True):
+        conv = arg_converter((to_abstract_test(typ),), validate)
+        return list(conv(data))
+
+    pt = Point(1, 2)
+    assert _convert(True, Bool) == [True]
+    assert _convert(1.5, f64) == [1.5]
+    assert _convert(pt, Point(i64, i64)) == [1, 2]
+    assert _convert((pt, (1.5, pt)),
+                    (Point(i64, i64), (f64, Point(i64, i64)))) \
+        == [1, 2, 1.5, 1, 2]
+    assert _convert([pt, pt], [Point(i64, i64)]) == [[1, 2, 1, 2]]
+    assert _convert([(1, 2)], [(i64, i64)]) == [[1, 2]]
+    fmat = np.ones((5, 8))
+    assert _convert(fmat, af64_of(5, 8))[0] is fmat
+
+    conv = arg_converter((to_abstract_test(Point(i64, i64)),
+                          to_abstract_test(f64)))
+    assert conv(pt, 1.5) == (1, 2, 1.5)
+    assert conv is arg_converter((to_abstract_test(Point(i64, i64)),
+                                  to_abstract_test(f64)))
+
+    for data, typ in [(10, f64),
+                      ("blah", to_abstract_test("blah")),
+                      (1.5, i64),
+                      (10, (i64, i64)),
+                      ((1,), (i64, i64)),
+                      ((1, 2, 3), [i64]),
+                      (Point3D(1, 2, 3), Point(i64, i64)),
+                      (10, ai64_of()),
+                      (np.ones((5, 8), dtype='int32'), ai64_of(5, 8)),
+                      (1, Bool)]:
+        with pytest.raises(TypeError):
+            arg_converter((to_abstract_test(typ),))(data)
+
+    # Without validation, the types are not checked
+    conv = arg_converter((to_abstract_test(f64),), validate=False)
+    assert conv(10) == (10,)
+    with pytest.raises(TypeError):
+        conv(1, 2)
+
+    # The argspec may be a list
+    argspec = [to_abstract_test(f64), to_abstract_test(i64)]
+    conv = arg_converter(argspec)
+    assert conv(1.5, 2) == (1.5, 2)
+    assert conv is arg_converter(tuple(argspec))
+
+
+def test_converters_bounded(monkeypatch):
+    monkeypatch.setattr(pipeline_steps, '_converters', OrderedDict())
+    monkeypatch.setattr(pipeline_steps, '_max_converters', 2)
+    convs = [arg_converter((to_abstract_test(t),)) for t in (i64, f64, Bool)]
+    assert len(pipeline_steps._converters) == 2
+    # The least recently used converter was dropped and is generated again
+    assert arg_converter((to_abstract_test(Bool),)) is convs[2]
+    assert arg_converter((to_abstract_test(i64),)) is not convs[0]
+
+
+def test_result_converter():
+
+    def _convert(data, typ1, typ2):
+        orig_t = to_abstract_test(typ1)
+        vm_t = to_abstract_test(typ2)
+        return result_converter(orig_t, vm_t)(data)
+
+    pt = Point(1, 2)
+    assert _convert(True, Bool, Bool) is True
+    assert _convert(np.float64(1.5), f64, f64) == 1.5
+    assert _convert(pt, Point(i64, i64), Point(i64, i64)) == pt
+    assert _convert((1, 2), Point(i64, i64), (i64, i64)) == pt
+    assert _convert(((1, 2), 1.5),
+                    (Point(i64, i64), f64),
+                    ((i64, i64), f64)) == (pt, 1.5)
+    assert _convert(((1, 2),), (Point(i64, i64),), ((i64, i64),)) == (pt,)
+    assert _convert([(1, 2), (1, 2)],
+                    [Point(i64, i64)],
+                    [(i64, i64)]) == [pt, pt]
+
+
+def test_wrap_validate():
+    def f(pt, x):
+        return pt.x * x
+
+    argspec = (to_abstract_test(Point(f64, f64)), to_abstract_test(f64))
+    pip = standard_debug_pipeline
+    fn = pip.run(input=f, argspec=argspec)['output']
+    assert fn(Point(2.0, 3.0), 4.0) == 8.0
+    with pytest.raises(TypeError):
+        fn(Point(2.0, 3.0), 4)
+    assert fn.convert_args(Point(2.0, 3.0), 4.0) == (2.0, 3.0, 4.0)
+
+    fn = pip.configure({'wrap.validate': False}).run(
+        input=f, argspec=argspec
+    )['output']
+    assert fn(Point(2.0, 3.0), 4) == 8.0
+
+    # The argspec may be given as a list
+    fn = pip.run(input=f, argspec=list(argspec))['output']
+    assert fn(Point(2.0, 3.0), 4.0) == 8.0
+
+
 def test_function_arg():
     """Give a Python function as an argument."""
     def square(x):  # pragma: no cover
@@ -7,7 +7,7 @@ from dataclasses import dataclass
 
 from myia.abstract import from_value, AbstractJTagged
 from myia.pipeline import standard_resources, standard_pipeline
-from myia.composite import grad
+from myia.composite import grad, checkpoint
 from myia.debug.finite_diff import GradTester, NoTestGrad, clean_args
 from myia.grad import J as realJ
 from myia.pipeline import pipeline_function, PipelineDefinition, steps
@@ -119,6 +119,84 @@ def test_GradTester_outtup():
     gtest.assert_match()
 
 
+def _f_div(x, y):
+    return x / y
+
+
+def _df_div(x, y, dz):
+    return dz / y, -dz * x / (y * y)
+
+
+_div_args = (np.array([[4.3, 2.0], [5.1, 7.7], [3.4, 8.2]]),
+             np.array([[1.2, 5.0], [3.3, 2.7], [6.9, 7.2]]))
+
+
+@pytest.mark.parametrize('options', [
+    dict(batch_size=5),
+    dict(processes=2),
+    dict(batch_size=5, processes=2),
+    dict(projections=3),
+    dict(projections=3, batch_size=4),
+])
+def test_GradTester_options(options):
+    gtest = GradTester(
+        fn=_f_div,
+        gfn=_df_div,
+        args=_div_args,
+        argnames=['x', 'y'],
+        outnames=['out'],
+        **options
+    )
+    gtest.assert_match()
+
+
+def test_GradTester_batched_same():
+    def make(**options):
+        return GradTester(fn=_f_div, gfn=_df_div, args=_div_args,
+                          argnames=['x', 'y'], outnames=['out'], **options)
+
+    fin = make().compute_finite_diff()
+    fin_batched = make(batch_size=7).compute_finite_diff()
+    assert fin_batched.keys() == fin.keys()
+    for k, v in fin.items():
+        assert fin_batched[k] == pytest.approx(v)
+
+
+def test_GradTester_projections():
+
+    def f(x, n, y):
+        return x * y, x / y + n
+
+    def df(x, n, y, dz):
+        dz1, dz2 = dz
+        return (dz1 * y + dz2 / y,
+                0,
+                dz1 * x + dz2 * x / (y * y))  # Wrong sign
+
+    gtest = GradTester(
+        fn=f,
+        gfn=df,
+        args=(7.3, NoTestGrad(2), 4.2),
+        argnames=['x', 'n', 'y'],
+        outnames=None,
+        projections=2
+    )
+    results = gtest.compare()
+    assert set(results) == {'df_1/dv0', 'df_1/dv1', 'df_2/dv0', 'df_2/dv1'}
+    assert results['df_1/dv0']['match'] and results['df_1/dv1']['match']
+    assert not results['df_2/dv0']['match']
+    assert not results['df_2/dv1']['match']
+
+
+def test_augmented_graphs_lazy():
+    from myia.prim.grad_implementations import augmented_graphs
+    g = augmented_graphs[P.scalar_mul]
+    assert augmented_graphs[P.scalar_mul] is g
+    assert g.transforms['primal'] is P.scalar_mul
+    g = augmented_graphs[P.switch]
+    assert g.transforms['primal'] is P.switch
+
+
 prim_tests = {
     P.scalar_add: [(-7.1, 4.3)],
     P.scalar_sub: [(-7.1, 4.3)],
@@ -375,6 +453,51 @@ def test_nested_closure(x):
     return f()()
 
 
+@checkpoint
+def _checkpointed(x, y):
+    a = x * y
+    return a * a + x
+
+
+@grad_test((4.0, 5.0), (6.4, -7.8))
+def test_checkpoint(x, y):
+    return _checkpointed(x, y) * _checkpointed(y, x)
+
+
+@grad_test((4.0, 5.0))
+def test_checkpoint_closure(x, y):
+    @checkpoint
+    def f(z):
+        return x * z * z
+    return f(y) + f(x)
+
+
+@grad_test((4.0, 5.0))
+def test_checkpoint_nested(x, y):
+    @checkpoint
+    def f(z):
+        return _checkpointed(z, y) * z
+    return f(x)
+
+
+def test_checkpoint_transform():
+    def f(x, y):
+        return J(_checkpointed)(J(x), J(y))
+
+    pip = grad_pipeline.select('parse', 'resolve', 'infer', 'specialize')\
+        .make()
+    res = pip(input=f, argspec=(from_value(1.0, broaden=True),) * 2)
+    g = res['graph'].output.inputs[0].inputs[1].value
+    assert g.flags['checkpoint']
+    fprop = realJ(g, pip.resources)
+    assert fprop.transforms['primal'] is g
+    assert realJ(g, pip.resources) is fprop
+    _, bprop = fprop.output.inputs[1:]
+    pip.resources.manager.add_graph(fprop)
+    # The backpropagator only refers to the parameters of the fprop
+    assert set(bprop.value.free_variables_total) == set(fprop.parameters)
+
+
 @grad_test((4.5, 6.7),)
 def test_functions_in_tuples(x, y):
     tup = scalar_add, scalar_mul
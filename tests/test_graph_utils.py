@@ -2,7 +2,8 @@
 
 import pytest
 
-from myia.graph_utils import EXCLUDE, FOLLOW, NOFOLLOW, dfs, toposort
+from myia.graph_utils import EXCLUDE, FOLLOW, NOFOLLOW, dfs, toposort, \
+    strongly_connected_components
 
 
 def _succ(x):
@@ -101,3 +102,31 @@ def test_toposort_cycle():
 
     with pytest.raises(ValueError):
         list(toposort(q, qsucc, _incl))
+
+
+def test_strongly_connected_components():
+    edges = {
+        1: [2],
+        2: [3, 4],
+        3: [1],
+        4: [5],
+        5: [5],
+        6: [4],
+        7: [],
+    }
+    sccs = list(strongly_connected_components(edges, edges.__getitem__))
+    assert sorted(sorted(scc) for scc in sccs) \
+        == [[1, 2, 3], [4], [5], [6], [7]]
+    pos = {x: i for i, scc in enumerate(sccs) for x in scc}
+    for x, succs in edges.items():
+        for y in succs:
+            assert pos[y] <= pos[x]
+
+
+def test_strongly_connected_components_deep():
+    n = 10000
+    edges = {i: [i + 1] for i in range(n)}
+    edges[n] = [0]
+    sccs = list(strongly_connected_components([0], edges.__getitem__))
+    assert len(sccs) == 1
+    assert set(sccs[0]) == set(range(n + 1))
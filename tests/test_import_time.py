@@ -0,0 +1,63 @@
+import subprocess
+import sys
+
+import pytest
+
+
+# Maximum time to import myia.api, in seconds. It takes about 0.3s on a
+# developer machine, this leaves room for slower CI machines while catching
+# eager imports of backends or eager parsing of gradients.
+IMPORT_TIME_LIMIT = 2.0
+
+
+def _run(code, *options):
+    return subprocess.run(
+        [sys.executable, *options, '-c', code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True
+    )
+
+
+def _import_time(module):
+    """Return the cumulative import time of module in a fresh process.
+
+    This uses the output of `python -X importtime`, in which the last line
+    is for the module that was imported.
+    """
+    res = _run(f'import {module}', '-X', 'importtime')
+    for line in reversed(res.stderr.splitlines()):
+        _, cumulative, name = line.split('|')
+        if name.strip() == module:
+            return int(cumulative) / 1e6
+    raise AssertionError(f'No import time for {module}')
+
+
+@pytest.mark.parametrize('module', ['myia.api', 'myia.grad'])
+def test_import_time(module):
+    best = min(_import_time(module) for _ in range(3))
+    assert best < IMPORT_TIME_LIMIT
+
+
+def test_lazy_backends():
+    res = _run('import sys, myia.api, myia.grad;'
+               'print("nnvm" in sys.modules, "tvm" in sys.modules)')
+    assert res.stdout.split() == ['False', 'False']
+
+
+def test_lazy_gradients():
+    res = _run('from myia.prim.grad_implementations import augmented_graphs;'
+               'from myia.prim import ops as P;'
+               'from myia.grad import J;'
+               'lazy = augmented_graphs._builders;'
+               'built = lambda: sum(dict.__contains__(augmented_graphs, p)'
+               '                    for p in lazy);'
+               'before = built();'
+               'augmented_graphs[P.scalar_mul];'
+               'print(len(lazy), before, built())')
+    nlazy, before, after = map(int, res.stdout.split())
+    assert nlazy > 10
+    # No gradient is built until it is looked up
+    assert before == 0
+    assert after == 1
@@ -1,11 +1,13 @@
 
+import io
+import json
 import pytest
 import operator
 import numpy as np
 
 from types import SimpleNamespace
 
-from myia.abstract import concretize_abstract
+from myia.abstract import concretize_abstract, InferenceStatistics
 from myia.abstract.prim import UniformPrimitiveInferrer
 from myia.pipeline import standard_pipeline, scalar_pipeline
 from myia.composite import hyper_add, zeros_like, grad, list_map, tail
@@ -24,7 +26,7 @@ from myia.prim.py_implementations import \
     tuple_setitem, list_setitem, scalar_cast, list_reduce, \
     env_getitem, env_setitem, embed, J, Jinv, array_to_scalar, \
     transpose, make_record
-from myia.utils import newenv
+from myia.utils import newenv, Profile
 
 from .common import B, T, L, i16, i32, i64, u64, f16, f32, f64, \
     ai64, af64, Nil, Point, Point_t, Point3D, Thing, Thing_ftup, mysum, \
@@ -1026,6 +1028,122 @@ def test_infinite_mutual_recursion(x):
     return ping()
 
 
+def _dec(x: Number) -> Number:
+    return x - 1
+
+
+def test_widening():
+    P_dec = Primitive('_dec')
+    cons = {**abstract_inferrer_cons_test,
+            P_dec: UniformPrimitiveInferrer.partial(impl=_dec,
+                                                    infer_value=True)}
+
+    def countdown(n):
+        if n <= 0:
+            return n
+        else:
+            return countdown(P_dec(n))
+
+    def run(**options):
+        pip = infer_pipeline.configure({
+            'inferrer.constructors': cons,
+            **{f'inferrer.{k}': v for k, v in options.items()}
+        }).make()
+        res = pip(input=countdown, argspec=(S(10, i64),))
+        counts = pip.resources.inferrer.engine.context_counts()
+        return res['outspec'], counts[res['graph']]
+
+    # Without widening, the recursion is unrolled down to 0
+    assert run() == (S(0, i64), 11)
+    assert run(max_depth=2) == (S(ANYTHING, i64), 3)
+    assert run(broaden_after=3) == (S(ANYTHING, i64), 4)
+    with pytest.raises(InferenceError):
+        run(max_contexts=4)
+    assert run(max_contexts=11) == (S(0, i64), 11)
+
+    # Reinferring with clear=True forgets the contexts of the last run
+    pip = infer_pipeline.configure({
+        'inferrer.constructors': cons,
+        'inferrer.max_contexts': 11,
+    }).make()
+    g = pip(input=countdown, argspec=(S(10, i64),))['graph']
+    inferrer = pip.resources.inferrer
+    out, _ = inferrer.infer(g, (S(5, i64),), clear=True)
+    assert out == S(0, i64)
+    assert inferrer.engine.context_counts()[g] <= 6
+
+
+def test_inference_statistics():
+    def f(x, y):
+        def g(z):
+            return z * x
+        return g(y) + g(x)
+
+    prof = Profile()
+    infer_pipeline_std.run(input=f, argspec=(S(ANYTHING, i64),
+                                             S(ANYTHING, i64)),
+                           profile=prof)
+    stats = prof.records['infer']
+    assert stats.runs == 1
+    assert stats.tasks > 0
+    assert stats.cache_hits > 0 and stats.cache_misses > 0
+    assert 0 < stats.cache_hit_ratio() < 1
+    counts = {name.split('#')[0]: n for name, n in stats.contexts.items()}
+    assert counts['f'] == 1
+    assert counts['g'] == 1
+    assert stats.inferrers['resolve']['calls'] >= 1
+    assert stats.inferrers['GraphFunction']['calls'] == 2
+    assert stats.hot_inferrers(key='calls', n=1)[0][1]['calls'] \
+        == max(rec['calls'] for rec in stats.inferrers.values())
+
+    buf = io.StringIO()
+    stats.dump(buf)
+    report = json.loads(buf.getvalue())
+    assert report['contexts'] == stats.contexts
+    assert report['cache']['hits'] == stats.cache_hits
+    prof.print()
+
+
+def test_inference_statistics_contexts():
+    def f(x, y):
+        def h(z):
+            def f(w):
+                return w * z
+            return f(z)
+
+        def k(z):
+            def f(w):
+                return w + z
+            return f(z)
+
+        return h(x) + k(y)
+
+    ints = (S(ANYTHING, i64), S(ANYTHING, i64))
+    floats = (S(ANYTHING, f64), S(ANYTHING, f64))
+    pip = infer_pipeline_std.make()
+    g = pip(input=f, argspec=ints)['graph']
+    engine = pip.resources.inferrer.engine
+    stats = InferenceStatistics()
+    engine.stats = stats
+
+    engine.run(g, argspec=ints)
+    # All the contexts already exist, so none are counted
+    assert stats.runs == 1
+    assert stats.contexts == {}
+
+    engine.run(g, argspec=floats)
+    # The two closures named f are counted separately
+    names = [name.split('#')[0] for name in stats.contexts]
+    assert names.count('f') == 3
+    assert all(n == 1 for n in stats.contexts.values())
+    first = dict(stats.contexts)
+
+    # Only the new contexts of each run are counted
+    engine.run(g, argspec=floats)
+    assert stats.runs == 3
+    assert stats.contexts == first
+
+
 @infer(
     (af16_of(2, 3), Shp(2, 3)),
     (af16_of(2, ANYTHING), (S(2, u64), u64)),
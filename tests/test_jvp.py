@@ -0,0 +1,355 @@
+
+import dataclasses
+from dataclasses import dataclass
+
+import numpy as np
+import pytest
+
+from myia.abstract import from_value
+from myia.composite import grad, jvp
+from myia.debug.finite_diff import GradTester, gen_variants
+from myia.graph_utils import dfs
+from myia.ir import Graph, succ_deeper
+from myia.jvp import jvp_graph
+from myia.parser import parse
+from myia.pipeline import PipelineDefinition, standard_resources, steps
+from myia.prim import ops as P
+from myia.prim.py_implementations import scalar_add, scalar_mul, \
+    scalar_div, scalar_exp, scalar_sin, scalar_cos, array_map, \
+    array_reduce, array_to_scalar, scalar_to_array, distribute, dot, \
+    reshape, transpose
+
+from .common import MA, MB
+
+
+jvp_pipeline = PipelineDefinition(
+    resources=standard_resources,
+    steps=dict(
+        parse=steps.step_parse,
+        resolve=steps.step_resolve,
+        infer=steps.step_infer,
+        specialize=steps.step_specialize,
+        erase_class=steps.step_erase_class,
+        opt=steps.step_debug_opt,
+        erase_tuple=steps.step_erase_tuple,
+        validate=steps.step_validate,
+        export=steps.step_debug_export,
+        wrap=steps.step_wrap,
+    )
+)
+
+
+@dataclass
+class Point:
+    x: float
+    y: float
+
+    def abs(self):
+        return (self.x ** 2 + self.y ** 2) ** 0.5
+
+
+def _zeros(x):
+    if isinstance(x, tuple):
+        return tuple(_zeros(y) for y in x)
+    elif isinstance(x, np.ndarray):
+        return np.zeros_like(x)
+    elif dataclasses.is_dataclass(x):
+        return dataclasses.replace(
+            x, **{f: _zeros(getattr(x, f)) for f in x.__dataclass_fields__}
+        )
+    else:
+        return 0.0
+
+
+def _set_path(x, path, value):
+    if not path:
+        return value
+    p, *rest = path
+    if isinstance(x, tuple):
+        return tuple(_set_path(y, rest, value) if i == p else y
+                     for i, y in enumerate(x))
+    elif isinstance(x, np.ndarray):
+        x = x.copy()
+        x[p] = _set_path(x[p], rest, value)
+        return x
+    else:
+        return dataclasses.replace(
+            x, **{p: _set_path(getattr(x, p), rest, value)}
+        )
+
+
+def _leaves(x):
+    if isinstance(x, tuple):
+        return [leaf for y in x for leaf in _leaves(y)]
+    elif dataclasses.is_dataclass(x):
+        return _leaves(dataclasses.astuple(x))
+    return [x]
+
+
+def _inner(x, y):
+    if isinstance(x, tuple):
+        return sum(_inner(a, b) for a, b in zip(x, y))
+    return np.sum(x * y)
+
+
+def _compile(fn, args):
+    g = parse(fn)
+    jg = Graph()
+    params = [jg.add_parameter() for _ in range(2 * len(args))]
+    jg.output = jg.apply(jg.apply(jvp, g), *params)
+    argspec = tuple(from_value(arg, broaden=True)
+                    for arg in args + _zeros(args))
+    pip = jvp_pipeline.configure(parse=False)
+    return pip.run(graph=jg, argspec=argspec)['output']
+
+
+def _jvp_test(fn, args, rel_error=1e-3):
+    jfn = _compile(fn, args)
+
+    def gfn(*args_and_sens):
+        # Build the vector-Jacobian product that GradTester expects from
+        # one jvp per input element.
+        *xs, sens = args_and_sens
+        xs = tuple(xs)
+        zeros = _zeros(xs)
+        grads = zeros
+        for (tangents,), path in gen_variants(zeros, lambda x: [1.0], ()):
+            out, dout = jfn(*xs, *tangents)
+            grads = _set_path(grads, path, _inner(sens, dout))
+        return grads
+
+    out, _ = jfn(*args, *_zeros(args))
+    for x, y in zip(_leaves(out), _leaves(fn(*args))):
+        assert np.allclose(x, y)
+    gtest = GradTester(
+        fn=fn,
+        gfn=gfn,
+        args=args,
+        argnames=[f'in{i}' for i in range(len(args))],
+        outnames=None,
+        rel_error=rel_error
+    )
+    gtest.assert_match()
+
+
+def jvp_test(*tests, rel_error=1e-3):
+    """Decorate a function to check its jvp against finite differences.
+
+    Returns a unit test that computes the full Jacobian of the function
+    with jvp, one input element at a time, at each `inputs` tuple in
+    `tests`, and checks it with a GradTester.
+    """
+
+    def decorate(fn):
+        def test(args):
+            if not isinstance(args, tuple):
+                args = (args,)
+            _jvp_test(fn, args, rel_error=rel_error)
+
+        m = pytest.mark.parametrize('args', list(tests))(test)
+        m.__orig__ = fn
+        return m
+    return decorate
+
+
+@jvp_test((13.0, 14.0))
+def test_null(x, y):
+    return 10.0 + 28.0 / 43.0
+
+
+@jvp_test((1.0, 4.0), (5.0, -13.0))
+def test_add(x, y):
+    return x + y
+
+
+@jvp_test((3.0, 4.0), (2.5, -0.5))
+def test_expr(x, y):
+    return x * y / (x - y) + x ** 3 - y ** 2.5 if y > 0 else x * y
+
+
+@jvp_test((3.0,))
+def test_constant(x):
+    return 18.0 * x
+
+
+@jvp_test((0.7, 2.1))
+def test_transcendental(x, y):
+    return scalar_exp(scalar_sin(x) * y) + scalar_cos(x * y)
+
+
+@jvp_test((3.0, 5.0))
+def test_tuples(x, y):
+    tup = x + y, x * y
+    z = tup[0] + tup[1]
+    return z, tup
+
+
+@jvp_test((Point(3.0, 5.0),))
+def test_dataclass(pt):
+    return pt.x * pt.y
+
+
+@jvp_test((Point(3.0, 5.0),))
+def test_dataclass_method(pt):
+    return pt.abs()
+
+
+@jvp_test((4.0, 5.0))
+def test_hof(a, b):
+    def f(g, x):
+        return g(x) * g(x + 10.0)
+
+    def g(x):
+        return x * b
+
+    return f(g, a) + f(g, b)
+
+
+@jvp_test((4.0, 5.0))
+def test_closure(a, b):
+    def f(x):
+        def g(y):
+            return a * x * y
+        return g(b) + g(x)
+    return f(a * b) * f(b)
+
+
+@jvp_test((4.0, 5.0), (6.4, -7.8))
+def test_if(a, b):
+    if a > b:
+        return a * b
+    else:
+        return a + b
+
+
+@jvp_test((4.0,))
+def test_while(x):
+    rval = x
+    while rval < 100:
+        rval = rval * rval
+    return rval
+
+
+@jvp_test((4.0, 5.0, 2.0))
+def test_while_2(x, y, z):
+    rval = 0.0
+    # Cannot compare to 0 or finite diff is unstable
+    while x > -0.1:
+        rval = rval + y
+        x = x - z
+    return rval
+
+
+@jvp_test((4.1,))
+def test_recursion(x):
+    def prod(n):
+        if n <= 1:
+            return n
+        else:
+            return n * prod(n - 1)
+    return prod(x)
+
+
+@jvp_test((4.5, 6.7))
+def test_functions_in_tuples(x, y):
+    tup = scalar_add, scalar_mul
+    f, g = tup
+    return f(x, y) + g(x, y)
+
+
+@jvp_test((MA(2, 3), MB(2, 3)))
+def test_array_operations(xs, ys):
+    div = array_map(scalar_div, xs, ys)
+    sm = array_reduce(scalar_add, div, ())
+    return array_to_scalar(sm)
+
+
+@jvp_test((3.1, 7.6))
+def test_array_operations_distribute(x, y):
+    xs = distribute(scalar_to_array(x), (4, 3))
+    ys = distribute(scalar_to_array(y), (4, 3))
+    return array_map(scalar_mul, xs, ys)
+
+
+@jvp_test((MA(2, 3), MB(2, 3)))
+def test_array_operations_reshape(xs, ys):
+    xs = reshape(xs, (6,))
+    ys = transpose(reshape(ys, (3, 2)), (1, 0))
+    return array_map(scalar_mul, xs, reshape(ys, (6,)))
+
+
+@jvp_test((MA(2, 3), MB(3, 4)))
+def test_dot(x, y):
+    return dot(x, y)
+
+
+def _run(fn, *args):
+    # The full optimizer removes the partial applications that bind methods
+    # in the tangent computations, which reverse mode cannot differentiate.
+    argspec = tuple(from_value(arg, broaden=True) for arg in args)
+    pip = jvp_pipeline.configure(opt=steps.step_opt)
+    return pip.run(input=fn, argspec=argspec)['output'](*args)
+
+
+def _f(x, y):
+    return x * x * y
+
+
+def test_hessian_vector_product():
+    # grad(d/dt f(x + t * v)) = H(x) @ v
+
+    def hvp(x, y):
+        def directional(x, y):
+            return jvp(_f)(x, y, 1.0, 2.0)[1]
+        return grad(directional)(x, y)
+
+    x, y = 3.0, 4.0
+    assert _run(hvp, x, y) == 2 * y * 1.0 + 2 * x * 2.0
+
+
+def test_jvp_of_jvp():
+    def second(x, y):
+        def first(x, y):
+            return jvp(_f)(x, y, 1.0, 0.0)[1]
+        return jvp(first)(x, y, 1.0, 0.0)[1]
+
+    assert _run(second, 3.0, 4.0) == 2 * 4.0
+
+
+def test_fusion():
+    # Once the tangent rule is inlined, the exponential that it computes
+    # is shared with the primal.
+    def f(x):
+        return scalar_exp(x) * 2.0
+
+    def jf(x, dx):
+        return jvp(f)(x, dx)
+
+    res = jvp_pipeline.select('parse', 'resolve', 'infer', 'specialize',
+                              'erase_class', 'opt').run(
+        input=jf, argspec=(from_value(1.0, broaden=True),) * 2
+    )
+    nodes = dfs(res['graph'].return_, succ_deeper)
+    exps = [node for node in nodes if node.is_apply(P.scalar_exp)]
+    assert len(exps) == 1
+
+
+def test_jvp_graph_cached():
+    def f(x):
+        return x * x
+
+    g = jvp_pipeline.select('parse', 'resolve').run(input=f)['graph']
+    jg = jvp_graph(g)
+    assert jvp_graph(g) is jg
+    assert jg.transforms['primal'] is g
+    assert len(jg.parameters) == 2
+
+
+def test_jvp_closure():
+    def f(x, y):
+        def g(z):
+            return x * z
+        return jvp(g)(y, 1.0)
+
+    with pytest.raises(NotImplementedError):
+        _run(f, 2.0, 3.0)
@@ -1,7 +1,12 @@
+import os
+
 import pytest
 
+from myia import parser
+from myia.ir.serialize import dumps
 from myia.pipeline import scalar_parse as parse, scalar_pipeline
-from myia.parser import MyiaSyntaxError
+from myia.pipeline import cache as pipeline_cache
+from myia.parser import MyiaSyntaxError, Parser
 
 
 def test_undefined():
@@ -77,3 +82,89 @@ def test_forward_reference():
 
     def h():
         return 2 + 2
+
+
+def _cached(x, y):
+    def g(z):
+        return z * _global_f()
+
+    if x > y:
+        return g(x)
+    return y
+
+
+def _label(ns):
+    return ns.label
+
+
+def test_parse_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(parser, 'cache_dir', str(tmp_path))
+    monkeypatch.setattr(parser, '_parse_cache', {})
+    g = parser.parse(_cached)
+    assert len(os.listdir(tmp_path)) == 1
+
+    # The graph is loaded rather than parsed
+    del parser._parse_cache[_cached]
+
+    def fail(self):
+        raise AssertionError('parsed')
+
+    monkeypatch.setattr(Parser, 'parse', fail)
+    g2 = parser.parse(_cached)
+    assert g2 is not g
+    assert dumps(g2, _label) == dumps(g, _label)
+
+
+def test_parse_cache_invalid(tmp_path, monkeypatch):
+    monkeypatch.setattr(parser, 'cache_dir', str(tmp_path))
+    monkeypatch.setattr(parser, '_parse_cache', {})
+    g = parser.parse(_cached)
+    entry, = os.listdir(tmp_path)
+    path = os.path.join(tmp_path, entry)
+
+    # A corrupt entry is deleted and the function is parsed again
+    with open(path, 'wb') as f:
+        f.write(b'garbage')
+    del parser._parse_cache[_cached]
+    g2 = parser.parse(_cached)
+    assert dumps(g2, _label) == dumps(g, _label)
+    with open(path, 'rb') as f:
+        assert f.read() != b'garbage'
+
+    # Another version of Myia does not use the entry
+    monkeypatch.setattr(pipeline_cache, '_code_digest', 'other')
+    del parser._parse_cache[_cached]
+    parser.parse(_cached)
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_parse_cache_closure(tmp_path, monkeypatch):
+    monkeypatch.setattr(parser, 'cache_dir', str(tmp_path))
+    monkeypatch.setattr(parser, '_parse_cache', {})
+
+    def make(k):
+        def f(x):
+            return x * k
+        return f
+
+    def closure_value(g):
+        _, ns, name = g.output.inputs[2].inputs
+        return ns.value[name.value]
+
+    g1 = parser.parse(make(2))
+    g2 = parser.parse(make(3))
+    assert len(os.listdir(tmp_path)) == 1
+    # Each graph resolves k in its own closure
+    assert closure_value(g1) == 2
+    assert closure_value(g2) == 3
+
+
+def test_imprecise_locations(monkeypatch):
+    g = Parser(_cached).parse()
+    monkeypatch.setattr(parser, 'precise_locations', False)
+    g2 = Parser(_cached).parse()
+    loc = g.output.debug.location
+    loc2 = g2.output.debug.location
+    assert loc2.filename == loc.filename
+    assert (loc2.line, loc2.column) == (loc.line, loc.column)
+    assert isinstance(loc2.node, type(loc.node))
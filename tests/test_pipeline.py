@@ -1,6 +1,8 @@
 
 import pytest
-from myia.pipeline import PipelineStep, PipelineDefinition, pipeline_function
+from myia.abstract import from_value
+from myia.pipeline import PipelineStep, PipelineDefinition, StepCache, \
+    pipeline_function, standard_debug_pipeline
 from myia.utils import Merge, Reset
 
 
@@ -173,3 +175,161 @@ def test_Pipeline_select(op_pipeline):
 
     pip = pdef.select('square', 'mulp').make()
     assert pip(value=3) == {'value': 18}
+
+
+def test_Pipeline_shared_resources():
+    pip1 = standard_debug_pipeline.make()
+    pip2 = standard_debug_pipeline.make()
+
+    conv1 = pip1.resources.convert
+    conv2 = pip2.resources.convert
+    assert conv1.object_map is not conv2.object_map
+    assert conv1.object_map.keys() == conv2.object_map.keys()
+
+    def f(x):
+        return x + 1
+
+    argspec = (from_value(1, broaden=True),)
+    assert pip1(input=f, argspec=argspec)['output'](2) == 3
+    assert f in conv1.object_map
+    assert f not in conv2.object_map
+
+    eng1 = pip1.resources.inferrer.engine
+    eng2 = pip2.resources.inferrer.engine
+    for prim, inf2 in eng2.constructors.items():
+        inf1 = eng1.constructors[prim]
+        assert inf1 is not inf2
+        assert inf2.cache == {}
+        assert vars(inf1).keys() == vars(inf2).keys()
+    assert pip2(input=f, argspec=argspec)['output'](3) == 4
+
+
+def _cached_f(x, y):
+    def g(z):
+        return z * x + y
+    return g(x) * 2 + g(y)
+
+
+_cached_argspec = (from_value(1.0, broaden=True),
+                   from_value(2.0, broaden=True))
+
+
+def test_StepCache():
+    cache = StepCache()
+    pdef = standard_debug_pipeline.configure_resources(step_cache=cache)
+    ncached = len([step for step in pdef.make()._seq if step.cacheable])
+
+    fn = pdef.run(input=_cached_f, argspec=_cached_argspec)['output']
+    assert fn(3.0, 4.0) == 42.0
+    assert (cache.hits, cache.misses) == (0, ncached)
+
+    # Another variant of the pipeline reuses the steps it has in common
+    res = pdef.configure(wrap=False).run(input=_cached_f,
+                                         argspec=_cached_argspec)
+    assert (cache.hits, cache.misses) == (ncached, ncached)
+    assert res['output'](3.0, 4.0) == 42.0
+    assert 'inference_context' not in res
+
+    # Different arguments
+    argspec = (from_value(1, broaden=True),) * 2
+    fn = pdef.run(input=_cached_f, argspec=argspec)['output']
+    assert fn(3, 4) == 42
+    assert cache.misses > ncached
+
+
+def test_StepCache_rerun():
+    # specialize needs the inference context, which is not stored, so
+    # infer runs again
+    cache = StepCache()
+    pdef = standard_debug_pipeline.configure_resources(step_cache=cache)
+    pdef.select('parse', 'resolve', 'infer').run(input=_cached_f,
+                                                 argspec=_cached_argspec)
+    assert cache.hits == 0
+    fn = pdef.run(input=_cached_f, argspec=_cached_argspec)['output']
+    # resolve is not cached, since it depends on the values of globals
+    assert cache.hits == 1
+    assert fn(3.0, 4.0) == 42.0
+
+
+def test_StepCache_directory(tmp_path):
+    cache = StepCache(directory=tmp_path)
+    pdef = standard_debug_pipeline.configure_resources(step_cache=cache)
+    pdef.run(input=_cached_f, argspec=_cached_argspec)
+    assert cache.misses > 0 and cache.hits == 0
+
+    cache = StepCache(directory=tmp_path)
+    pdef = standard_debug_pipeline.configure_resources(step_cache=cache)
+    fn = pdef.run(input=_cached_f, argspec=_cached_argspec)['output']
+    assert cache.misses == 0 and cache.hits > 0
+    assert fn(3.0, 4.0) == 42.0
+
+
+@pipeline_function(cacheable=True)
+def count_step(self, value):
+    self.resources.counts.append(value)
+    return value + 1
+
+
+def test_StepCache_steps():
+    cache = StepCache()
+    counts = []
+    pdef = PipelineDefinition(
+        resources=dict(counts=counts, step_cache=cache),
+        steps=dict(
+            addp=OpStep.partial(op=lambda p, x: p + x, param=1),
+            count=count_step,
+            neg=OpStep.partial(op=lambda p, x: -x),
+        )
+    )
+    assert pdef.run(value=3) == {'value': -5}
+    assert pdef.run(value=3) == {'value': -5}
+    assert pdef.run(value=4) == {'value': -6}
+    assert counts == [4, 5]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # Lambdas are only identified by their id
+    assert not cache.token(pdef.steps['addp'])[1]
+    assert cache.token(pdef.steps['count'])[1]
+
+    cache.clear()
+    assert pdef.run(value=3) == {'value': -5}
+    assert counts == [4, 5, 4]
+
+
+_scale = 2.0
+
+
+def _cached_h(x):
+    return x * _scale
+
+
+def _cached_h100(x):
+    return x * 100.0
+
+
+def _cached_calls_h(x):
+    return _cached_h(x)
+
+
+def test_StepCache_globals(monkeypatch):
+    cache = StepCache()
+    pdef = standard_debug_pipeline.configure_resources(step_cache=cache)
+    argspec = (from_value(1.0, broaden=True),)
+
+    def run():
+        return pdef.run(input=_cached_calls_h, argspec=argspec)['output'](1.0)
+
+    assert run() == 2.0
+    assert run() == 2.0
+    assert cache.hits > 0
+
+    # A new definition of the function that is called, with the same name
+    monkeypatch.setattr(_cached_h100, '__qualname__', '_cached_h')
+    monkeypatch.setitem(globals(), '_cached_h', _cached_h100)
+    assert run() == 100.0
+    monkeypatch.undo()
+    assert run() == 2.0
+
+    # A global used by the function that is called
+    monkeypatch.setitem(globals(), '_scale', 3.0)
+    assert run() == 3.0
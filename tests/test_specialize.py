@@ -2,14 +2,15 @@
 import numpy
 from pytest import mark
 
-from myia.abstract import from_value
+from myia.abstract import from_value, AbstractTuple, InferenceMemo
 from myia.pipeline import scalar_debug_pipeline, standard_debug_pipeline
 from myia.composite import list_map
 from myia.debug.label import short_labeler as lbl
 from myia.debug.traceback import print_inference_error
+from myia.ir import Constant
 from myia.abstract import InferenceError
 from myia.prim.py_implementations import \
-    hastype, partial, scalar_add, scalar_sub, \
+    hastype, partial, scalar_add, scalar_sub, scalar_mul, \
     scalar_usub, scalar_uadd, switch, array_map
 from myia.validate import ValidationError
 from myia.utils import overload
@@ -382,3 +383,171 @@ def test_partial_outside_scope(x, y):
         return partial(f, z)
 
     return g(x)(y)
+
+
+def test_renormalize_unchanged():
+
+    def helper(x):
+        return x * x
+
+    def f(x):
+        return helper(x) + 1
+
+    pip = scalar_debug_pipeline \
+        .select('parse', 'infer', 'specialize') \
+        .make()
+    argspec = (from_value(1, broaden=True),)
+    g = pip(input=f, argspec=argspec)['graph']
+    inferrer = pip.resources.inferrer
+    mng = pip.resources.manager
+
+    assert inferrer.renormalize(g, argspec) is g
+    assert inferrer.renormalize(g, (from_value(2),)) is not g
+
+    g = inferrer.renormalize(g, argspec)
+    assert inferrer.renormalize(g, argspec) is g
+
+    # Change a graph that is called by g, without changing its type
+    callee, = [node.value for node in mng.all_nodes
+               if node.is_constant_graph() and node.value is not g]
+    mul = callee.output
+    add = g.output
+    mng.set_edge(mul, 2, Constant(2))
+    assert inferrer.renormalize(g, argspec) is g
+    assert mul.inputs[2].abstract == from_value(2)
+    assert add.abstract is g.output.abstract
+
+
+def test_renormalize_changed():
+
+    def helper(x):
+        return x * x
+
+    def f(x):
+        return helper(x), x
+
+    pip = scalar_debug_pipeline \
+        .select('parse', 'infer', 'specialize') \
+        .make()
+    argspec = (from_value(1, broaden=True),)
+    g = pip(input=f, argspec=argspec)['graph']
+    inferrer = pip.resources.inferrer
+    mng = pip.resources.manager
+
+    # The type of the callee changes, so g must be inferred again
+    callee, = [node.value for node in mng.all_nodes
+               if node.is_constant_graph() and node.value is not g]
+    mng.set_edge(callee.return_, 1, Constant(2.5))
+    g2 = inferrer.renormalize(g, argspec)
+    assert g2 is not g
+    assert g2.output.abstract == AbstractTuple([from_value(2.5),
+                                                argspec[0]])
+
+
+def test_inference_memo():
+
+    def helper(x, y):
+        return scalar_add(scalar_mul(x, y), x)
+
+    def f(x, y):
+        return helper(x, y) + helper(y, x)
+
+    # The memo is opt-in
+    assert scalar_debug_pipeline.make().resources.inferrer.memo is None
+
+    memo = InferenceMemo()
+    pipeline = scalar_debug_pipeline \
+        .select('parse', 'resolve', 'infer', 'specialize',
+                'erase_class', 'erase_tuple', 'validate', 'export') \
+        .configure({'inferrer.memo': memo})
+    iargs = (2, 3)
+    fargs = (2.0, 3.0)
+
+    def run(args, broaden=True):
+        argspec = tuple(from_value(arg, broaden=broaden) for arg in args)
+        return pipeline.run(input=f, argspec=argspec)['output'](*args)
+
+    assert run(iargs) == f(*iargs)
+    assert (memo.hits, memo.misses, len(memo.entries)) == (0, 2, 2)
+
+    # f is found in the memo, and so is helper, which f calls
+    assert run(iargs) == f(*iargs)
+    assert (memo.hits, memo.misses) == (2, 2)
+
+    # Different argument types do not match
+    assert run(fargs) == f(*fargs)
+    assert (memo.hits, memo.misses, len(memo.entries)) == (2, 4, 4)
+
+    # The least recently used entries are dropped
+    memo.maxsize = 1
+    assert run(iargs, broaden=False) == f(*iargs)
+    assert (memo.hits, memo.misses, len(memo.entries)) == (2, 7, 1)
+
+
+def test_inference_memo_recursion():
+
+    def fact(n):
+        if n <= 1:
+            return 1
+        else:
+            return n * fact(n - 1)
+
+    def f(x, n):
+        def scale(z):
+            return z * x
+        return scale(fact(n)) + x
+
+    memo = InferenceMemo()
+    pipeline = standard_debug_pipeline.configure({'inferrer.memo': memo})
+
+    def run(*args):
+        argspec = tuple(from_value(arg, broaden=True) for arg in args)
+        return pipeline.run(input=f, argspec=argspec)['output'](*args)
+
+    assert run(2, 5) == f(2, 5)
+    assert memo.hits == 0
+    assert run(3, 4) == f(3, 4)
+    assert memo.hits == 3
+    assert run(2.0, 3.0) == f(2.0, 3.0)
+
+
+def test_inference_memo_check_args():
+
+    def helper(x):
+        return x
+
+    def f(x, y):
+        return scalar_add(helper(x), y)
+
+    memo = InferenceMemo()
+    pipeline = scalar_debug_pipeline \
+        .select('parse', 'resolve', 'infer') \
+        .configure({'inferrer.memo': memo})
+    argspec = (from_value(1, broaden=True),) * 2
+    assert pipeline.run(input=f, argspec=argspec)['outspec'] == argspec[0]
+
+    # The stored results are only used if the arguments are the same
+    fspec = from_value(1.0, broaden=True)
+    for key, entry in memo.entries.items():
+        memo.entries[key] = tuple(
+            None if saved is None else (fspec, (fspec,) * len(saved[1]))
+            for saved in entry
+        )
+    assert pipeline.run(input=f, argspec=argspec)['outspec'] == argspec[0]
+    assert memo.hits == 2
+
+
+def test_inference_memo_array_map():
+
+    def f(x, y):
+        return array_map(scalar_add, x, y)
+
+    memo = InferenceMemo()
+    pipeline = standard_debug_pipeline.configure({'inferrer.memo': memo})
+    x = numpy.ones((2, 3))
+    argspec = (from_value(x, broaden=True),) * 2
+
+    # The call to scalar_add that array_map makes must be inferred
+    for _ in range(2):
+        res = pipeline.run(input=f, argspec=argspec)['output'](x, x)
+        assert (res == x + x).all()
@@ -0,0 +1,211 @@
+
+from dataclasses import dataclass
+
+import numpy as np
+import pytest
+
+from myia.abstract import from_value, InferenceError
+from myia.composite import vmap
+from myia.ir import Constant, Graph
+from myia.pipeline import standard_debug_pipeline
+from myia.prim.py_implementations import array_map, array_reduce, \
+    scalar_add, scalar_exp, reshape, shape, transpose
+
+
+B = 4
+
+
+def _rand(*shp):
+    return np.random.randn(*shp)
+
+
+def _vmap_compile(fn, args, in_axes=None):
+    g = Graph()
+    params = [g.add_parameter() for _ in args]
+    vfn = g.apply(vmap, Constant(fn)) if in_axes is None \
+        else g.apply(vmap, Constant(fn), in_axes)
+    g.output = g.apply(vfn, *params)
+    argspec = tuple(from_value(arg, broaden=True) for arg in args)
+    return standard_debug_pipeline.run(input=g, argspec=argspec)['output']
+
+
+def _stack(results):
+    if isinstance(results[0], tuple):
+        return tuple(_stack([res[i] for res in results])
+                     for i in range(len(results[0])))
+    return np.stack(results)
+
+
+def _check(a, b):
+    if isinstance(a, tuple):
+        assert isinstance(b, tuple) and len(a) == len(b)
+        for x, y in zip(a, b):
+            _check(x, y)
+    else:
+        assert a.shape == b.shape
+        assert np.allclose(a, b)
+
+
+def vmap_test(*cases, in_axes=None):
+    """Compare the batched function to the function applied to examples."""
+    def decorate(fn):
+        def test(args):
+            axes = in_axes or (0,) * len(args)
+            vfn = _vmap_compile(fn, args, in_axes)
+            expected = _stack([
+                fn(*[arg[i] if axis == 0 else arg
+                     for arg, axis in zip(args, axes)])
+                for i in range(B)
+            ])
+            _check(vfn(*args), expected)
+
+        m = pytest.mark.parametrize('args', list(cases))(test)
+        m.__orig__ = fn
+        return m
+    return decorate
+
+
+@vmap_test((_rand(B, 2, 3), _rand(3, 4), _rand(4)),
+           in_axes=(0, None, None))
+def test_mlp(x, W, b):
+    return x @ W + b
+
+
+@vmap_test((_rand(B, 2, 3), _rand(B, 3, 4)))
+def test_matmul(x, y):
+    return x @ y
+
+
+@vmap_test((_rand(2, 3), _rand(B, 3, 4)), in_axes=(None, 0))
+def test_matmul_unbatched_left(x, y):
+    return x @ y
+
+
+@vmap_test((_rand(B), _rand(B)))
+def test_scalars(x, y):
+    return x * y + 1.0 - x
+
+
+@vmap_test((_rand(B, 3), 3), in_axes=(0, None))
+def test_loop(x, n):
+    i = 0
+    while i < n:
+        x = x * 2.0
+        i = i + 1
+    return x
+
+
+@vmap_test((_rand(B), _rand(B)))
+def test_closure(x, y):
+    def g(z):
+        return z * x + y
+    return g(x) + g(y)
+
+
+@vmap_test((_rand(B), _rand(B)))
+def test_hof(x, y):
+    def app(f, z):
+        return f(z)
+
+    def sq(z):
+        return z * z
+
+    return app(sq, x) + y
+
+
+@vmap_test((_rand(B), _rand(B)))
+def test_tuple(x, y):
+    t = (x + y, x * y)
+    return t[0] - t[1], 3.0
+
+
+@vmap_test((_rand(B, 2, 3),))
+def test_array_ops(x):
+    return (array_reduce(scalar_add, x, (1, 1)),
+            transpose(x, (1, 0)),
+            reshape(x, (6,)),
+            x * 2.0)
+
+
+@vmap_test((_rand(B, 2, 3),))
+def test_shape(x):
+    return shape(x), x * 2.0
+
+
+@vmap_test((_rand(B, 2, 3),))
+def test_constant_output(x):
+    return 2.0
+
+
+@vmap_test((_rand(B, 2),))
+def test_array_map(x):
+    return array_map(lambda a: scalar_exp(a) * 2.0, x)
+
+
+@vmap_test(((((_rand(3, 4), _rand(4)), (_rand(4, 2), _rand(2)))),
+            _rand(B, 1, 3)),
+           in_axes=(None, 0))
+def test_model(model, x):
+    for layer in model:
+        x = x @ layer[0] + layer[1]
+    return array_reduce(scalar_add, x, (1, 1))
+
+
+@dataclass(frozen=True)
+class Point:
+    x: float
+    y: float
+
+    def norm2(self):
+        return self.x * self.x + self.y * self.y
+
+
+def test_dataclass():
+    def f(p, a):
+        return p.norm2() * a, p.y
+
+    p = Point(1.0, 2.0)
+    a = _rand(B)
+    vf = _vmap_compile(f, (p, a), (None, 0))
+    res = vf(p, a)
+    _check(res, (a * 5.0, np.full(B, 2.0)))
+
+    ps = Point(_rand(B), _rand(B))
+    vf = _vmap_compile(f, (ps, a))
+    res = vf(ps, a)
+    _check(res, ((ps.x * ps.x + ps.y * ps.y) * a, ps.y))
+
+
+def test_batched_condition():
+    def f(x):
+        return x if x > 0 else -x
+
+    with pytest.raises(NotImplementedError):
+        _vmap_compile(f, (_rand(B),))
+
+
+def test_unbatched_condition():
+    def f(x, c):
+        return x if c > 0 else -x
+
+    x = _rand(B)
+    vf = _vmap_compile(f, (x, 1.0), (0, None))
+    _check(vf(x, 1.0), x)
+    _check(vf(x, -1.0), -x)
+
+
+def test_vmap_errors():
+    def f(x, y):
+        return x + y
+
+    with pytest.raises(InferenceError):
+        # Inconsistent batch sizes
+        _vmap_compile(f, (_rand(B), _rand(B + 1)))
+
+    with pytest.raises(InferenceError):
+        # Nothing to batch
+        _vmap_compile(f, (_rand(B), _rand(B)), (None, None))
+
+    with pytest.raises(InferenceError):
+        # Not enough axes
+        _vmap_compile(f, (_rand(B), _rand(B)), (0,))
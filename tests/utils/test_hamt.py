@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from myia.utils import HAMT
+
+
+class Collide:
+    """Key with a constant hash."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return 1234
+
+    def __eq__(self, other):
+        return isinstance(other, Collide) and self.name == other.name
+
+    def __repr__(self):
+        return f'Collide({self.name})'
+
+
+def _check(h, d):
+    assert len(h) == len(d)
+    assert dict(h.items()) == d
+    assert set(h) == set(d)
+    for k, v in d.items():
+        assert k in h
+        assert h[k] == v
+        assert h.get(k) == v
+
+
+def test_hamt_set():
+    h = HAMT()
+    d = {}
+    rng = random.Random(1234)
+    versions = []
+    for i in range(2000):
+        k = rng.randrange(1000)
+        h = h.set(k, i)
+        d[k] = i
+        if i % 100 == 0:
+            versions.append((h, dict(d)))
+    _check(h, d)
+    # Older versions are not modified
+    for h2, d2 in versions:
+        _check(h2, d2)
+
+    assert h.get(-1) is None
+    assert h.get(-1, 'x') == 'x'
+    assert -1 not in h
+    with pytest.raises(KeyError):
+        h[-1]
+
+
+def test_hamt_init():
+    h = HAMT({'a': 1, 'b': 2})
+    _check(h, {'a': 1, 'b': 2})
+    assert repr(HAMT({'a': 1})) == "HAMT({'a': 1})"
+    assert len(HAMT()) == 0
+
+
+def test_hamt_collisions():
+    keys = [Collide(i) for i in range(10)]
+    h = HAMT()
+    for i, k in enumerate(keys):
+        h = h.set(k, i)
+    h = h.set(keys[3], 33)
+    _check(h, {**{k: i for i, k in enumerate(keys)}, keys[3]: 33})
+    assert Collide(100) not in h
+
+    h2 = HAMT({keys[3]: 1, Collide(100): 2})
+    m = h.merge(h2, lambda x, y: x + y)
+    _check(m, {**{k: i for i, k in enumerate(keys)},
+               keys[3]: 34, Collide(100): 2})
+
+
+def test_hamt_merge():
+    rng = random.Random(5678)
+
+    def add(x, y):
+        return x + y
+
+    for n1, n2 in [(0, 10), (10, 0), (1, 1), (100, 50), (1000, 1000)]:
+        d1 = {rng.randrange(2 * n1 + 1): rng.random() for _ in range(n1)}
+        d2 = {rng.randrange(2 * n1 + 1): rng.random() for _ in range(n2)}
+        h1 = HAMT(d1)
+        h2 = HAMT(d2)
+        expected = dict(d1)
+        for k, v in d2.items():
+            expected[k] = expected[k] + v if k in expected else v
+        _check(h1.merge(h2, add), expected)
+        _check(h1, d1)
+        _check(h2, d2)
+
+    # Merging versions that share structure
+    base = HAMT({i: 1 for i in range(500)})
+    h1 = base.set(1000, 1)
+    h2 = base.set(2000, 2).set(3, 10)
+    m = h1.merge(h2, add)
+    _check(m, {**{i: 2 for i in range(500)}, 3: 11, 1000: 1, 2000: 2})
+    assert h1.merge(HAMT(), add) is h1
+    assert HAMT().merge(h1, add) is h1
@@ -2,7 +2,7 @@ import pytest
 import numpy as np
 
 from myia.utils import Named, TypeMap, smap, Event, Events, NS, Overload, \
-    SymbolicKeyInstance, newenv
+    SymbolicKeyInstance, newenv, LazyRegistry
 
 
 def test_named():
@@ -15,6 +15,28 @@ def _sum(self, arg: object, *args):
     return arg + sum(args)
 
 
+def test_LazyRegistry():
+    built = []
+
+    def build():
+        built.append(1)
+        return 'lazy'
+
+    reg = LazyRegistry()
+    reg.register('eager')('value')
+    reg.register_lazy('lazy')(build)
+    assert 'lazy' in reg
+    assert 'missing' not in reg
+    assert not built
+    assert reg['lazy'] == 'lazy'
+    assert reg.get('lazy') == 'lazy'
+    assert reg['eager'] == 'value'
+    assert reg.get('missing', 0) == 0
+    assert len(built) == 1
+    with pytest.raises(KeyError):
+        reg['missing']
+
+
 def test_typemap():
     tmap = TypeMap()
     tmap.register(int)('int')
@@ -264,3 +286,9 @@ def test_env():
     assert len(e) == 2
     assert e.get(sk1, 0) == 200
     assert e.get(sk2, 0) == 300
+
+    e2 = newenv.set(sk2, 1).add(e)
+    assert len(e2) == 2
+    assert e2.get(sk1, 0) == 200
+    assert e2.get(sk2, 0) == 301
+    assert e.add(newenv).get(sk2, 0) == 300
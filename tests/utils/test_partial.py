@@ -1,7 +1,7 @@
 
 import pytest
 
-from myia.utils import merge, Partial, Reset, Override
+from myia.utils import argspec, merge, Partial, Reset, Override
 
 
 def test_Partial():
@@ -71,3 +71,16 @@ def test_Partial_class():
 
     with pytest.raises(TypeError):
         Partial(C, z=10)
+
+
+def test_argspec():
+
+    class C:
+        def f(self, x, y=1):
+            return x + y
+
+    spec = argspec(C.f)
+    assert spec.args == ['self', 'x', 'y']
+    assert argspec(C().f) is spec
+    assert argspec(C().f) is spec
+    assert argspec(len) == argspec(len)
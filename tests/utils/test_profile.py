@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+
+from myia.utils import Profile, aggregate_profiles
+
+
+def _profile(memory=False):
+    prof = Profile(memory=memory)
+    with prof:
+        with prof.step('a'):
+            for i in range(2):
+                with prof.lap(i):
+                    with prof.step('b'):
+                        data = [0] * 100000
+        with prof.step('c'):
+            pass
+        with prof.step('c'):
+            pass
+    return prof, data
+
+
+def test_Profile_repeated_steps():
+    prof, _ = _profile()
+    assert list(prof.d) == ['a', 'c', 'c#2', '__total__']
+    assert list(prof.d['a']) == ['Cycle 0', 'Cycle 1', '__total__']
+    assert [row['path'] for row in prof.rows()] == [
+        'a', 'a/Cycle 0', 'a/Cycle 0/b', 'a/Cycle 1', 'a/Cycle 1/b',
+        'c', 'c#2'
+    ]
+    assert [row['name'] for row in prof.rows()][-2:] == ['c', 'c']
+
+
+def test_Profile_rows():
+    prof, _ = _profile()
+    rows = prof.rows()
+    assert [row['depth'] for row in rows] == [0, 1, 2, 1, 2, 0, 0]
+    assert all(row['memory'] is None for row in rows)
+    starts = [row['start'] for row in rows]
+    assert starts == sorted(starts)
+    assert rows[0]['duration'] == prof.d['a']['__total__']
+    assert rows[-1]['duration'] == prof.d['c#2']
+
+
+def test_Profile_memory():
+    prof, data = _profile(memory=True)
+    rows = {row['path']: row for row in prof.rows()}
+    # The list takes about 800kB, and the empty step next to nothing
+    assert rows['a/Cycle 0/b']['memory'] > 400000
+    assert rows['a/Cycle 0/b']['memory'] > rows['c']['memory']
+    assert rows['a']['memory'] >= rows['a/Cycle 1/b']['memory']
+
+
+def test_Profile_chrome_trace():
+    prof, _ = _profile(memory=True)
+    f = io.StringIO()
+    prof.write_chrome_trace(f)
+    trace = json.loads(f.getvalue())
+    events = trace['traceEvents']
+    assert [e['name'] for e in events] == ['a', 'Cycle 0', 'b', 'Cycle 1',
+                                           'b', 'c', 'c']
+    for e, row in zip(events, prof.rows()):
+        assert e['ph'] == 'X'
+        assert e['ts'] == row['start'] * 1e6
+        assert e['dur'] == row['duration'] * 1e6
+        assert e['args']['memory'] == row['memory']
+
+
+def test_Profile_csv():
+    prof, _ = _profile()
+    f = io.StringIO()
+    prof.write_csv(f)
+    rows = list(csv.DictReader(io.StringIO(f.getvalue())))
+    assert [row['path'] for row in rows] == \
+        [row['path'] for row in prof.rows()]
+    assert float(rows[2]['duration']) == prof.rows()[2]['duration']
+
+
+def test_aggregate_profiles():
+    profs = [_profile()[0] for _ in range(10)]
+    agg = aggregate_profiles(profs)
+    assert set(agg) == {row['path'] for row in profs[0].rows()}
+    durations = sorted(prof.d['c'] for prof in profs)
+    stats = agg['c']
+    assert stats['count'] == 10
+    assert stats['min'] == durations[0]
+    assert stats['max'] == durations[-1]
+    assert stats['p50'] == durations[4]
+    assert stats['p99'] == durations[-1]
+    assert abs(stats['mean'] - sum(durations) / 10) < 1e-12
+    assert 'memory' not in stats
+
+    agg = aggregate_profiles([_profile(memory=True)[0]])
+    assert agg['a/Cycle 0/b']['memory'] > 400000